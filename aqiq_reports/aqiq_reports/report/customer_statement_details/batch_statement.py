@@ -0,0 +1,210 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import io
+
+import frappe
+from frappe import _
+
+from erpnext.accounts.report.utils import convert_to_presentation_currency, get_currency
+
+from aqiq_reports.aqiq_reports.report.customer_statement_details import (
+    customer_statement_details as statement,
+)
+from aqiq_reports.aqiq_reports.report.customer_statement_details.statement_stream import write_csv
+from aqiq_reports.aqiq_reports.utils.ageing import get_party_ageing, get_party_groups
+from aqiq_reports.aqiq_reports.utils.bill_no import get_bill_no_map
+from aqiq_reports.aqiq_reports.utils.statement_chart import get_statement_charts
+from aqiq_reports.aqiq_reports.utils.statement_context import get_statement_context
+from aqiq_reports.aqiq_reports.utils.voucher_details import get_voucher_details
+
+
+@frappe.whitelist()
+def enqueue_statement_batch(
+    company,
+    from_date,
+    to_date,
+    party_type="Customer",
+    party_group=None,
+    territory=None,
+    parties=None,
+    ageing_ranges=None,
+):
+    """Queue `execute_batch` on the long queue and return the job id. Each
+    statement is handed to the `statement_batch_handlers` hooks; the app's
+    own, save_statement_file, attaches it to the party as a CSV file."""
+    frappe.has_permission("GL Entry", "read", throw=True)
+    if not frappe.get_hooks("statement_batch_handlers"):
+        frappe.throw(_("No statement_batch_handlers hook is installed to deliver the statements"))
+
+    job = frappe.enqueue(
+        execute_batch,
+        queue="long",
+        timeout=3600,
+        company=company,
+        from_date=from_date,
+        to_date=to_date,
+        party_type=party_type,
+        party_group=party_group,
+        territory=territory,
+        parties=parties,
+        ageing_ranges=ageing_ranges,
+        deliver=True,
+    )
+    return job.id
+
+
+def execute_batch(
+    company,
+    from_date,
+    to_date,
+    party_type="Customer",
+    party_group=None,
+    territory=None,
+    parties=None,
+    ageing_ranges=None,
+    deliver=False,
+):
+    """Month-end statements for many parties in one pass.
+
+    The GL Entry table is scanned once for all parties and partitioned by
+    party. Company level context (columns, header, translations) and the
+    per-party lookups (ageing, chart, returns, PDCs, addresses) are loaded
+    once for the whole batch. Returns {party: statement}, or with `deliver`
+    hands each statement to the functions of the `statement_batch_handlers`
+    hook instead.
+    """
+    filters = frappe._dict(
+        company=company,
+        from_date=from_date,
+        to_date=to_date,
+        party_type=party_type,
+        group_by="Group by Voucher (Consolidated)",
+        ageing_ranges=ageing_ranges,
+    )
+    statement.validate_filters(filters, {})
+
+    filters.party = get_batch_parties(party_type, party_group, territory, parties)
+    if not filters.party:
+        return {}
+
+    statement.update_translations()
+    headers = statement.get_header(filters)
+
+    gl_entries = statement.get_gl_entries(filters, [])
+    entries_by_party = {}
+    for gle in gl_entries:
+        entries_by_party.setdefault(gle.party, []).append(gle)
+
+    ranges = statement.get_ageing_ranges(filters)
+    ageing = get_party_ageing(
+        company,
+        party_type,
+        filters.party,
+        report_date=to_date,
+        ageing_based_on="Posting Date",
+        ranges=ranges,
+    )
+    charts = get_statement_charts(filters, filters.party)
+    context = get_statement_context(filters, filters.party)
+    inv_details = get_bill_no_map(gl_entries)
+    voucher_details = get_voucher_details(gl_entries)
+
+    handlers = []
+    if deliver:
+        handlers = [frappe.get_attr(d) for d in frappe.get_hooks("statement_batch_handlers")]
+
+    statements = {}
+    for party in filters.party:
+        rows = entries_by_party.get(party, [])
+        party_filters = statement.set_account_currency(frappe._dict(filters, party=[party]))
+        if party_filters.get("presentation_currency"):
+            # as on screen: amounts in the party's account currency, with the
+            # balance worked out from the converted amounts
+            for row in rows:
+                row.pop("running_balance", None)
+            rows = convert_to_presentation_currency(rows, get_currency(party_filters), company)
+
+        columns = statement.get_columns(party_filters)
+
+        ageing_data = statement.get_ageing_data(ranges=ranges)
+        statement.set_ageing_data(
+            party_filters, ageing_data, {party: ageing[party]} if party in ageing else {}
+        )
+
+        data = statement.get_data_with_opening_closing(
+            party_filters, {}, [], rows, ageing_data
+        )
+        data = statement.get_result_as_list(data, party_filters, inv_details, voucher_details)
+
+        party_detail = context.party_details.get(party)
+        personal_details = {}
+        if party_detail:
+            personal_details = statement.format_party_personal_details(
+                party_detail, data[-1]["balance"]
+            )
+
+        statement.set_statement_details(
+            data,
+            ageing_data,
+            party_detail.total_return if party_detail else 0.0,
+            headers,
+            personal_details,
+            context.cheques.get(party) or [],
+        )
+
+        result = frappe._dict(
+            party_type=party_type, party=party, columns=columns, data=data, chart=charts[party]
+        )
+        if deliver:
+            for handler in handlers:
+                handler(result)
+        else:
+            statements[party] = result
+
+    if deliver:
+        frappe.publish_realtime(
+            "statement_batch_ready",
+            {"party_type": party_type, "parties": len(filters.party)},
+            user=frappe.session.user,
+        )
+
+    return statements
+
+
+def save_statement_file(result):
+    """statement_batch_handlers hook: attach the statement to its party as a
+    private CSV file."""
+    content = io.StringIO()
+    write_csv(result.columns, result.data, content)
+
+    frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": "statement-{0}.csv".format(frappe.generate_hash(length=10)),
+            "content": content.getvalue(),
+            "is_private": 1,
+            "attached_to_doctype": result.party_type,
+            "attached_to_name": result.party,
+        }
+    ).insert(ignore_permissions=True)
+
+
+def get_batch_parties(party_type, party_group=None, territory=None, parties=None):
+    if party_type not in ("Customer", "Supplier"):
+        frappe.throw(_("Batch statements are only available for Customers and Suppliers"))
+
+    filters = {"disabled": 0}
+    if parties:
+        filters["name"] = ["in", frappe.parse_json(parties)]
+
+    if party_group:
+        group_field = "customer_group" if party_type == "Customer" else "supplier_group"
+        filters[group_field] = ["in", get_party_groups(party_type, party_group)]
+
+    if territory:
+        if party_type != "Customer":
+            frappe.throw(_("Territory can only be used with Customer statements"))
+        filters["territory"] = ["in", [territory] + frappe.db.get_descendants("Territory", territory)]
+
+    return frappe.get_all(party_type, filters=filters, pluck="name", order_by="name")
@@ -226,7 +226,76 @@ frappe.query_reports["Customer Statement Details"] = {
             "hidden": 0,
 
         },
+        {
+            "fieldname": "chart_based_on",
+            "label": __("Chart Based On"),
+            "fieldtype": "Select",
+            "options": ["Calendar Year", "Fiscal Year"],
+            "default": "Calendar Year"
+        },
+        {
+            "fieldname": "ageing_ranges",
+            "label": __("Ageing Ranges"),
+            "fieldtype": "Data",
+            "default": "30, 60, 90, 120",
+            "description": __("Upper bound in days of each ageing bucket, separated by commas")
+        },
+        {
+            "fieldname": "debug_performance",
+            "label": __("Show Performance Details"),
+            "fieldtype": "Check",
+            "hidden": !frappe.user.has_role("System Manager")
+        },
     ],
+    onload: function(report) {
+        report.page.add_inner_button(__("Refresh Changes"), () => this.refresh_changes(report));
+    },
+
+    refresh_changes: function(report) {
+        // apply only the ledger changes since the statement was loaded, see statement_refresh.py
+        let data = report.data || [];
+        let closing = data[data.length - 1];
+        if (!closing || !closing.refresh_token) {
+            report.refresh();
+            return;
+        }
+
+        frappe.call({
+            method: "aqiq_reports.aqiq_reports.report.customer_statement_details.statement_refresh.get_statement_refresh",
+            args: {
+                filters: report.get_filter_values(),
+                token: closing.refresh_token,
+            },
+            callback: (r) => {
+                let changes = r.message;
+                if (!changes || changes.full) {
+                    report.refresh();
+                    return;
+                }
+
+                let cancelled = new Set(changes.cancelled || []);
+                let rows = data.slice(1, -2).filter((d) => !cancelled.has(d.gl_entry));
+
+                (changes.rows || []).forEach((row) => {
+                    let index = rows.length;
+                    while (index > 0 && rows[index - 1].posting_date > row.posting_date) {
+                        index--;
+                    }
+                    rows.splice(index, 0, row);
+                });
+
+                let sign = { Customer: 1, Supplier: -1 }[report.get_filter_value("party_type")] || 0;
+                let balance = flt(data[0].balance);
+                rows.forEach((d) => {
+                    balance += sign * (flt(d.debit) - flt(d.credit));
+                    d.balance = balance;
+                });
+
+                report.data = [data[0]].concat(rows, [changes.total, changes.closing]);
+                report.render_datatable();
+            },
+        });
+    },
     // onload: function(report) {
     //     report.page.add_inner_button(__("Send via Email"), function() {
     //         var filters = report.get_values();
@@ -17,7 +17,6 @@ from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (
 )
 from erpnext.accounts.report.financial_statements import get_cost_centers_with_children
 from erpnext.accounts.report.utils import convert_to_presentation_currency, get_currency
-from erpnext.accounts.utils import get_account_currency
 from frappe.utils import (
     add_days,
     getdate,
@@ -33,52 +32,194 @@ from frappe.utils import (
     now,
 )
 
+from aqiq_reports.aqiq_reports.utils import account_tree
+from aqiq_reports.aqiq_reports.utils.account_tree import (
+    get_account_currency,
+    get_account_tree,
+    get_account_type_map,
+)
+from aqiq_reports.aqiq_reports.utils.ageing import (
+    get_ageing_totals,
+    get_party_ageing,
+    get_range_labels,
+    parse_ageing_ranges,
+)
+from aqiq_reports.aqiq_reports.utils.balance_checkpoint import get_opening_balances
+from aqiq_reports.aqiq_reports.utils.bill_no import get_bill_no_map
+from aqiq_reports.aqiq_reports.utils.ledger_row import (
+    GroupTotals,
+    as_report_rows,
+    get_ledger_rows,
+)
+from aqiq_reports.aqiq_reports.utils.refresh_token import (
+    get_filters_hash,
+    get_party_watermark,
+    make_refresh_token,
+)
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_report, profile_stage
+from aqiq_reports.aqiq_reports.utils.result_cache import get_cached_report_result
+from aqiq_reports.aqiq_reports.utils.statement_chart import (
+    get_statement_chart,
+    get_statement_charts,
+    merge_charts,
+)
+from aqiq_reports.aqiq_reports.utils.statement_context import get_statement_context
+from aqiq_reports.aqiq_reports.utils.statement_header import get_statement_header
+from aqiq_reports.aqiq_reports.utils.voucher_details import get_voucher_details
+
 # to cache translations
 TRANSLATIONS = frappe._dict()
 
 
+@profile_report
 def execute(filters=None):
     if not filters:
         return [], []
-    ageing_data = {"30": 0.0, "60": 0.0, "90": 0.0, "120": 0.0, "above": 0.0}
-    account_details = {}
-
-    if (
-        filters
-        and filters.get("print_in_account_currency")
-        and not filters.get("account")
-    ):
-        frappe.throw(_("Select an account to print in account currency"))
 
-    for acc in frappe.db.sql("""select name, is_group from tabAccount""", as_dict=1):
-        account_details.setdefault(acc.name, acc)
+    return get_cached_report_result(__name__, filters, get_statement)
 
-    if filters.get("party"):
-        filters.party = frappe.parse_json(filters.get("party"))
-
-    validate_filters(filters, account_details)
 
-    validate_party(filters)
+def get_statement(filters):
+    ageing_data = get_ageing_data(ranges=get_ageing_ranges(filters))
+    filters_hash = get_filters_hash(filters)
 
-    filters = set_account_currency(filters)
+    filters, account_details = prepare_filters(filters)
 
     columns = get_columns(filters)
 
-    update_translations()
+    party_sections = OrderedDict()
+    data = get_result(filters, account_details, ageing_data, party_sections)
 
-    data = get_result(filters, account_details, ageing_data)
-    summary = []
+    parties = list(filters.get("party") or [])
+    context = get_statement_context(filters, parties)
 
-    summary_sales_return = get_supplier_customer_sales_return(filters)
+    headers = get_header(filters)
 
-    data[-1]["sales_to_return"] = summary_sales_return
-    data[-1]["ageing_data"] = ageing_data
+    if party_sections:
+        party_charts = get_statement_charts(filters, parties)
+        chart = merge_charts(list(party_charts.values()))
+        party_statements = get_party_statements(party_sections, context, party_charts)
+
+        set_statement_details(
+            data,
+            ageing_data,
+            sum(flt(d["sales_to_return"]) for d in party_statements),
+            headers,
+            get_combined_personal_details(filters, party_statements, data[-1]["balance"]),
+            [cheque for d in party_statements for cheque in d["cheque_list"]],
+            party_statements,
+        )
+        return (columns, data, None, chart, None)
 
-    headers = get_header(filters)
+    party_detail = context.party_details.get(parties[0]) if parties else None
 
     chart = get_chart(filters)
 
-    cheque_list_detail = get_pd_cheque_detail(filters) or {}
+    customer_personal_detial = {}
+    if party_detail:
+        customer_personal_detial = format_party_personal_details(
+            party_detail, data[-1]["balance"] if data else 0
+        )
+
+    set_statement_details(
+        data,
+        ageing_data,
+        party_detail.total_return if party_detail else 0.0,
+        headers,
+        customer_personal_detial,
+        context.cheques.get(parties[0], []) if parties else [],
+    )
+
+    if can_refresh_incrementally(filters):
+        # read in the same transaction snapshot as the statement rows
+        creation, modified, seen = get_party_watermark(
+            filters.company, filters.party_type, parties
+        )
+        data[-1]["refresh_token"] = make_refresh_token(
+            filters_hash, creation, modified, seen, data[-2], data[-1]
+        )
+
+    return (columns, data, None, chart, None)
+
+
+def can_refresh_incrementally(filters):
+    """Single party, voucher consolidated statements can be refreshed from a
+    token, see statement_refresh.py."""
+    return bool(
+        is_consolidated_in_sql(filters)
+        and filters.get("party_type")
+        and len(filters.get("party") or []) == 1
+        and not filters.get("show_cancelled_entries")
+    )
+
+
+@profile_stage
+def get_party_statements(party_sections, context, party_charts):
+    """Balance, returns, ageing, cheques, contact details and chart of each
+    party section, in section order."""
+    party_statements = []
+    for party, section in party_sections.items():
+        party_detail = context.party_details.get(party)
+        balance = flt(section.closing.get("balance"))
+
+        party_statements.append(
+            {
+                "party": party,
+                "balance": balance,
+                "sales_to_return": party_detail.total_return if party_detail else 0.0,
+                "ageing_data": section.ageing_data,
+                "cheque_list": context.cheques.get(party, []),
+                "customer_personal_detial": format_party_personal_details(party_detail, balance)
+                if party_detail
+                else {},
+                "chart": party_charts.get(party),
+            }
+        )
+
+    return party_statements
+
+
+def get_combined_personal_details(filters, party_statements, balance):
+    return {
+        "customer_name": ", ".join(d["party"] for d in party_statements),
+        "email_id": "",
+        "address_line1": "",
+        "city": "",
+        "country": "",
+        "pincode": "",
+        "due_balance": frappe.utils.fmt_money(balance),
+        "currency": filters.get("account_currency") or "KES",
+    }
+
+
+def format_party_personal_details(customer_detail, balance):
+    return {
+        "customer_name": customer_detail.get("party_name"),
+        "email_id": customer_detail.get("email_id") or "",
+        "address_line1": customer_detail.get("address_line1") or "",
+        "city": customer_detail.get("city") or "",
+        "country": customer_detail.get("country") or "",
+        "pincode": customer_detail.get("pincode") or "",
+        "due_balance": frappe.utils.fmt_money(balance),
+        "currency": customer_detail.get("default_currency") or "KES",
+    }
+
+
+@profile_stage
+def set_statement_details(
+    data,
+    ageing_data,
+    summary_sales_return,
+    headers,
+    customer_personal_detial,
+    cheque_list_detail,
+    party_statements=None,
+):
+    summary = []
+
+    data[-1]["sales_to_return"] = summary_sales_return
+    data[-1]["ageing_data"] = ageing_data
+
     total_final_dues_after_pd = 0.0
     total_pd_amount = 0.0
 
@@ -103,65 +244,6 @@ def execute(filters=None):
             }
         )
 
-    customer_personal_detial = {}
-    customer_detail = None
-    address_doc = None
-
-    if filters.get("party_type") and filters.get("party"):
-        filters.party = frappe.parse_json(filters.get("party"))
-        party = str(filters.party[0])
-
-        try:
-            if filters.get("party_type") == "Supplier":
-                customer_detail = frappe.db.get_value(
-                    "Supplier",
-                    {"name": party},
-                    ["name as supplier_name", "supplier_primary_address", "default_currency"],
-                    as_dict=1
-                )
-                if customer_detail and customer_detail.get("supplier_primary_address"):
-                    address_doc = frappe.get_doc(
-                        "Address", customer_detail.get("supplier_primary_address")
-                    )
-
-            elif filters.get("party_type") == "Customer":
-                customer_detail = frappe.db.get_value(
-                    "Customer",
-                    {"name": party},
-                    ["name as customer_name", "customer_primary_address", "default_currency"],
-                    as_dict=1
-                )
-                if customer_detail and customer_detail.get("customer_primary_address"):
-                    address_doc = frappe.get_doc(
-                        "Address", customer_detail.get("customer_primary_address")
-                    )
-
-            if customer_detail:
-                customer_personal_detial["customer_name"] = customer_detail.get(
-                    "customer_name" if filters.get("party_type") == "Customer" else "supplier_name"
-                )
-                if address_doc:
-                    customer_personal_detial["email_id"] = address_doc.get("email_id") or ""
-                    customer_personal_detial["address_line1"] = address_doc.get("address_line1") or ""
-                    customer_personal_detial["city"] = address_doc.get("city") or ""
-                    customer_personal_detial["country"] = address_doc.get("country") or ""
-                    customer_personal_detial["pincode"] = address_doc.get("pincode") or ""
-                else:
-                    customer_personal_detial.update({
-                        "email_id": "",
-                        "address_line1": "",
-                        "city": "",
-                        "country": "",
-                        "pincode": ""
-                    })
-                customer_personal_detial["due_balance"] = frappe.utils.fmt_money(
-                    data[-1]["balance"] if data else 0
-                )
-                customer_personal_detial["currency"] = customer_detail.get("default_currency") or "KES"
-
-        except Exception as e:
-            frappe.log_error(f"Error fetching customer/supplier details: {str(e)}")
-
     if data[-1]:
         summary.append(
             {
@@ -193,45 +275,15 @@ def execute(filters=None):
             }
         )
 
-        summary.append(
-            {
-                "label": "Age 30",
-                "value": frappe.utils.fmt_money(ageing_data.get("30") or 0),
-                "color": "#FFBB00",
-            }
-        )
-
-        summary.append(
-            {
-                "label": "Age 60",
-                "value": frappe.utils.fmt_money(ageing_data.get("60") or 0),
-                "color": "#FFBB00",
-            }
-        )
-
-        summary.append(
-            {
-                "label": "Age 90",
-                "value": frappe.utils.fmt_money(ageing_data.get("90") or 0),
-                "color": "#FFBB00",
-            }
-        )
-
-        summary.append(
-            {
-                "label": "Age 120",
-                "value": frappe.utils.fmt_money(ageing_data.get("120") or 0),
-                "color": "#FFBB00",
-            }
-        )
+        for label, amount in ageing_data.items():
+            summary.append(
+                {
+                    "label": "Age {0}".format(label),
+                    "value": frappe.utils.fmt_money(amount or 0),
+                    "color": "#FFBB00",
+                }
+            )
 
-        summary.append(
-            {
-                "label": "Age 120 +",
-                "value": frappe.utils.fmt_money(ageing_data.get("above") or 0),
-                "color": "#FFBB00",
-            }
-        )
         summary.append(
             {
                 "label": "PDC Amount",
@@ -245,7 +297,34 @@ def execute(filters=None):
     data[-1]["totals_pds"] = totals_pds
     data[-1]["totals_balance"] = totals_balance
     data[-1]["totals_after_pd"] = totals_after_pd
-    return (columns, data, None, chart, None)
+    if party_statements is not None:
+        data[-1]["party_statements"] = party_statements
+    return summary
+
+
+@profile_stage
+def prepare_filters(filters):
+    if (
+        filters
+        and filters.get("print_in_account_currency")
+        and not filters.get("account")
+    ):
+        frappe.throw(_("Select an account to print in account currency"))
+
+    account_details = get_account_tree(filters.get("company"))
+
+    if filters.get("party"):
+        filters.party = frappe.parse_json(filters.get("party"))
+
+    validate_filters(filters, account_details)
+
+    validate_party(filters)
+
+    filters = set_account_currency(filters)
+
+    update_translations()
+
+    return filters, account_details
 
 
 def update_translations():
@@ -306,7 +385,7 @@ def validate_party(filters):
 
 
 def set_account_currency(filters):
-    if filters.get("account") or (filters.get("party") and len(filters.party) == 1):
+    if filters.get("account") or filters.get("party"):
         filters["company_currency"] = frappe.get_cached_value(
             "Company", filters.company, "default_currency"
         )
@@ -314,12 +393,12 @@ def set_account_currency(filters):
 
         if filters.get("account"):
             if len(filters.get("account")) == 1:
-                account_currency = get_account_currency(filters.account[0])
+                account_currency = get_account_currency(filters.account[0], filters.company)
             else:
-                currency = get_account_currency(filters.account[0])
+                currency = get_account_currency(filters.account[0], filters.company)
                 is_same_account_currency = True
                 for account in filters.get("account"):
-                    if get_account_currency(account) != currency:
+                    if get_account_currency(account, filters.company) != currency:
                         is_same_account_currency = False
                         break
 
@@ -327,27 +406,7 @@ def set_account_currency(filters):
                     account_currency = currency
 
         elif filters.get("party"):
-            gle_currency = frappe.db.get_value(
-                "GL Entry",
-                {
-                    "party_type": filters.party_type,
-                    "party": filters.party[0],
-                    "company": filters.company,
-                },
-                "account_currency",
-            )
-
-            if gle_currency:
-                account_currency = gle_currency
-            else:
-                account_currency = (
-                    None
-                    if filters.party_type
-                    in ["Employee", "Student", "Shareholder", "Member"]
-                    else frappe.db.get_value(
-                        filters.party_type, filters.party[0], "default_currency"
-                    )
-                )
+            account_currency = get_party_account_currency(filters)
 
         filters["account_currency"] = account_currency or filters.company_currency
         if (
@@ -359,31 +418,164 @@ def set_account_currency(filters):
     return filters
 
 
-def get_result(filters, account_details, ageing_data):
+def get_party_account_currency(filters):
+    """The ledger currency shared by all selected parties, if there is one."""
+    currencies = frappe.db.sql_list(
+        """ select distinct account_currency from `tabGL Entry`
+        where company = %(company)s and party_type = %(party_type)s and party in %(party)s """,
+        filters,
+    )
+
+    if not currencies and filters.party_type not in ["Employee", "Student", "Shareholder", "Member"]:
+        currencies = frappe.get_all(
+            filters.party_type,
+            filters={"name": ["in", filters.party]},
+            pluck="default_currency",
+            distinct=True,
+        )
+
+    currencies = [d for d in currencies if d]
+    return currencies[0] if len(currencies) == 1 else None
+
+
+def is_multi_party(filters):
+    return len(filters.get("party") or []) > 1
+
+
+def get_result(filters, account_details, ageing_data, party_sections=None):
     accounting_dimensions = []
     if filters.get("include_dimensions"):
         accounting_dimensions = get_accounting_dimensions()
 
     gl_entries = get_gl_entries(filters, accounting_dimensions)
 
-    data = get_data_with_opening_closing(
-        filters, account_details, accounting_dimensions, gl_entries, ageing_data
-    )
+    ageing = set_ageing_data(filters, ageing_data)
+
+    if is_multi_party(filters):
+        data = get_party_sections(
+            filters,
+            account_details,
+            accounting_dimensions,
+            gl_entries,
+            ageing,
+            party_sections if party_sections is not None else OrderedDict(),
+        )
+    else:
+        data = get_data_with_opening_closing(
+            filters, account_details, accounting_dimensions, gl_entries, ageing_data
+        )
+    # leave `data` as the only reference to the rows, so each one is freed
+    # as it is converted to a dict in get_result_as_list
+    del gl_entries
 
     result = get_result_as_list(data, filters)
 
     return result
 
 
+@profile_stage
+def get_party_sections(
+    filters, account_details, accounting_dimensions, gl_entries, ageing, party_sections
+):
+    """One statement section per selected party, followed by the total and
+    closing of all of them.
+
+    Each section is a heading row and the party's own opening, entries, total
+    and closing. `party_sections` is filled with the closing row and ageing
+    of each party.
+    """
+    entries_by_party = OrderedDict((party, []) for party in filters.party)
+    for gle in gl_entries:
+        entries_by_party.setdefault(gle.party, []).append(gle)
+
+    totals = get_totals_dict()
+    data = [totals.opening]
+    for party, entries in entries_by_party.items():
+        party_ageing_data = get_ageing_data(ageing.get(party), get_ageing_ranges(filters))
+        section = get_data_with_opening_closing(
+            _dict(filters, party=[party]),
+            account_details,
+            accounting_dimensions,
+            entries,
+            party_ageing_data,
+        )
+
+        totals.opening.add(section[0])
+        totals.total.add(section[-2])
+        totals.closing.add(section[-1])
+
+        data.append({})
+        data.append(_dict(party=party, voucher_type="'{0}'".format(party)))
+        data += section
+
+        party_sections[party] = _dict(closing=section[-1], ageing_data=party_ageing_data)
+
+    data.append({})
+    data.append(totals.total)
+    data.append(totals.closing)
+
+    return data
+
+
+@profile_stage
+def set_ageing_data(filters, ageing_data, ageing=None):
+    ranges = get_ageing_ranges(filters)
+    if ageing is None:
+        ageing = get_party_ageing(
+            filters.get("company"),
+            filters.get("party_type"),
+            parties=list(filters.get("party") or []),
+            report_date=filters.get("to_date"),
+            ageing_based_on="Posting Date",
+            ranges=ranges,
+        )
+
+    if ageing:
+        ageing_data.update(get_ageing_data(get_ageing_totals(ageing, ranges), ranges))
+
+    return ageing
+
+
+def get_ageing_ranges(filters):
+    return parse_ageing_ranges(filters.get("ageing_ranges"))
+
+
+def get_ageing_data(ageing_row=None, ranges=None):
+    """{bucket label: amount} of an ageing row, in bucket order."""
+    ageing_row = ageing_row or {}
+    return OrderedDict(
+        (label, ageing_row.get("range{0}".format(i + 1)) or 0.0)
+        for i, label in enumerate(get_range_labels(ranges or parse_ageing_ranges()))
+    )
+
+
+@profile_stage
 def get_gl_entries(filters, accounting_dimensions):
     currency_map = get_currency(filters)
     select_fields = """, debit, credit, debit_in_account_currency,
         credit_in_account_currency """
 
-    order_by_statement = "order by posting_date, account, creation"
+    order_by_statement = "order by " + get_order_by()
+    conditions = get_conditions(filters)
+
+    if is_consolidated_in_sql(filters):
+        gl_entries = get_consolidated_gl_entries(filters, conditions, accounting_dimensions)
+    else:
+        gl_entries = get_gl_entries_by_line(filters, conditions, select_fields, order_by_statement)
+
+    gl_entries = get_opening_entries(filters, conditions) + gl_entries
 
+    if filters.get("presentation_currency"):
+        return convert_to_presentation_currency(
+            gl_entries, currency_map, filters.get("company")
+        )
+    else:
+        return gl_entries
+
+
+def get_gl_entries_by_line(filters, conditions, select_fields, order_by_statement):
     # Construct the SQL query directly from the underlying tables
-    gl_entries = frappe.db.sql(
+    return get_ledger_rows(
         """
         SELECT
             gle.name as gl_entry, gle.posting_date, gle.account, gle.party_type, gle.party,
@@ -399,27 +591,140 @@ def get_gl_entries(filters, accounting_dimensions):
         {order_by_statement}
         """.format(
             select_fields=select_fields,
-            conditions=get_conditions(filters),
+            conditions=conditions,
             order_by_statement=order_by_statement,
         ),
         filters,
-        as_dict=1,
-        debug=False,
     )
 
-    if filters.get("presentation_currency"):
-        return convert_to_presentation_currency(
-            gl_entries, currency_map, filters.get("company")
-        )
+
+def get_order_by(creation="creation"):
+    """Order of the statement's GL lines. Consolidated rows are ordered by
+    their first line, with `creation` as min(creation); statement_stream reads
+    its lines in the same order."""
+    return "posting_date, account, {0}, voucher_no".format(creation)
+
+
+def is_consolidated_in_sql(filters):
+    return filters.get("group_by") == "Group by Voucher (Consolidated)"
+
+
+def get_consolidated_gl_entries(filters, conditions, accounting_dimensions):
+    """One row per (voucher_type, voucher_no, account[, dimensions, cost_center]).
+
+    The database sums debit/credit and concatenates the allocations, so only
+    consolidated rows are returned instead of every GL line.
+    """
+    group_by_fields = ["posting_date", "is_opening", "voucher_type", "voucher_no", "account"]
+    if is_multi_party(filters):
+        group_by_fields.append("party")
+    if filters.get("include_dimensions"):
+        group_by_fields += list(accounting_dimensions) + ["cost_center"]
+
+    running_balance = ""
+    if has_running_balance_in_sql(filters):
+        running_balance = get_running_balance_field(filters)
+
+    return get_ledger_rows(
+        """
+        SELECT
+            min(name) as gl_entry, {group_by_fields},
+            min(party_type) as party_type,
+            {other_fields}
+            min(against_voucher_type) as against_voucher_type,
+            group_concat(nullif(against_voucher, '') order by creation separator ', ') as against_voucher,
+            min(account_currency) as account_currency,
+            min(remarks) as remarks, min(against) as against,
+            min(creation) as creation, count(*) as entry_count,
+            sum(debit) as debit, sum(credit) as credit,
+            sum(debit_in_account_currency) as debit_in_account_currency,
+            sum(credit_in_account_currency) as credit_in_account_currency
+            {running_balance}
+        FROM `tabGL Entry`
+        WHERE company = %(company)s
+        AND posting_date >= %(from_date)s
+        AND (posting_date <= %(to_date)s OR is_opening = 'Yes')
+        AND is_cancelled = 0
+        {conditions}
+        GROUP BY {group_by_fields}
+        ORDER BY {order_by}
+        """.format(
+            order_by=get_order_by("min(creation)"),
+            group_by_fields=", ".join(group_by_fields),
+            running_balance=running_balance,
+            other_fields="".join(
+                "min({0}) as {0}, ".format(f)
+                for f in ("party", "cost_center", "project")
+                if f not in group_by_fields
+            ),
+            conditions=conditions,
+        ),
+        filters,
+    )
+
+
+def has_running_balance_in_sql(filters):
+    # converted amounts differ from the ledger, so the balance is left to Python
+    return is_consolidated_in_sql(filters) and not filters.get("presentation_currency")
+
+
+def get_running_balance_field(filters):
+    """Running balance of statement entries as a window over the consolidated rows.
+
+    Rows that end up in the opening balance contribute nothing, so adding the
+    opening balance gives the balance shown against each entry.
+    """
+    if filters.get("party_type") == "Customer":
+        sign = "1"
+    elif filters.get("party_type") == "Supplier":
+        sign = "-1"
     else:
-        return gl_entries
+        sign = "0"
+
+    entry_condition = "posting_date <= %(to_date)s"
+    if not filters.get("show_opening_entries"):
+        entry_condition += " and is_opening != 'Yes'"
+
+    # each party section of a multi-party statement has its own balance
+    partition = "partition by party " if is_multi_party(filters) else ""
+
+    return """, sum(case when {entry_condition} then {sign} * (sum(debit) - sum(credit)) else 0 end)
+            over ({partition}order by {order_by}
+                rows between unbounded preceding and current row) as running_balance""".format(
+        entry_condition=entry_condition,
+        sign=sign,
+        partition=partition,
+        order_by=get_order_by("min(creation)"),
+    )
+
+
+@profile_stage
+def get_opening_entries(filters, conditions):
+    # balances before from_date, as synthetic rows dated the day before
+    opening_date = add_days(getdate(filters.from_date), -1)
+
+    return [
+        _dict(
+            posting_date=opening_date,
+            account=d.account,
+            party_type=d.party_type,
+            party=d.party,
+            account_currency=d.account_currency,
+            debit=flt(d.debit),
+            credit=flt(d.credit),
+            debit_in_account_currency=flt(d.debit_in_account_currency),
+            credit_in_account_currency=flt(d.credit_in_account_currency),
+            is_opening="No",
+        )
+        for d in get_opening_balances(filters, conditions)
+    ]
 
 
 def get_conditions(filters):
     conditions = []
 
     if filters.get("account"):
-        filters.account = get_accounts_with_children(filters.account)
+        filters.account = get_accounts_with_children(filters.account, filters.get("company"))
         conditions.append("account in %(account)s")
 
     if filters.get("cost_center"):
@@ -493,24 +798,14 @@ def get_conditions(filters):
     return "and {}".format(" and ".join(conditions)) if conditions else ""
 
 
-def get_accounts_with_children(accounts):
+def get_accounts_with_children(accounts, company=None):
     if not isinstance(accounts, list):
         accounts = [d.strip() for d in accounts.strip().split(",") if d]
 
-    all_accounts = []
-    for d in accounts:
-        if frappe.db.exists("Account", d):
-            lft, rgt = frappe.db.get_value("Account", d, ["lft", "rgt"])
-            children = frappe.get_all(
-                "Account", filters={"lft": [">=", lft], "rgt": ["<=", rgt]}
-            )
-            all_accounts += [c.name for c in children]
-        else:
-            frappe.throw(_("Account: {0} does not exist").format(d))
-
-    return list(set(all_accounts))
+    return account_tree.get_accounts_with_children(accounts, company)
 
 
+@profile_stage
 def get_data_with_opening_closing(
     filters, account_details, accounting_dimensions, gl_entries, ageing_data
 ):
@@ -556,19 +851,8 @@ def get_data_with_opening_closing(
 
 
 def get_totals_dict():
-    def _get_debit_credit_dict(label):
-        return _dict(
-            voucher_type="'{0}'".format(label),
-            debit=0.0,
-            credit=0.0,
-            debit_in_account_currency=0.0,
-            credit_in_account_currency=0.0,
-        )
-
-    return _dict(
-        opening=_get_debit_credit_dict(TRANSLATIONS.OPENING),
-        total=_get_debit_credit_dict(TRANSLATIONS.TOTAL),
-        closing=_get_debit_credit_dict(TRANSLATIONS.CLOSING_TOTAL),
+    return GroupTotals(
+        TRANSLATIONS.OPENING, TRANSLATIONS.TOTAL, TRANSLATIONS.CLOSING_TOTAL
     )
 
 
@@ -603,6 +887,7 @@ def get_accountwise_gle(
         filters.get("group_by") == "Group by Voucher (Consolidated)"
     )
 
+    account_type_map = {}
     if filters.get("show_net_values_in_party_account"):
         account_type_map = get_account_type_map(filters.get("company"))
 
@@ -613,65 +898,11 @@ def get_accountwise_gle(
         data[key].debit_in_account_currency += gle.debit_in_account_currency
         data[key].credit_in_account_currency += gle.credit_in_account_currency
 
-        if filters.get("show_net_values_in_party_account") and account_type_map.get(
-            data[key].account
-        ) in ("Receivable", "Payable"):
-            net_value = data[key].debit - data[key].credit
-            net_value_in_account_currency = (
-                data[key].debit_in_account_currency
-                - data[key].credit_in_account_currency
-            )
-
-            if net_value < 0:
-                dr_or_cr = "credit"
-                rev_dr_or_cr = "debit"
-            else:
-                dr_or_cr = "debit"
-                rev_dr_or_cr = "credit"
-
-            data[key][dr_or_cr] = abs(net_value)
-            data[key][dr_or_cr + "_in_account_currency"] = abs(
-                net_value_in_account_currency
-            )
-            data[key][rev_dr_or_cr] = 0
-            data[key][rev_dr_or_cr + "_in_account_currency"] = 0
-
-        if data[key].against_voucher and gle.against_voucher:
-            data[key].against_voucher += ", " + gle.against_voucher
+        set_net_values_in_party_account(data[key], account_type_map)
 
     from_date, to_date = getdate(filters.from_date), getdate(filters.to_date)
     show_opening_entries = filters.get("show_opening_entries")
 
-
-    if filters.get("party"):
-        party = list(filters.get("party"))
-        party = party[0]
-    else:
-        party = []
-    # frappe.msgprint(str(party))
-
-    summary_filters = {
-        "company": filters.get("company"),
-        "report_date": filters.get("to_date"),
-        "ageing_based_on": "Posting Date",
-        "range1": 30,
-        "range2": 60,
-        "range3": 90,
-        "range4": 120,
-        'party_type': filters.get("party_type"),
-        "supplier": party,
-        "customer": party,
-    }
-
-    summary_data = get_summary(summary_filters)
-    if summary_data[1]:
-        summary_data = summary_data[1][0]
-        ageing_data["30"] = summary_data.get("range1") or 0
-        ageing_data["60"] = summary_data.get("range2") or 0
-        ageing_data["90"] = summary_data.get("range3") or 0
-        ageing_data["120"] = summary_data.get("range4") or 0
-        ageing_data["above"] = summary_data.get("range5") or 0
-
     for gle in gl_entries:
 
         net_value = gle.debit - gle.credit
@@ -696,6 +927,12 @@ def get_accountwise_gle(
 
                 gle_map[group_by_value].entries.append(gle)
 
+            elif group_by_voucher_consolidated and gle.get("entry_count"):
+                # already consolidated in SQL
+                if gle.entry_count > 1:
+                    set_net_values_in_party_account(gle, account_type_map)
+                consolidated_gle[len(consolidated_gle)] = gle
+
             elif group_by_voucher_consolidated:
                 keylist = [
                     gle.get("voucher_type"),
@@ -712,6 +949,12 @@ def get_accountwise_gle(
                     consolidated_gle.setdefault(key, gle)
                 else:
                     update_value_in_dict(consolidated_gle, key, gle)
+                    # every allocation, like group_concat in get_consolidated_gl_entries
+                    if gle.against_voucher:
+                        entry = consolidated_gle[key]
+                        entry.against_voucher = ", ".join(
+                            filter(None, [entry.against_voucher, gle.against_voucher])
+                        )
 
     for key, value in consolidated_gle.items():
         update_value_in_dict(totals, "total", value)
@@ -721,80 +964,72 @@ def get_accountwise_gle(
     return totals, entries
 
 
-def get_account_type_map(company):
-    account_type_map = frappe._dict(
-        frappe.get_all(
-            "Account",
-            fields=["name", "account_type"],
-            filters={"company": company},
-            as_list=1,
-        )
+def set_net_values_in_party_account(row, account_type_map):
+    """Show a consolidated Receivable or Payable row as its net debit or
+    credit; `account_type_map` is empty unless show_net_values_in_party_account
+    is set."""
+    if account_type_map.get(row.account) not in ("Receivable", "Payable"):
+        return
+
+    net_value = row.debit - row.credit
+    net_value_in_account_currency = (
+        row.debit_in_account_currency - row.credit_in_account_currency
     )
 
-    return account_type_map
+    if net_value < 0:
+        dr_or_cr = "credit"
+        rev_dr_or_cr = "debit"
+    else:
+        dr_or_cr = "debit"
+        rev_dr_or_cr = "credit"
 
+    row[dr_or_cr] = abs(net_value)
+    row[dr_or_cr + "_in_account_currency"] = abs(net_value_in_account_currency)
+    row[rev_dr_or_cr] = 0
+    row[rev_dr_or_cr + "_in_account_currency"] = 0
 
-def get_result_as_list(data, filters):
+
+@profile_stage
+def get_result_as_list(data, filters, inv_details=None, voucher_details=None):
     balance, balance_in_account_currency = 0, 0
-    inv_details = get_supplier_invoice_details()
+    if inv_details is None:
+        inv_details = get_bill_no_map(data)
+    if voucher_details is None:
+        voucher_details = get_voucher_details(data)
+
+    opening_balance = 0
 
     for d in data:
         if not d.get("posting_date"):
             balance, balance_in_account_currency = 0, 0
 
-        balance = get_balance(d, balance, "debit", "credit", filters)
+        if d.get("running_balance") is not None:
+            # computed by the database, see get_running_balance_field
+            balance = opening_balance + flt(d.pop("running_balance"))
+        else:
+            balance = get_balance(d, balance, "debit", "credit", filters)
+            opening_balance = balance
         d["balance"] = balance
 
         d["account_currency"] = filters.account_currency
         d["bill_no"] = inv_details.get(d.get("against_voucher"), "")
 
         if d.get("voucher_type") == "Sales Invoice":
-            # Check if lisec_inv_no exists before querying
-            if frappe.db.has_column("Sales Invoice", "lisec_inv_no"):
-                d["ref_number"] = frappe.db.get_value(
-                    "Sales Invoice", 
-                    d.get("voucher_no"), 
-                    "lisec_inv_no"
-                ) or d.get("voucher_no")
-            else:
-                d["ref_number"] = d.get("voucher_no")
+            invoice_vals = voucher_details["Sales Invoice"].get(d.get("voucher_no")) or {}
+            d["ref_number"] = invoice_vals.get("lisec_inv_no") or d.get("voucher_no")
 
         elif d.get("voucher_type") == "Payment Entry":
-            try:
-                payment_vals = frappe.db.get_value(
-                    "Payment Entry",
-                    d.get("voucher_no"),
-                    ["reference_date", "mode_of_payment", "reference_no"],
-                    as_dict=True
-                ) or {}
-                
-                d["ref_number"] = payment_vals.get("reference_no", "")
-                d["chq_ref_date"] = payment_vals.get("reference_date", "")
-                d["mode_of_payment"] = payment_vals.get("mode_of_payment", "")
-                d["cheque_no"] = payment_vals.get("reference_no", "")
-            except Exception:
-                # Fallback values if query fails
-                d["ref_number"] = d.get("voucher_no", "")
-                d["chq_ref_date"] = ""
-                d["mode_of_payment"] = ""
-                d["cheque_no"] = ""
+            payment_vals = voucher_details["Payment Entry"].get(d.get("voucher_no")) or {}
+
+            d["ref_number"] = payment_vals.get("reference_no", "")
+            d["chq_ref_date"] = payment_vals.get("reference_date", "")
+            d["mode_of_payment"] = payment_vals.get("mode_of_payment", "")
+            d["cheque_no"] = payment_vals.get("reference_no", "")
 
         if d.get("voucher_type") == "Purchase Invoice":
             d["voucher_no"] = d["bill_no"] or d.get("voucher_no", "")
 
-    return data
-
-
-def get_supplier_invoice_details():
-    inv_details = {}
-    for d in frappe.db.sql(
-        """ select name, bill_no from `tabPurchase Invoice`
-        where docstatus = 1 and bill_no is not null and bill_no != '' """,
-        as_dict=1,
-    ):
-        inv_details[d.name] = d.bill_no
-
-    return inv_details
+    return as_report_rows(data)
 
 
 def get_balance(row, balance, debit_field, credit_field, filters):
@@ -873,292 +1108,14 @@ def get_columns(filters):
     return columns
 
 
-def get_supplier_customer_sales_return(filters):
-
-    totol_return = 0.0
-    doctype_name = "Sales Invoice"
-
-    conditions = ""
-    supplier_conditions = ""
-    if filters.get("party_type") and filters.get("party"):
-        filters.party = frappe.parse_json(filters.get("party"))
-        party = str(filters.party[0])
-
-        if filters.get("party_type") == "Customer":
-            conditions += " and customer =  '{}' ".format(party)
-
-        if filters.get("party_type") == "Supplier":
-            conditions += " and supplier =  '{}' ".format(party)
-            doctype_name = "Purchase Invoice"
-
-    if filters.get("from_date"):
-        conditions += " and posting_date >= '{}' ".format(filters.get("from_date"))
-
-    if filters.get("to_date"):
-        conditions += " and posting_date <= '{}' ".format(filters.get("to_date"))
-
-    sales_return = frappe.db.sql(
-        """ SELECT sum(grand_total) as total_return 
-        FROM `tab{}` WHERE docstatus = 1 and is_return=1 
-        {} """.format(
-            doctype_name, conditions
-        ),
-        as_dict=1,
-    )
-    if sales_return:
-        if sales_return[0].get("total_return"):
-            totol_return = sales_return[0].get("total_return")
-
-    return totol_return
-
-
-def get_pd_cheque_detail(filters):
-    cheque_list = []
-    if filters.get("party_type") and filters.get("party"):
-        filters.party = frappe.parse_json(filters.get("party"))
-        party = str(filters.party[0])
-        
-        try:
-            cheque_list = frappe.db.sql(
-                """ 
-                SELECT name as pd_cheque_name, DATE_FORMAT(posting_date, "%d/%m/%Y") as pd_posting_date,   
-                reference_no as pd_reference_no,
-                DATE_FORMAT(reference_date, "%d/%m/%Y") as pd_reference_date, 
-                base_amount as p_paid_amount
-                FROM `tabPosted Dated Cheques`
-                WHERE docstatus=1 AND status='Pending' AND party_type = %s AND party = %s
-                ORDER BY reference_date
-                """,
-                (filters.get("party_type"), party),
-                as_dict=1,
-            )
-        except Exception as e:
-            # Log the error or handle it as needed
-            frappe.log_error(f"Error fetching posted dated cheques: {str(e)}", "Get PD Cheque Detail")
-            # Optionally, you can return an empty list or a specific message
-            return []
-
-    return cheque_list
-
-
-
+@profile_stage
 def get_header(filters):
-    try:
-        header = frappe.db.get_value("Letter Head", {"is_default": 1}, "content") or ""
-        
-        company_fields = [
-            "company_name",
-            "phone_no",
-            "email",
-            "tax_id",
-            "company_logo",
-            "website",
-        ]
-        company_details = frappe.db.get_value("Company", filters.company, company_fields, as_dict=1) or {}
-        
-        company_address = {}
-        company_address_name = frappe.db.get_value(
-            "Dynamic Link",
-            {"link_doctype": "Company", "link_name": filters.company},
-            "parent"
-        )
-        
-        if company_address_name:
-            address_fields = [
-                "address_line1",
-                "address_title",
-                "city",
-                "country",
-                "state",
-                "email_id",
-                "phone",
-            ]
-            company_address = frappe.db.get_value("Address", company_address_name, address_fields, as_dict=1) or {}
-        
-        header_data = {
-            "company": company_details.get("company_name", ""),
-            "company_address": company_address.get("address_line1", ""),
-            "city": company_address.get("city", ""),
-            "country": company_address.get("country", ""),
-            "state": company_address.get("state", ""),
-            "phone_no": company_address.get("phone") or company_details.get("phone_no", ""),
-            "email": company_details.get("email", ""),
-            "pin_no": company_details.get("tax_id", ""),
-            "company_logo": company_details.get("company_logo", ""),
-            "website": company_details.get("website", ""),
-        }
-        
-        header_updated = frappe.render_template(header, header_data)
-        
-        import datetime
-        today_date = datetime.date.today().strftime("%d-%m-%Y")
-        
-        data = """
-        <div id="header-html" class="margin-top-15" style="margin-top:-20px !important; width:92.2%; margin-left:15px !important">
-            <div class="row">
-                <div class="col-xs-10" style="width:100%; float:left; border:1px solid black">
-                    {header_updated}
-                    <table class="table table-sm" style="width:28%; font-size:10px">
-                        <tr>
-                            <td colspan="2"><center><span><b style="font-size:11px">{party_type} Statement</b></span></center></td>
-                        </tr>
-                        <tr>
-                            <td colspan="2"><center><span><b style="font-size:11px">Date {today_date}</b></span></center></td>
-                        </tr>
-                    </table>
-                </div>
-            </div>
-        </div>
-        """
-        
-        return data.format(
-            header_updated=header_updated,
-            party_type=filters.get("party_type", ""),
-            today_date=today_date
-        )
-    
-    except Exception as e:
-        frappe.log_error(f"Error in get_header: {str(e)}")
-        return ""  # Return an empty string if there's an error
-def get_chart(filters):
-    chart = {
-        "data": {
-            "labels": [],
-            "datasets": [
-                {"name": "Sales", "values": []},
-                {"name": "Return", "values": []},
-                {"name": "Payment", "values": []},
-            ],
-        },
-        "type": "bar",
-        "colors": ["#456789", "#EE8888", "#7E77BF"],
-    }
+    return get_statement_header(filters.company, filters.get("party_type", ""))
 
-    month = [
-        "January",
-        "February",
-        "March",
-        "April",
-        "May",
-        "June",
-        "July",
-        "August",
-        "September",
-        "October",
-        "November",
-        "December",
-    ]
-
-    payment_conditions_supplier = ""
-    payment_conditions = ""
-    payment_doctype = "Purchase Entry"
-    conditions = ""
-    doctype_name = "Sales Invoice"
-
-    if filters.get("from_date"):
-        conditions += " and posting_date >=  '{}' ".format(filters.get("from_date"))
-        payment_conditions += " and posting_date >=  '{}' ".format(filters.get("from_date"))
 
-    if filters.get("to_date"):
-        conditions += " and posting_date <=  '{}' ".format(filters.get("to_date"))
-        payment_conditions += " and posting_date <=  '{}' ".format(filters.get("to_date"))
-
-    if filters.get("party_type") and filters.get("party"):
-        filters.party = frappe.parse_json(filters.get("party"))
-        party = str(filters.party[0])
-
-        if filters.get("party_type") == "Customer":
-            doctype_name = "Sales Invoice"
-            conditions += "and customer =  '{}' ".format(party)
-            payment_conditions += "and party_type = '{}'  and party =  '{}' ".format(filters.get("party_type"), party)
-
-        elif filters.get("party_type") == "Supplier":
-            doctype_name = "Purchase Invoice"
-            conditions += " and supplier =  '{}' ".format(party)
-
-            payment_conditions += "and party_type = '{}'  and party =  '{}' ".format(filters.get("party_type"), party)
-            # payment_doctype = "Purchase Invoice"
-
-    for mon in month:
-        sales = frappe.db.sql(
-            """
-            SELECT
-                monthname(posting_date) as month,
-                sum(grand_total) as sales
-            FROM
-                `tab{}`
-            WHERE
-                docstatus = 1 and is_return=0
-                and monthname(posting_date)='{}'
-                and YEAR(posting_date)='{}'
-                {}
-                group by month(posting_date)
-                order by month(posting_date) asc
-                """.format(
-                doctype_name, mon, filters.get("to_date").split("-")[0], conditions
-            ),
-            as_dict=1,
-        )
-        if sales:
-            chart["data"]["labels"].append(sales[0]["month"])
-            chart["data"]["datasets"][0]["values"].append(sales[0]["sales"])
-        else:
-            chart["data"]["labels"].append(mon)
-            chart["data"]["datasets"][0]["values"].append(0)
-
-        sales_return = frappe.db.sql(
-            """
-            SELECT
-                monthname(posting_date) as month,
-                sum(grand_total) as sales_return
-            FROM
-                `tab{}`
-            WHERE
-                docstatus = 1 and is_return=1
-                and monthname(posting_date)='{}'
-                and YEAR(posting_date)='{}'
-                {}
-                group by month(posting_date)
-                order by month(posting_date) asc
-                """.format(
-                doctype_name, mon, filters.get("to_date").split("-")[0], conditions
-            ),
-            as_dict=1,
-            debug=False
-        )
-
-        if sales_return:
-            chart["data"]["datasets"][1]["values"].append(abs(sales_return[0]["sales_return"]))
-        else:
-            chart["data"]["datasets"][1]["values"].append(0)
-
-        payment = frappe.db.sql(
-            """
-            SELECT
-                monthname(posting_date) as month,
-                sum(paid_amount) as payment
-            FROM
-                `tabPayment Entry`
-            WHERE
-                docstatus = 1
-                and monthname(posting_date)='{}'
-                and YEAR(posting_date)='{}'
-                {}
-                group by month(posting_date)
-                order by month(posting_date) asc
-                """.format(
-                mon,
-                filters.get("to_date").split("-")[0],
-                payment_conditions,
-            ),
-            as_dict=1,
-        )
-        if payment:
-            chart["data"]["datasets"][2]["values"].append(payment[0]["payment"])
-        else:
-            chart["data"]["datasets"][2]["values"].append(0)
-
-    return chart
+@profile_stage
+def get_chart(filters):
+    return get_statement_chart(filters, list(filters.get("party") or []))
 
 
 
@@ -0,0 +1,214 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import cstr, flt, get_datetime, getdate
+
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (
+    get_accounting_dimensions,
+)
+from erpnext.accounts.report.utils import convert_to_presentation_currency, get_currency
+
+from aqiq_reports.aqiq_reports.report.customer_statement_details import (
+    customer_statement_details as statement,
+)
+from aqiq_reports.aqiq_reports.utils.ledger_row import get_ledger_rows
+from aqiq_reports.aqiq_reports.utils.refresh_token import (
+    AMOUNT_FIELDS,
+    get_filters_hash,
+    get_overlap_start,
+    make_refresh_token,
+    read_refresh_token,
+)
+from aqiq_reports.aqiq_reports.utils.statement_context import get_statement_context
+
+CHANGE_FIELDS = """
+    name as gl_entry, posting_date, account, party_type, party,
+    voucher_type, voucher_no, cost_center, project,
+    against_voucher_type, against_voucher, account_currency,
+    remarks, against, is_opening, creation, modified, is_cancelled,
+    debit, credit, debit_in_account_currency, credit_in_account_currency
+"""
+
+
+@frappe.whitelist()
+def get_statement_refresh(filters, token):
+    """Changes to a loaded statement since its `refresh_token` was issued.
+
+    Only GL Entries created or modified since shortly before the token's
+    watermarks are read (see WATERMARK_OVERLAP_SEC); the ones the client
+    already has are told apart by name. Returns the new rows, the cancelled
+    GL Entry names (every line of a cancelled voucher, so they cover the
+    consolidated row's gl_entry), the updated total and closing rows (with
+    ageing and summary details) and a new token. Returns {"full": 1} when the statement has to be run again
+    instead: the token is invalid or the changes touch the opening balance.
+
+    Needs read permission on the GL Entry and on the statement's party.
+    """
+    frappe.has_permission("GL Entry", "read", throw=True)
+
+    filters = frappe._dict(frappe.parse_json(filters))
+    filters_hash = get_filters_hash(filters)
+    state = read_refresh_token(token, filters_hash)
+    if not state:
+        return {"full": 1}
+
+    filters, account_details = statement.prepare_filters(filters)
+    if not statement.can_refresh_incrementally(filters):
+        return {"full": 1}
+
+    for party in filters.party:
+        frappe.has_permission(filters.party_type, "read", party, throw=True)
+
+    changes = get_ledger_changes(filters, state)
+    if changes is None:
+        return {"full": 1}
+
+    added, cancelled, creation, modified, seen = changes
+    total, closing = get_updated_totals(state, added, cancelled)
+
+    party = filters.party[0]
+    ageing_data = statement.get_ageing_data(ranges=statement.get_ageing_ranges(filters))
+    statement.set_ageing_data(filters, ageing_data)
+
+    context = get_statement_context(filters, [party])
+    party_detail = context.party_details.get(party)
+    total["balance"] = statement.get_balance(total, 0, "debit", "credit", filters)
+    closing["balance"] = statement.get_balance(closing, 0, "debit", "credit", filters)
+    closing["account_currency"] = total["account_currency"] = filters.account_currency
+
+    summary = statement.set_statement_details(
+        [total, closing],
+        ageing_data,
+        party_detail.total_return if party_detail else 0.0,
+        statement.get_header(filters),
+        statement.format_party_personal_details(party_detail, closing["balance"])
+        if party_detail
+        else {},
+        context.cheques.get(party, []),
+    )
+
+    closing["refresh_token"] = make_refresh_token(
+        filters_hash, creation, modified, seen, total, closing
+    )
+
+    return {
+        "full": 0,
+        "rows": get_display_rows(filters, account_details, added),
+        "cancelled": sorted(cstr(d.gl_entry) for d in cancelled),
+        "total": total,
+        "closing": closing,
+        "summary": summary,
+    }
+
+
+def get_ledger_changes(filters, state):
+    """(added, cancelled, creation, modified, seen): the GL Entries of the
+    statement added and cancelled since the token, the new watermarks and the
+    entries in the new overlap window. None when any of the changes falls
+    before the statement period."""
+    # cancelled rows are needed too, so leave out the is_cancelled condition
+    change_filters = frappe._dict(filters, show_cancelled_entries=1)
+    conditions = statement.get_conditions(change_filters)
+    since_creation = get_overlap_start(state.creation)
+    since_modified = get_overlap_start(state.modified)
+
+    # the creation and the modified windows as two index ranges, see
+    # get_party_watermark
+    rows = get_ledger_rows(
+        """
+        SELECT {fields} FROM `tabGL Entry`
+        WHERE company = %(company)s and creation >= %(since_creation)s
+            and posting_date <= %(to_date)s {conditions}
+        UNION
+        SELECT {fields} FROM `tabGL Entry`
+        WHERE company = %(company)s and modified >= %(since_modified)s
+            and posting_date <= %(to_date)s {conditions}
+        ORDER BY posting_date, account, creation
+        """.format(fields=CHANGE_FIELDS, conditions=conditions),
+        dict(
+            change_filters,
+            since_creation=since_creation,
+            since_modified=since_modified,
+        ),
+    )
+
+    creation = max([state.creation] + [cstr(d.creation) for d in rows])
+    modified = max([state.modified] + [cstr(d.modified) for d in rows])
+
+    next_creation = get_overlap_start(creation)
+    next_modified = get_overlap_start(modified)
+
+    added, cancelled, seen = [], [], {}
+    for row in rows:
+        if (
+            get_datetime(row.creation) >= next_creation
+            or get_datetime(row.modified) >= next_modified
+        ):
+            seen[row.gl_entry] = row.is_cancelled
+
+        was_cancelled = state.seen.get(row.gl_entry)
+        if was_cancelled is None:
+            # outside the window when the token was issued: the client has
+            # it if it is older than the window, it is new otherwise
+            shown = get_datetime(row.creation) < since_creation
+        else:
+            shown = not was_cancelled
+
+        if row.is_cancelled:
+            # reverse entries, and entries both made and cancelled since the
+            # token, never reached the client
+            if shown:
+                cancelled.append(row)
+        elif not shown:
+            added.append(row)
+
+    from_date = getdate(filters.from_date)
+    for row in added + cancelled:
+        if getdate(row.posting_date) < from_date or (
+            row.is_opening == "Yes" and not filters.get("show_opening_entries")
+        ):
+            return None
+
+    if filters.get("presentation_currency"):
+        currency_map = get_currency(filters)
+        added = convert_to_presentation_currency(added, currency_map, filters.get("company"))
+        cancelled = convert_to_presentation_currency(
+            cancelled, currency_map, filters.get("company")
+        )
+
+    return added, cancelled, creation, modified, seen
+
+
+def get_updated_totals(state, added, cancelled):
+    total = frappe._dict(state.total, voucher_type="'{0}'".format(statement.TRANSLATIONS.TOTAL))
+    closing = frappe._dict(
+        state.closing, voucher_type="'{0}'".format(statement.TRANSLATIONS.CLOSING_TOTAL)
+    )
+
+    for rows, sign in ((added, 1), (cancelled, -1)):
+        for row in rows:
+            for field in AMOUNT_FIELDS:
+                total[field] += sign * flt(row.get(field))
+                closing[field] += sign * flt(row.get(field))
+
+    return total, closing
+
+
+def get_display_rows(filters, account_details, added):
+    """The added entries shaped like the statement's own rows."""
+    if not added:
+        return []
+
+    accounting_dimensions = []
+    if filters.get("include_dimensions"):
+        accounting_dimensions = get_accounting_dimensions()
+
+    data = statement.get_data_with_opening_closing(
+        filters, account_details, accounting_dimensions, added, {}
+    )
+    data = statement.get_result_as_list(data, filters)
+
+    # drop the opening, total and closing of the changes alone; the client
+    # recomputes the running balance around the rows it inserts
+    return data[1:-2]
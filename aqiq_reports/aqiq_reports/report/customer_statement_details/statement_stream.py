@@ -0,0 +1,420 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import csv
+from collections import OrderedDict
+from itertools import groupby, islice
+
+import frappe
+from frappe.utils import add_days, cstr, getdate
+
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (
+    get_accounting_dimensions,
+)
+from erpnext.accounts.report.utils import (
+    convert_to_presentation_currency,
+    get_currency,
+    get_rate_as_at,
+)
+
+from aqiq_reports.aqiq_reports.report.customer_statement_details import (
+    customer_statement_details as statement,
+)
+from aqiq_reports.aqiq_reports.utils.account_tree import get_account_type_map
+
+# rows converted to the presentation currency at a time
+BATCH_SIZE = 5000
+
+
+def get_statement_stream(filters):
+    """Statement columns and a generator over its rows.
+
+    Memory stays bounded regardless of statement size: GL Entries are read
+    through an unbuffered cursor, with the voucher fields joined in SQL so no
+    lookups are needed while the cursor is open, and flow through generator
+    stages for currency conversion, grouping and running balance. The rows
+    match the report's: the same conditions, net values in party accounts
+    and, for several parties, one section per party.
+
+    The opening balances and filters are resolved before the cursor opens.
+    No other query may run on the connection until the rows are consumed;
+    a statement of several parties reads them one cursor after the other.
+    """
+    filters, account_details = statement.prepare_filters(filters)
+    columns = statement.get_columns(filters)
+
+    conditions = statement.get_conditions(filters)
+    opening = statement.get_opening_entries(filters, conditions)
+    if not filters.get("show_opening_entries"):
+        opening += get_period_opening_entries(filters, conditions)
+
+    currency_map = None
+    if filters.get("presentation_currency"):
+        currency_map = get_currency(filters)
+        opening = convert_to_presentation_currency(opening, currency_map, filters.get("company"))
+
+    account_type_map = {}
+    if filters.get("show_net_values_in_party_account"):
+        account_type_map = get_account_type_map(filters.get("company"))
+
+    if statement.is_multi_party(filters):
+        rows = group_party_sections(filters, conditions, opening, currency_map, account_type_map)
+    else:
+        rows = iter_entries(filters, conditions, currency_map, opening)
+        rows = group_entries(rows, opening, filters, account_type_map)
+
+    rows = set_balance_and_references(rows, filters)
+
+    return columns, rows
+
+
+def iter_entries(filters, conditions, currency_map=None, opening_rows=()):
+    rows = iter_gl_entries(filters, conditions, opening_rows)
+    if currency_map:
+        rows = convert_in_batches(rows, currency_map, filters)
+
+    return rows
+
+
+def iter_gl_entries(filters, conditions, opening_rows=()):
+    """GL lines in the report's order (see get_order_by), each voucher or
+    group kept together and placed where its first line falls, as the report
+    lists its consolidated rows and groups."""
+    if filters.get("group_by") == "Group by Voucher (Consolidated)":
+        partition = ["gle.voucher_type", "gle.voucher_no", "gle.account"]
+        if filters.get("include_dimensions"):
+            partition += ["gle.{0}".format(d) for d in get_dimension_fields()]
+            partition.append("gle.cost_center")
+        group_rank = ""
+    else:
+        group_by = statement.group_by_field(filters.get("group_by"))
+        partition = ["gle.{0}".format(group_by)]
+        group_rank = get_group_rank(group_by, opening_rows)
+
+    order_by = "{0}min(gle.line_no) over (partition by {1}), gle.line_no".format(
+        group_rank, ", ".join(partition)
+    )
+
+    dimension_fields = ""
+    if filters.get("include_dimensions"):
+        dimension_fields = "".join(", {0}".format(d) for d in get_dimension_fields())
+
+    opening_condition = ""
+    if not filters.get("show_opening_entries"):
+        opening_condition = "and is_opening != 'Yes'"
+
+    lisec_inv_no = "si.lisec_inv_no" if frappe.db.has_column("Sales Invoice", "lisec_inv_no") else "null"
+
+    query = """
+        SELECT
+            gle.*,
+            {lisec_inv_no} as si_lisec_inv_no,
+            pe.reference_no as pe_reference_no,
+            pe.reference_date as pe_reference_date,
+            pe.mode_of_payment as pe_mode_of_payment,
+            pi.bill_no as pi_bill_no
+        FROM (
+            SELECT
+                name as gl_entry, posting_date, account, party_type, party,
+                voucher_type, voucher_no, cost_center, project,
+                against_voucher_type, against_voucher, account_currency,
+                remarks, against, is_opening, creation,
+                debit, credit, debit_in_account_currency, credit_in_account_currency,
+                row_number() over (order by {line_order}) as line_no
+                {dimension_fields}
+            FROM `tabGL Entry`
+            WHERE company = %(company)s
+                and posting_date >= %(from_date)s
+                and posting_date <= %(to_date)s
+                {opening_condition}
+                {conditions}
+        ) gle
+        LEFT JOIN `tabSales Invoice` si
+            ON gle.voucher_type = 'Sales Invoice' and si.name = gle.voucher_no
+        LEFT JOIN `tabPayment Entry` pe
+            ON gle.voucher_type = 'Payment Entry' and pe.name = gle.voucher_no
+        LEFT JOIN `tabPurchase Invoice` pi
+            ON gle.against_voucher_type = 'Purchase Invoice'
+            and pi.name = gle.against_voucher and pi.docstatus = 1
+        ORDER BY {order_by}
+    """.format(
+        lisec_inv_no=lisec_inv_no,
+        dimension_fields=dimension_fields,
+        opening_condition=opening_condition,
+        conditions=conditions,
+        line_order=statement.get_order_by(),
+        order_by=order_by,
+    )
+
+    with frappe.db.unbuffered_cursor():
+        yield from frappe.db.sql(query, filters, as_dict=1, as_iterator=True)
+
+
+def get_group_rank(group_by, opening_rows):
+    """ORDER BY term listing the groups with an opening balance first, in the
+    order of their opening rows, as initialize_gle_map does."""
+    values = OrderedDict.fromkeys(d.get(group_by) for d in opening_rows if d.get(group_by))
+    if not values:
+        return ""
+
+    return "case gle.{0} {1} else {2} end, ".format(
+        group_by,
+        " ".join(
+            "when {0} then {1}".format(frappe.db.escape(value), i)
+            for i, value in enumerate(values)
+        ),
+        len(values),
+    )
+
+
+def get_dimension_fields():
+    return [
+        d.fieldname
+        for d in get_accounting_dimensions(as_list=False)
+        if not d.disabled
+    ]
+
+
+def get_period_opening_entries(filters, conditions):
+    # is_opening entries dated inside the period still count towards the opening
+    return [
+        frappe._dict(
+            d,
+            posting_date=add_days(getdate(filters.from_date), -1),
+            is_opening="No",
+        )
+        for d in frappe.db.sql(
+            """
+            SELECT
+                party_type, party, account, account_currency,
+                sum(debit) as debit, sum(credit) as credit,
+                sum(debit_in_account_currency) as debit_in_account_currency,
+                sum(credit_in_account_currency) as credit_in_account_currency
+            FROM `tabGL Entry`
+            WHERE company = %(company)s
+                and posting_date >= %(from_date)s
+                and is_opening = 'Yes'
+                {conditions}
+            GROUP BY party_type, party, account, account_currency
+            """.format(conditions=conditions),
+            filters,
+            as_dict=1,
+        )
+    ]
+
+
+def convert_in_batches(rows, currency_map, filters):
+    # warm the exchange rate cache before the unbuffered cursor is opened
+    get_rate_as_at(
+        currency_map["report_date"],
+        currency_map["presentation_currency"],
+        currency_map["company_currency"],
+    )
+
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+
+        yield from convert_to_presentation_currency(batch, currency_map, filters.get("company"))
+
+
+def group_party_sections(filters, conditions, opening_rows, currency_map, account_type_map):
+    """Streaming counterpart of get_party_sections: a heading and the
+    statement of each party in turn, then the total and closing of all."""
+    totals = statement.get_totals_dict()
+    party_openings = {}
+    for row in opening_rows:
+        add_amounts(row, totals.opening, totals.closing)
+        party_openings.setdefault(row.party, []).append(row)
+
+    yield totals.opening
+
+    for party in filters.party:
+        party_filters = frappe._dict(filters, party=[party])
+        yield {}
+        yield frappe._dict(party=party, voucher_type="'{0}'".format(party))
+
+        section = group_entries(
+            iter_entries(party_filters, conditions, currency_map, party_openings.get(party, [])),
+            party_openings.get(party, []),
+            party_filters,
+            account_type_map,
+        )
+        # the section ends with its total and closing
+        section_total = section_closing = None
+        for row in section:
+            section_total, section_closing = section_closing, row
+            yield row
+
+        add_amounts(section_total, totals.total, totals.closing)
+
+    yield {}
+    yield totals.total
+    yield totals.closing
+
+
+def group_entries(rows, opening_rows, filters, account_type_map=None):
+    """Emit the statement layout of get_data_with_opening_closing as a stream.
+
+    Rows arrive ordered by group (or by voucher when consolidated), so only
+    the totals of the current group are held in memory.
+    """
+    group_by = statement.group_by_field(filters.get("group_by"))
+    consolidated = filters.get("group_by") == "Group by Voucher (Consolidated)"
+    show_group_balances = filters.get("group_by") != "Group by Voucher"
+
+    totals = statement.get_totals_dict()
+    group_openings = {}
+    for row in opening_rows:
+        add_amounts(row, totals.opening, totals.closing)
+        if not consolidated:
+            group_openings.setdefault(row.get(group_by), []).append(row)
+
+    yield totals.opening
+
+    if consolidated:
+        for entry in merge_vouchers(rows, filters, account_type_map or {}):
+            add_amounts(entry, totals.total, totals.closing)
+            yield entry
+    else:
+        for value, entries in groupby(rows, key=lambda d: d.get(group_by)):
+            group_totals = statement.get_totals_dict()
+            for row in group_openings.pop(value, []):
+                add_amounts(row, group_totals.opening, group_totals.closing)
+
+            yield {}
+            if show_group_balances:
+                yield group_totals.opening
+
+            for entry in entries:
+                add_amounts(entry, group_totals.total, group_totals.closing)
+                add_amounts(entry, totals.total, totals.closing)
+                yield entry
+
+            yield group_totals.total
+            if show_group_balances:
+                yield group_totals.closing
+
+        yield {}
+
+    yield totals.total
+    yield totals.closing
+
+
+def merge_vouchers(rows, filters, account_type_map):
+    dimension_fields = []
+    if filters.get("include_dimensions"):
+        dimension_fields = get_dimension_fields() + ["cost_center"]
+
+    def get_key(row):
+        return (row.voucher_type, row.voucher_no, row.account) + tuple(
+            row.get(d) for d in dimension_fields
+        )
+
+    current, current_key, against_vouchers = None, None, []
+    for row in rows:
+        key = get_key(row)
+        if key == current_key:
+            add_amounts(row, current)
+            statement.set_net_values_in_party_account(current, account_type_map)
+            # every allocation, like group_concat in get_consolidated_gl_entries
+            if row.against_voucher:
+                against_vouchers.append(row.against_voucher)
+                # the bill_no of a single invoice, none when allocated against
+                # several, as in get_result_as_list
+                current.pi_bill_no = row.pi_bill_no if len(against_vouchers) == 1 else None
+            continue
+
+        if current:
+            current.against_voucher = ", ".join(against_vouchers)
+            yield current
+
+        current, current_key = row, key
+        against_vouchers = [row.against_voucher] if row.against_voucher else []
+
+    if current:
+        current.against_voucher = ", ".join(against_vouchers)
+        yield current
+
+
+def add_amounts(row, *targets):
+    for target in targets:
+        target.debit += row.debit
+        target.credit += row.credit
+        target.debit_in_account_currency += row.debit_in_account_currency
+        target.credit_in_account_currency += row.credit_in_account_currency
+
+
+def set_balance_and_references(rows, filters):
+    # streaming counterpart of get_result_as_list
+    balance = 0
+    for d in rows:
+        if not d.get("posting_date"):
+            balance = 0
+
+        balance = statement.get_balance(d, balance, "debit", "credit", filters)
+        d["balance"] = balance
+
+        d["account_currency"] = filters.account_currency
+        d["bill_no"] = d.pop("pi_bill_no", None) or ""
+
+        if d.get("voucher_type") == "Sales Invoice":
+            d["ref_number"] = d.pop("si_lisec_inv_no", None) or d.get("voucher_no")
+
+        elif d.get("voucher_type") == "Payment Entry":
+            d["ref_number"] = d.get("pe_reference_no")
+            d["chq_ref_date"] = d.pop("pe_reference_date", None)
+            d["mode_of_payment"] = d.pop("pe_mode_of_payment", None)
+            d["cheque_no"] = d.pop("pe_reference_no", None)
+
+        if d.get("voucher_type") == "Purchase Invoice":
+            d["voucher_no"] = d["bill_no"] or d.get("voucher_no", "")
+
+        yield d
+
+
+def write_csv(columns, rows, fileobj):
+    writer = csv.writer(fileobj)
+    writer.writerow([column["label"] for column in columns])
+
+    fieldnames = [column["fieldname"] for column in columns]
+    for row in rows:
+        writer.writerow([cstr(row.get(fieldname)) for fieldname in fieldnames])
+
+
+@frappe.whitelist()
+def enqueue_statement_export(filters):
+    frappe.has_permission("GL Entry", "read", throw=True)
+
+    job = frappe.enqueue(
+        export_statement,
+        queue="long",
+        timeout=3600,
+        filters=frappe.parse_json(filters),
+        user=frappe.session.user,
+    )
+    return job.id
+
+
+def export_statement(filters, user=None):
+    """Stream a statement straight into a private CSV file."""
+    columns, rows = get_statement_stream(frappe._dict(filters))
+
+    file_name = "statement-{0}.csv".format(frappe.generate_hash(length=10))
+    with open(frappe.get_site_path("private", "files", file_name), "w", newline="") as f:
+        write_csv(columns, rows, f)
+
+    file_doc = frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": "/private/files/" + file_name,
+            "is_private": 1,
+        }
+    ).insert(ignore_permissions=True)
+
+    frappe.publish_realtime(
+        "statement_export_ready", {"file_url": file_doc.file_url}, user=user or frappe.session.user
+    )
+    return file_doc.file_url
@@ -0,0 +1,191 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, cstr, flt
+
+from aqiq_reports.aqiq_reports.report.customer_statement_details import (
+    customer_statement_details as statement,
+)
+from aqiq_reports.aqiq_reports.report.customer_statement_details.statement_refresh import (
+    get_statement_refresh,
+)
+from aqiq_reports.aqiq_reports.report.customer_statement_details.statement_stream import (
+    get_statement_stream,
+    merge_vouchers,
+)
+from aqiq_reports.aqiq_reports.utils.result_cache import uncached_results
+from aqiq_reports.benchmarks.query_budget import QueryBudgetTestMixin
+from aqiq_reports.tests.utils import (
+    FIXTURE_DEPENDENCIES,
+    get_ledger_balance,
+    get_statement_filters,
+    make_invoice,
+    make_ledger,
+)
+
+test_dependencies = ["Company"] + FIXTURE_DEPENDENCIES
+
+AMOUNT_FIELDS = ("debit", "credit", "balance")
+# the fields a consolidated row has whichever path consolidated it
+CONSOLIDATED_FIELDS = (
+    "posting_date",
+    "voucher_type",
+    "voucher_no",
+    "account",
+    "against_voucher",
+) + AMOUNT_FIELDS
+
+
+class TestCustomerStatementDetailsQueryBudget(QueryBudgetTestMixin, FrappeTestCase):
+    report_name = "Customer Statement Details"
+
+
+class TestCustomerStatementDetails(FrappeTestCase):
+    def setUp(self):
+        self.ledger = make_ledger("_Test AQIQ Statement Customer")
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def get_statement(self, **kwargs):
+        with uncached_results():
+            return statement.execute(get_statement_filters(self.ledger, **kwargs))
+
+    def test_balances_match_ledger(self):
+        data = self.get_statement()[1]
+        party, from_date, to_date = self.ledger.party, self.ledger.from_date, self.ledger.to_date
+        opening, total, closing = data[0], data[-2], data[-1]
+
+        self.assertAlmostEqual(
+            opening["balance"], get_ledger_balance("Customer", party, add_days(from_date, -1))
+        )
+        self.assertAlmostEqual(
+            total["debit"] - total["credit"],
+            get_ledger_balance("Customer", party, to_date, from_date),
+        )
+        self.assertAlmostEqual(closing["balance"], get_ledger_balance("Customer", party, to_date))
+
+        entries = [d for d in data[1:-2] if d.get("posting_date")]
+        self.assertAlmostEqual(entries[-1]["balance"], closing["balance"])
+
+    def test_sql_consolidation_matches_python(self):
+        filters, account_details = statement.prepare_filters(get_statement_filters(self.ledger))
+        conditions = statement.get_conditions(filters)
+
+        def get_rows(gl_entries):
+            gl_entries = statement.get_opening_entries(filters, conditions) + gl_entries
+            data = statement.get_data_with_opening_closing(
+                filters, account_details, [], gl_entries, {}
+            )
+            return get_values(statement.get_result_as_list(data, filters), CONSOLIDATED_FIELDS)
+
+        # consolidated and running balance in the database
+        in_sql = get_rows(statement.get_consolidated_gl_entries(filters, conditions, []))
+        # every GL line, consolidated and balanced in get_accountwise_gle
+        in_python = get_rows(
+            statement.get_gl_entries_by_line(
+                filters,
+                conditions,
+                ", debit, credit, debit_in_account_currency, credit_in_account_currency",
+                "order by " + statement.get_order_by(),
+            )
+        )
+
+        self.assertEqual(in_sql, in_python)
+        # the split receipt is a single row, allocated against both invoices
+        receipt = [d for d in in_sql if d["voucher_no"] == self.ledger.receipt.name]
+        self.assertEqual(len(receipt), 1)
+        self.assertEqual(receipt[0]["credit"], 150)
+        self.assertEqual(
+            receipt[0]["against_voucher"],
+            ", ".join(sorted(d.name for d in self.ledger.invoices)),
+        )
+
+    def test_stream_matches_report(self):
+        columns, data = self.get_statement()[:2]
+        stream_columns, rows = get_statement_stream(get_statement_filters(self.ledger))
+        fieldnames = [d["fieldname"] for d in columns]
+
+        self.assertEqual(stream_columns, columns)
+        self.assertEqual(get_values(rows, fieldnames), get_values(data, fieldnames))
+
+    def test_stream_keeps_every_allocation(self):
+        def gl_line(against_voucher, pi_bill_no=None):
+            return frappe._dict(
+                voucher_type="Journal Entry",
+                voucher_no="ACC-JV-1",
+                account="Creditors - _TC",
+                against_voucher=against_voucher,
+                pi_bill_no=pi_bill_no,
+                debit=10.0,
+                credit=0.0,
+                debit_in_account_currency=10.0,
+                credit_in_account_currency=0.0,
+            )
+
+        (single,) = merge_vouchers(
+            [gl_line(None), gl_line("ACC-PINV-1", "BILL-1")], frappe._dict(), {}
+        )
+        self.assertEqual(single.against_voucher, "ACC-PINV-1")
+        self.assertEqual(single.pi_bill_no, "BILL-1")
+        self.assertEqual(single.debit, 20.0)
+
+        (several,) = merge_vouchers(
+            [gl_line(None), gl_line("ACC-PINV-1", "BILL-1"), gl_line("ACC-PINV-2", "BILL-2")],
+            frappe._dict(),
+            {},
+        )
+        self.assertEqual(several.against_voucher, "ACC-PINV-1, ACC-PINV-2")
+        self.assertIsNone(several.pi_bill_no)
+
+    def test_refresh_adds_new_entries(self):
+        filters = get_statement_filters(self.ledger)
+        data = self.get_statement()[1]
+        token = data[-1]["refresh_token"]
+
+        invoice = make_invoice(self.ledger.party, add_days(self.ledger.to_date, -1), 75)
+        refresh = get_statement_refresh(json.dumps(filters, default=str), token)
+
+        self.assertEqual(refresh["full"], 0)
+        self.assertEqual([d["voucher_no"] for d in refresh["rows"]], [invoice.name])
+        self.assertAlmostEqual(refresh["closing"]["balance"], data[-1]["balance"] + 75)
+        self.assertAlmostEqual(
+            refresh["closing"]["balance"],
+            get_ledger_balance("Customer", self.ledger.party, self.ledger.to_date),
+        )
+
+        # nothing changed since the new token
+        again = get_statement_refresh(
+            json.dumps(filters, default=str), refresh["closing"]["refresh_token"]
+        )
+        self.assertEqual(again["rows"], [])
+
+        # a token only refreshes the statement it was issued for
+        other_filters = dict(filters, from_date=add_days(self.ledger.from_date, 1))
+        self.assertEqual(
+            get_statement_refresh(json.dumps(other_filters, default=str), token), {"full": 1}
+        )
+
+
+def get_values(rows, fieldnames):
+    """The `fieldnames` of each row, comparable: amounts rounded, the
+    allocations of a consolidated row sorted."""
+    values = []
+    for row in rows:
+        row_values = {}
+        for fieldname in fieldnames:
+            value = row.get(fieldname)
+            if fieldname in AMOUNT_FIELDS:
+                value = flt(value, 2)
+            elif fieldname == "against_voucher":
+                value = ", ".join(sorted(cstr(value).split(", ")))
+            else:
+                value = cstr(value)
+            row_values[fieldname] = value
+        values.append(row_values)
+
+    return values
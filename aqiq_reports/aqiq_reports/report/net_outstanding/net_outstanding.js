@@ -49,6 +49,40 @@ frappe.query_reports["Net Outstanding"] = {
 			"fieldtype": "Select",
 			"options": "Due Date\nPosting Date",
 			"default": "Due Date"
+		},
+		{
+			"fieldname": "ageing_ranges",
+			"label": __("Ageing Ranges"),
+			"fieldtype": "Data",
+			"default": "30, 60, 90, 120",
+			"description": __("Upper bound in days of each ageing bucket, separated by commas")
+		},
+		{
+			"fieldname": "from_snapshot",
+			"label": __("Use Daily Snapshot"),
+			"fieldtype": "Check",
+			"default": 1,
+			"description": __("Start from the latest nightly outstanding snapshot and read only the entries posted after it")
+		},
+		{
+			"fieldname": "show_trend",
+			"label": __("Show Trend"),
+			"fieldtype": "Check",
+			"default": 0,
+			"description": __("Outstanding per party at each month end up to To Date")
+		},
+		{
+			"fieldname": "trend_months",
+			"label": __("Trend Months"),
+			"fieldtype": "Int",
+			"default": 12,
+			"depends_on": "eval:doc.show_trend"
+		},
+		{
+			"fieldname": "debug_performance",
+			"label": __("Show Performance Details"),
+			"fieldtype": "Check",
+			"hidden": !frappe.user.has_role("System Manager")
 		}
 	],
 
@@ -59,12 +93,7 @@ frappe.query_reports["Net Outstanding"] = {
 		
 		try {
 			// Format currency fields
-			const currencyFields = [
-				"outstanding",
-				"range1", "range2", "range3", "range4", "range5"
-			];
-
-			if (currencyFields.includes(column.fieldname)) {
+			if (column.fieldname === "outstanding" || column.fieldname.startsWith("range")) {
 				const amount = flt(data[column.fieldname], precision("Currency"));
 				
 				if (amount === null || amount === undefined) return value;
@@ -88,14 +117,6 @@ frappe.query_reports["Net Outstanding"] = {
 
 				// Handle aging buckets
 				if (column.fieldname.startsWith("range") && amount !== 0) {
-					const rangeMap = {
-						range1: "Current to 30 days past due",
-						range2: "31 to 60 days past due",
-						range3: "61 to 90 days past due",
-						range4: "91 to 120 days past due",
-						range5: "More than 120 days past due"
-					};
-
 					// Calculate percentage only if outstanding exists and is not zero
 					let percentageText = "";
 					if (data.outstanding && data.outstanding !== 0) {
@@ -103,7 +124,7 @@ frappe.query_reports["Net Outstanding"] = {
 						percentageText = `\nPercentage: ${percentage}%`;
 					}
 
-					value = `<span title="${rangeMap[column.fieldname]}${percentageText}">${value}</span>`;
+					value = `<span title="${__("{0} days", [column.label])}${percentageText}">${value}</span>`;
 				}
 			}
 
@@ -172,14 +193,27 @@ frappe.query_reports["Net Outstanding"] = {
 			]
 		});
 
-		// Get the current report data
-		const data = report.data;
-		if (!data || !data.length) {
+		if (!report.data || !report.data.length) {
 			frappe.msgprint(__('No data available for analytics'));
 			return;
 		}
 
-		
+		// aggregated on the server from the cached result of this run
+		frappe.call({
+			method: "aqiq_reports.aqiq_reports.report.net_outstanding.net_outstanding.get_analytics",
+			args: {
+				filters: report.get_filter_values(),
+				top_n: 10
+			},
+			callback: (r) => {
+				if (r.message) {
+					this.render_analytics_dialog(dialog, r.message);
+				}
+			}
+		});
+	},
+
+	"render_analytics_dialog": function(dialog, analytics) {
 		dialog.show();
 		
 		// Wait for dialog to render completely
@@ -210,41 +244,33 @@ frappe.query_reports["Net Outstanding"] = {
 						<h4>${__('Summary Statistics')}</h4>
 					</div>
 					<div class="summary-stats" style="display: grid; grid-template-columns: repeat(4, 1fr); gap: 15px; padding: 20px;">
-						${this.get_summary_stats_html(data)}
+						${this.get_summary_stats_html(analytics.totals)}
 					</div>
 				</div>
 			`);
 
-			// Calculate aging distribution
-			const agingTotals = {
-				'0-30': data.reduce((sum, row) => sum + Math.abs(row.range1 || 0), 0),
-				'31-60': data.reduce((sum, row) => sum + Math.abs(row.range2 || 0), 0),
-				'61-90': data.reduce((sum, row) => sum + Math.abs(row.range3 || 0), 0),
-				'91-120': data.reduce((sum, row) => sum + Math.abs(row.range4 || 0), 0),
-				'120+': data.reduce((sum, row) => sum + Math.abs(row.range5 || 0), 0)
-			};
+			dialog.fields_dict.top_balances_html.$wrapper.append(
+				this.get_concentration_html(analytics) + this.get_group_breakdown_html(analytics.groups)
+			);
 
 			// Create aging distribution chart
 			new frappe.Chart("#aging-chart", {
 				data: {
-					labels: Object.keys(agingTotals),
+					labels: analytics.bucket_totals.map(d => d.label),
 					datasets: [{
 						name: __('Amount'),
-						values: Object.values(agingTotals)
+						values: analytics.bucket_totals.map(d => d.amount)
 					}]
 				},
 				type: 'donut',
 				height: 300,
-				colors: ['#2490ef', '#48bb74', '#eab308', '#f97316', '#ef4444'],
+				colors: this.range_colors,
 				tooltipOptions: {
 					formatTooltipY: value => format_currency(value)
 				}
 			});
 
-			// Calculate top 10 outstanding balances
-			const topBalances = data
-				.sort((a, b) => Math.abs(b.outstanding) - Math.abs(a.outstanding))
-				.slice(0, 10);
+			const topBalances = analytics.top_parties;
 
 			// Create top balances chart
 			new frappe.Chart("#top-balances-chart", {
@@ -266,13 +292,11 @@ frappe.query_reports["Net Outstanding"] = {
 		}, 250); // Small delay to ensure DOM is ready
 	},
 
-	"get_summary_stats_html": function(data) {
-		const total = data.reduce((sum, row) => sum + Math.abs(row.outstanding || 0), 0);
-		const average = total / data.length;
-		const overdue = data.reduce((sum, row) => 
-			sum + Math.abs(row.range2 || 0) + Math.abs(row.range3 || 0) + 
-			Math.abs(row.range4 || 0) + Math.abs(row.range5 || 0), 0);
-		const overduePercent = ((overdue / total) * 100).toFixed(1);
+	"get_summary_stats_html": function(totals) {
+		const total = totals.outstanding;
+		const average = totals.average;
+		const overdue = totals.overdue;
+		const overduePercent = totals.overdue_percent.toFixed(1);
 
 		return `
 			<div class="stat-card" style="background: #f8fafc; padding: 15px; border-radius: 8px; box-shadow: 0 1px 2px rgba(0,0,0,0.1);">
@@ -302,6 +326,64 @@ frappe.query_reports["Net Outstanding"] = {
 		`;
 	},
 
+	"get_concentration_html": function(analytics) {
+		const concentration = analytics.concentration.map(d => `
+			<tr>
+				<td>${__("Top {0}% ({1} parties)", [d.percent, d.parties])}</td>
+				<td class="text-right">${format_currency(d.amount)}</td>
+				<td class="text-right">${d.share}%</td>
+			</tr>
+		`).join("");
+		const percentiles = analytics.percentiles.map(d => `
+			<tr>
+				<td>${__("{0}th percentile balance", [d.percentile])}</td>
+				<td class="text-right" colspan="2">${format_currency(d.outstanding)}</td>
+			</tr>
+		`).join("");
+
+		return `
+			<div class="chart-wrapper" style="margin-top: 20px;">
+				<div class="chart-header">
+					<h4>${__('Concentration')}</h4>
+				</div>
+				<table class="table table-bordered table-sm">
+					${concentration}
+					${percentiles}
+				</table>
+			</div>
+		`;
+	},
+
+	"get_group_breakdown_html": function(groups) {
+		const range_columns = this.get_range_columns();
+		const header = range_columns.map(column => `<th class="text-right">${column.label}</th>`).join("");
+		const rows = groups.map(group => `
+			<tr>
+				<td>${frappe.utils.escape_html(group.party_group || __("Not Set"))}</td>
+				<td class="text-right">${group.parties}</td>
+				<td class="text-right">${format_currency(group.outstanding)}</td>
+				${range_columns.map(column => `<td class="text-right">${format_currency(group[column.fieldname] || 0)}</td>`).join("")}
+			</tr>
+		`).join("");
+
+		return `
+			<div class="chart-wrapper" style="margin-top: 20px;">
+				<div class="chart-header">
+					<h4>${__('By Party Group')}</h4>
+				</div>
+				<table class="table table-bordered table-sm">
+					<tr>
+						<th>${__("Party Group")}</th>
+						<th class="text-right">${__("Parties")}</th>
+						<th class="text-right">${__("Outstanding")}</th>
+						${header}
+					</tr>
+					${rows}
+				</table>
+			</div>
+		`;
+	},
+
 	// Add keyboard shortcuts
 	"keyboardShortcuts": function() {
 		return [
@@ -359,6 +441,21 @@ frappe.query_reports["Net Outstanding"] = {
 
 	"data_cache": {},
 
+	// from the first bucket to the oldest
+	"range_colors": ["#4CAF50", "#8BC34A", "#FFC107", "#FF9800", "#FF5722", "#F44336", "#B71C1C"],
+
+	// the ageing bucket columns, as many as the Ageing Ranges filter asks for
+	"get_range_columns": function() {
+		const columns = (frappe.query_report && frappe.query_report.columns) || [];
+		return columns.filter(column => column.fieldname && column.fieldname.startsWith("range"));
+	},
+
+	// the earlier as-of dates of a trend run, the last one is "outstanding"
+	"get_trend_columns": function() {
+		const columns = (frappe.query_report && frappe.query_report.columns) || [];
+		return columns.filter(column => column.fieldname && column.fieldname.startsWith("outstanding_"));
+	},
+
 	"tree": false,
 	"initial_depth": 3,
 	"is_tree": false,
@@ -367,14 +464,11 @@ frappe.query_reports["Net Outstanding"] = {
 	// Add totals for currency columns
 	"get_datatable_options": function(options) {
 		return Object.assign(options, {
-			columnTotal: {
-				"outstanding": true,
-				"range1": true,
-				"range2": true,
-				"range3": true,
-				"range4": true,
-				"range5": true
-			},
+			columnTotal: Object.assign(
+				{"outstanding": true},
+				...this.get_range_columns().map(column => ({[column.fieldname]: true})),
+				...this.get_trend_columns().map(column => ({[column.fieldname]: true}))
+			),
 			inlineFilters: true,
 			layout: 'fixed',
 			cellHeight: 40,
@@ -413,35 +507,24 @@ frappe.query_reports["Net Outstanding"] = {
 		const data = frappe.query_report.data;
 		if (!data) return;
 
+		const range_columns = this.get_range_columns();
 		data.forEach((row, i) => {
 			if (!row) return;
 
 			// Calculate total aging
-			const total = Math.abs(row.range1 || 0) + 
-						 Math.abs(row.range2 || 0) + 
-						 Math.abs(row.range3 || 0) + 
-						 Math.abs(row.range4 || 0) + 
-						 Math.abs(row.range5 || 0);
+			const total = range_columns.reduce((sum, column) => sum + Math.abs(row[column.fieldname] || 0), 0);
 
 			if (total === 0) return;
 
-			// Calculate percentages
-			const percentages = {
-				range1: (Math.abs(row.range1 || 0) / total * 100).toFixed(1),
-				range2: (Math.abs(row.range2 || 0) / total * 100).toFixed(1),
-				range3: (Math.abs(row.range3 || 0) / total * 100).toFixed(1),
-				range4: (Math.abs(row.range4 || 0) / total * 100).toFixed(1),
-				range5: (Math.abs(row.range5 || 0) / total * 100).toFixed(1)
-			};
-
-			// Add mini bar chart under party name
+			// Add mini bar chart under party name, a bar per bucket
+			const bars = range_columns.map((column, j) => {
+				const percentage = (Math.abs(row[column.fieldname] || 0) / total * 100).toFixed(1);
+				const color = this.range_colors[Math.min(j, this.range_colors.length - 1)];
+				return `<div style="width: ${percentage}%; background: ${color};"></div>`;
+			}).join("");
 			const barHtml = `
 				<div class="aging-bars" style="display: flex; height: 3px; margin-top: 4px; border-radius: 1px; overflow: hidden;">
-					<div style="width: ${percentages.range1}%; background: #4CAF50;"></div>
-					<div style="width: ${percentages.range2}%; background: #FFC107;"></div>
-					<div style="width: ${percentages.range3}%; background: #FF9800;"></div>
-					<div style="width: ${percentages.range4}%; background: #FF5722;"></div>
-					<div style="width: ${percentages.range5}%; background: #F44336;"></div>
+					${bars}
 				</div>
 			`;
 
@@ -466,23 +549,23 @@ frappe.query_reports["Net Outstanding"] = {
 			quickFilters.find('button').removeClass('btn-primary');
 			$(this).addClass('btn-primary');
 
-			switch(filter) {
-				case 'overdue':
-					frappe.query_report.datatable.rowmanager.filterRows(row => 
-						(row.range2 || 0) + (row.range3 || 0) + 
-						(row.range4 || 0) + (row.range5 || 0) > 0
-					);
-					break;
-				case 'high':
-					const avg = frappe.query_report.data.reduce((sum, row) => 
-						sum + Math.abs(row.outstanding || 0), 0) / frappe.query_report.data.length;
-					frappe.query_report.datatable.rowmanager.filterRows(row => 
-						Math.abs(row.outstanding || 0) > avg
-					);
-					break;
-				default:
-					frappe.query_report.datatable.rowmanager.filterRows(null);
+			if (filter === 'all') {
+				frappe.query_report.datatable.rowmanager.filterRows(null);
+				return;
 			}
+
+			// the matching parties come from the cached result on the server
+			frappe.call({
+				method: "aqiq_reports.aqiq_reports.report.net_outstanding.net_outstanding.get_quick_filter_parties",
+				args: {
+					filters: frappe.query_report.get_filter_values(),
+					quick_filter: filter
+				},
+				callback: (r) => {
+					const parties = new Set(r.message || []);
+					frappe.query_report.datatable.rowmanager.filterRows(row => parties.has(row.party));
+				}
+			});
 		});
 	}
 };
@@ -1,15 +1,38 @@
 # Copyright (c) 2024, RONOH and contributors
 # For license information, please see license.txt
 
+import math
 from collections import OrderedDict
 import frappe
 from frappe import _, scrub
-from frappe.utils import cint, cstr, flt, getdate, nowdate
+from frappe.utils import add_months, cint, cstr, flt, formatdate, get_last_day, getdate, nowdate
 from erpnext.accounts.utils import get_currency_precision
 
+from aqiq_reports.aqiq_reports.utils.ageing import (
+    get_party_outstanding,
+    get_party_outstanding_trend,
+    get_range_labels,
+    parse_ageing_ranges,
+)
+from aqiq_reports.aqiq_reports.utils.outstanding_snapshot import get_snapshot_date
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_report, profile_stage
+from aqiq_reports.aqiq_reports.utils.result_cache import get_cached_company_result
+
+# as-of dates of a trend run at most, two years of month ends
+MAX_TREND_DATES = 24
+
+# share of the parties, largest balances first, in the concentration figures
+CONCENTRATION_PERCENTS = (1, 5, 10, 20, 50)
+BALANCE_PERCENTILES = (50, 75, 90, 95, 99)
+
+@profile_report
 def execute(filters=None):
-    if not filters:
-        filters = {}
+    return get_result(filters)
+
+def get_result(filters):
+    """The report result, from the result cache when the same filters ran
+    since the last ledger change of the party type."""
+    filters = frappe._dict(filters or {})
     
     if not filters.get('company'):
         frappe.throw(_("Company is mandatory"))
@@ -20,6 +43,9 @@ def execute(filters=None):
     if not filters.get('to_date'):
         filters.to_date = nowdate()
 
+    return get_cached_company_result(__name__, filters, run_report)
+
+def run_report(filters):
     return NetOutstandingReport(filters).run()
 
 class NetOutstandingReport:
@@ -27,79 +53,115 @@ class NetOutstandingReport:
         self.filters = frappe._dict(filters)
         self.filters.report_date = getdate(self.filters.to_date)
         self.currency_precision = get_currency_precision() or 2
+        self.ranges = parse_ageing_ranges(self.filters.get("ageing_ranges"))
 
     def run(self):
+        if self.filters.get("show_trend"):
+            return self.run_trend()
+
         self.get_columns()
         self.get_data()
         return self.columns, self.data
 
-    def get_data(self):
-        # Get aging data from summary report
-        summary_filters = {
-            "company": self.filters.company,
-            "report_date": self.filters.report_date,
-            "ageing_based_on": self.filters.ageing_based_on,
-            "range1": 30,
-            "range2": 60,
-            "range3": 90,
-            "range4": 120,
-            "party_type": self.filters.party_type
-        }
+    def run_trend(self):
+        """Outstanding per party at each as-of date, with the ageing of the
+        total outstanding at each date as a chart. The column of the last
+        date is `outstanding`, as in the normal run."""
+        self.dates = self.get_trend_dates()
+        self.get_trend_data()
+        self.get_trend_columns()
+        return self.columns, self.data, None, self.get_trend_chart()
 
-        # Add party filters
-        if self.filters.get("party"):
-            summary_filters["party_name" if self.filters.party_type == "Customer" else "supplier_name"] = self.filters.party
+    def get_trend_dates(self):
+        """The `as_of_dates` filter, or the month ends of the `trend_months`
+        before To Date and To Date itself."""
+        if self.filters.get("as_of_dates"):
+            dates = self.filters.as_of_dates
+            if isinstance(dates, str):
+                dates = [d for d in dates.split(",") if d.strip()]
+            dates = sorted({getdate(d.strip() if isinstance(d, str) else d) for d in dates})
+        else:
+            months = cint(self.filters.get("trend_months")) or 12
+            dates = [
+                get_last_day(add_months(self.filters.report_date, -i)) for i in range(months - 1, 0, -1)
+            ]
+            dates.append(self.filters.report_date)
 
-        if self.filters.get("party_group"):
-            summary_filters["customer_group" if self.filters.party_type == "Customer" else "supplier_group"] = self.filters.party_group
+        if len(dates) > MAX_TREND_DATES:
+            frappe.throw(_("A trend can have at most {0} dates").format(MAX_TREND_DATES))
 
-        # Get summary data
-        columns, summary_data = get_summary(summary_filters)
-        
-        if not summary_data:
-            self.data = []
-            return
+        return dates
 
-        # Filter data based on party if specified
-        if self.filters.get("party"):
-            summary_data = [d for d in summary_data if d.party == self.filters.party]
+    @profile_stage
+    def get_trend_data(self):
+        self.data = get_party_outstanding_trend(
+            self.filters.company,
+            self.filters.party_type,
+            self.dates,
+            parties=[self.filters.party] if self.filters.get("party") else None,
+            ageing_based_on=self.filters.ageing_based_on,
+            party_group=self.filters.get("party_group"),
+            ranges=self.ranges,
+        )
 
-        # Get party names
-        parties = [d.party for d in summary_data]
-        party_names = {}
-        
-        if parties:
-            # Get party names based on party type
-            if self.filters.party_type == "Customer":
-                party_names = dict(frappe.db.sql("""
-                    SELECT name, customer_name as party_name 
-                    FROM `tabCustomer` 
-                    WHERE name IN %s
-                """, [parties]))
-            else:
-                party_names = dict(frappe.db.sql("""
-                    SELECT name, supplier_name as party_name 
-                    FROM `tabSupplier` 
-                    WHERE name IN %s
-                """, [parties]))
-
-        # Format final data
-        self.data = []
-        for row in summary_data:
-            formatted_row = frappe._dict({
-                "party": row.party,
-                "party_name": party_names.get(row.party, ''),
-                "party_group": row.get("customer_group" if self.filters.party_type == "Customer" else "supplier_group"),
-                "outstanding": row.outstanding,
-                "range1": row.range1,
-                "range2": row.range2,
-                "range3": row.range3,
-                "range4": row.range4,
-                "range5": row.range5
+        last = len(self.dates) - 1
+        for row in self.data:
+            row.outstanding = row.pop("outstanding_{0}".format(last))
+
+    def get_trend_columns(self):
+        self.get_columns()
+        # party, name and group, then a column per date instead of the buckets
+        self.columns = self.columns[:3]
+
+        last = len(self.dates) - 1
+        for i, date in enumerate(self.dates):
+            self.columns.append({
+                "label": formatdate(date),
+                "fieldname": "outstanding" if i == last else "outstanding_{0}".format(i),
+                "fieldtype": "Currency",
+                "width": 130
             })
 
-            if abs(formatted_row.outstanding) > (1.0/10 ** self.currency_precision):
-                self.data.append(formatted_row)
+    def get_trend_chart(self):
+        labels = get_range_labels(self.ranges)
+        datasets = []
+        for j, label in enumerate(labels):
+            datasets.append({
+                "name": label,
+                "values": [
+                    flt(sum(flt(row.get("range{0}_{1}".format(j + 1, i))) for row in self.data), self.currency_precision)
+                    for i in range(len(self.dates))
+                ]
+            })
+
+        return {
+            "data": {
+                "labels": [formatdate(date) for date in self.dates],
+                "datasets": datasets
+            },
+            "type": "bar",
+            "barOptions": {"stacked": 1},
+            "fieldtype": "Currency"
+        }
+
+    @profile_stage
+    def get_data(self):
+        snapshot_date = None
+        if self.filters.get("from_snapshot"):
+            snapshot_date = get_snapshot_date(
+                self.filters.company, self.filters.party_type, self.filters.report_date
+            )
+
+        self.data = get_party_outstanding(
+            self.filters.company,
+            self.filters.party_type,
+            parties=[self.filters.party] if self.filters.get("party") else None,
+            report_date=self.filters.report_date,
+            ageing_based_on=self.filters.ageing_based_on,
+            party_group=self.filters.get("party_group"),
+            ranges=self.ranges,
+            snapshot_date=snapshot_date,
+        )
 
     def get_columns(self):
         self.columns = [
@@ -128,38 +190,140 @@ class NetOutstandingReport:
                 "fieldname": "outstanding",
                 "fieldtype": "Currency",
                 "width": 150
-            },
-            {
-                "label": _("0-30"),
-                "fieldname": "range1",
-                "fieldtype": "Currency",
-                "width": 130
-            },
-            {
-                "label": _("31-60"),
-                "fieldname": "range2",
-                "fieldtype": "Currency",
-                "width": 130
-            },
-            {
-                "label": _("61-90"),
-                "fieldname": "range3",
-                "fieldtype": "Currency",
-                "width": 130
-            },
-            {
-                "label": _("91-120"),
-                "fieldname": "range4",
+            }
+        ]
+
+        for i, label in enumerate(get_range_labels(self.ranges)):
+            self.columns.append({
+                "label": label,
+                "fieldname": "range{0}".format(i + 1),
                 "fieldtype": "Currency",
                 "width": 130
-            },
+            })
+
+@frappe.whitelist()
+def get_analytics(filters, top_n=10):
+    """Aggregates of the report result for the analytics dialog: totals,
+    bucket totals, the top `top_n` parties, balance concentration and the
+    breakdown per party group. Read from the cached result of the report
+    run, so the browser does not have to scan the rows."""
+    columns, data = get_permitted_result(filters)[:2]
+    range_columns = [c for c in columns if c["fieldname"].startswith("range")]
+
+    return {
+        "totals": get_totals(data, range_columns),
+        "bucket_totals": [
             {
-                "label": _("120+"),
-                "fieldname": "range5",
-                "fieldtype": "Currency",
-                "width": 130
+                "label": c["label"],
+                "fieldname": c["fieldname"],
+                "amount": sum(abs(flt(row.get(c["fieldname"]))) for row in data),
             }
-        ]
+            for c in range_columns
+        ],
+        "top_parties": get_top_parties(data, cint(top_n) or 10),
+        "concentration": get_concentration(data),
+        "percentiles": get_percentiles(data),
+        "groups": get_group_breakdown(data, range_columns),
+    }
+
+@frappe.whitelist()
+def get_quick_filter_parties(filters, quick_filter):
+    """Parties of the cached report result matching a quick filter:
+    "overdue" for a balance past the first bucket, "high" for a balance
+    above the average."""
+    columns, data = get_permitted_result(filters)[:2]
+    range_columns = [c for c in columns if c["fieldname"].startswith("range")]
+
+    if quick_filter == "overdue":
+        return [row.party for row in data if get_overdue(row, range_columns) > 0]
+
+    if quick_filter == "high":
+        average = get_totals(data, range_columns)["average"]
+        return [row.party for row in data if abs(flt(row.outstanding)) > average]
+
+    frappe.throw(_("Unknown quick filter {0}").format(quick_filter))
+
+def get_permitted_result(filters):
+    if not frappe.get_doc("Report", "Net Outstanding").is_permitted():
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+    return get_result(frappe.parse_json(filters))
+
+def get_overdue(row, range_columns):
+    return sum(flt(row.get(c["fieldname"])) for c in range_columns[1:])
+
+def get_totals(data, range_columns):
+    total = sum(abs(flt(row.outstanding)) for row in data)
+    overdue = sum(abs(get_overdue(row, range_columns)) for row in data)
+    return {
+        "parties": len(data),
+        "outstanding": total,
+        "average": total / len(data) if data else 0.0,
+        "overdue": overdue,
+        "overdue_percent": flt(overdue * 100.0 / total, 1) if total else 0.0,
+    }
+
+def get_top_parties(data, top_n):
+    rows = sorted(data, key=lambda row: abs(flt(row.outstanding)), reverse=True)[:top_n]
+    return [
+        {"party": row.party, "party_name": row.party_name, "outstanding": flt(row.outstanding)}
+        for row in rows
+    ]
+
+def get_concentration(data):
+    """Share of the total balance held by the largest 1%, 5%, ... of the
+    parties."""
+    balances = sorted((abs(flt(row.outstanding)) for row in data), reverse=True)
+    total = sum(balances)
+    if not total:
+        return []
+
+    concentration = []
+    for percent in CONCENTRATION_PERCENTS:
+        parties = int(math.ceil(len(balances) * percent / 100.0))
+        amount = sum(balances[:parties])
+        concentration.append({
+            "percent": percent,
+            "parties": parties,
+            "amount": amount,
+            "share": flt(amount * 100.0 / total, 1),
+        })
+
+    return concentration
+
+def get_percentiles(data):
+    """Party balances at the BALANCE_PERCENTILES, nearest rank."""
+    balances = sorted(abs(flt(row.outstanding)) for row in data)
+    if not balances:
+        return []
+
+    return [
+        {
+            "percentile": percentile,
+            "outstanding": balances[max(int(math.ceil(len(balances) * percentile / 100.0)) - 1, 0)],
+        }
+        for percentile in BALANCE_PERCENTILES
+    ]
+
+def get_group_breakdown(data, range_columns):
+    """Parties, outstanding and bucket totals per party group, the largest
+    outstanding first."""
+    groups = OrderedDict()
+    for row in data:
+        group = groups.get(row.party_group)
+        if not group:
+            group = groups[row.party_group] = frappe._dict(
+                party_group=row.party_group, parties=0, outstanding=0.0
+            )
+            for c in range_columns:
+                group[c["fieldname"]] = 0.0
+
+        group.parties += 1
+        group.outstanding += flt(row.outstanding)
+        for c in range_columns:
+            group[c["fieldname"]] += flt(row.get(c["fieldname"]))
+
+    return sorted(groups.values(), key=lambda group: abs(group.outstanding), reverse=True)
 
 @frappe.whitelist()
 def get_summary(filters):
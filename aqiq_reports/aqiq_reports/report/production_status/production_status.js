@@ -53,7 +53,12 @@ frappe.query_reports["Production Status"] = {
                 "Cancelled"
             ]
         },
-
+        {
+            "fieldname": "debug_performance",
+            "label": __("Show Performance Details"),
+            "fieldtype": "Check",
+            "hidden": !frappe.user.has_role("System Manager")
+        }
     ],
 
     "formatter": function(value, row, column, data, default_formatter) {
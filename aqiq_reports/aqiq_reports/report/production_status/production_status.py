@@ -3,6 +3,9 @@ from frappe import _
 from collections import defaultdict
 from functools import lru_cache
 
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_report, profile_stage
+
+@profile_report
 def execute(filters=None):
     columns = get_columns()
     data = get_data(filters)
@@ -25,6 +28,7 @@ def get_columns():
         {"label": _("Actual Time Taken (mins)"), "fieldname": "total_time_in_mins", "fieldtype": "Float", "width": 150},
     ]
 
+@profile_stage
 def get_data(filters):
     conditions = get_conditions(filters)
     # Only select required fields
@@ -63,6 +67,7 @@ def get_conditions(filters):
     
     return " AND ".join(conditions) if conditions else "1=1"
 
+@profile_stage
 def format_data(data):
     formatted_data = []
     previous_work_order = None
@@ -95,6 +100,7 @@ def get_chart_data(data):
     #     "colors": ["#00FF00", "#FF0000"]
     # }
 
+@profile_stage
 def get_summary_data(data):
     total_for_quantity = sum(entry["for_quantity"] for entry in data if entry["for_quantity"])
     total_completed_qty = sum(entry["total_completed_qty"] for entry in data if entry["total_completed_qty"])
@@ -23,6 +23,12 @@ frappe.query_reports["Production Variance"] = {
             "fieldtype": "Date",
             "options": "",
             "default": new Date()
+        },
+        {
+            "fieldname": "debug_performance",
+            "label": __("Show Performance Details"),
+            "fieldtype": "Check",
+            "hidden": !frappe.user.has_role("System Manager")
         }
     ]
 };
@@ -3,25 +3,74 @@
 
 import frappe
 import datetime
+from frappe.utils import flt
 
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_report, profile_stage
+
+def get_work_order_conditions(filters):
+    conditions = [
+        "wo.qty > 0",
+        "wo.planned_start_date >= %(from_date)s",
+        "wo.planned_start_date < date_add(%(to_date)s, interval 1 day)",
+    ]
+    if filters.get("work_order"):
+        conditions.append("wo.name = %(work_order)s")
+    return " and ".join(conditions)
+
+@profile_stage
 def fetch_work_orders(filters):
-    work_order_filters = {"name": filters.get("work_order"), "qty": (">", 0)} if filters and filters.get("work_order") else {"qty": (">", 0)}
-    return frappe.get_all("Work Order", fields=["name", "production_item", "qty", "planned_start_date"], filters=work_order_filters)
+    return frappe.db.sql("""
+        SELECT wo.name, wo.production_item, wo.qty, wo.planned_start_date
+        FROM `tabWork Order` wo
+        WHERE {conditions}
+        ORDER BY wo.modified DESC
+    """.format(conditions=get_work_order_conditions(filters)), filters, as_dict=1)
 
-def fetch_required_materials(work_order):
-    return frappe.get_all("Work Order Item", filters={"parent": work_order.name}, fields=["item_code", "item_name", "required_qty", "transferred_qty"])
+@profile_stage
+def fetch_required_materials(filters):
+    """Required items of the filtered work orders, by work order."""
+    materials = {}
+    for d in frappe.db.sql("""
+        SELECT woi.parent, woi.item_code, woi.item_name, woi.required_qty, woi.transferred_qty
+        FROM `tabWork Order Item` woi
+        INNER JOIN `tabWork Order` wo ON wo.name = woi.parent
+        WHERE {conditions}
+        ORDER BY woi.parent, woi.idx
+    """.format(conditions=get_work_order_conditions(filters)), filters, as_dict=1):
+        materials.setdefault(d.parent, []).append(d)
+    return materials
 
+@profile_stage
 def fetch_stock_entries(filters):
-    stock_entry_filters = {"work_order": filters.get("work_order"), "docstatus": 1, "stock_entry_type": "Manufacture"}
-    stock_entry_name = filters.get("stock_entry")
-    if stock_entry_name:
-        stock_entry_filters["name"] = stock_entry_name
-    return frappe.get_all("Stock Entry", filters=stock_entry_filters, fields=["name", "fg_completed_qty"])
+    """Finished qty and the qty used per item of the submitted manufacture
+    entries of the filtered work orders, by work order."""
+    conditions = get_work_order_conditions(filters)
+    completed_qty = dict(frappe.db.sql("""
+        SELECT se.work_order, sum(se.fg_completed_qty)
+        FROM `tabStock Entry` se
+        INNER JOIN `tabWork Order` wo ON wo.name = se.work_order
+        WHERE se.docstatus = 1 and se.stock_entry_type = 'Manufacture' and {conditions}
+        GROUP BY se.work_order
+    """.format(conditions=conditions), filters))
+
+    items_qty = {}
+    for work_order, item_code, qty in frappe.db.sql("""
+        SELECT se.work_order, sed.item_code, sum(sed.qty)
+        FROM `tabStock Entry Detail` sed
+        INNER JOIN `tabStock Entry` se ON se.name = sed.parent
+        INNER JOIN `tabWork Order` wo ON wo.name = se.work_order
+        WHERE se.docstatus = 1 and se.stock_entry_type = 'Manufacture' and {conditions}
+        GROUP BY se.work_order, sed.item_code
+    """.format(conditions=conditions), filters):
+        items_qty.setdefault(work_order, {})[item_code] = qty
+
+    return completed_qty, items_qty
 
 def calculate_percentage(produced_qty, required_qty):
     result = (produced_qty / required_qty) * 100 if required_qty > 0 else 0
     return round(result, 2)
 
+@profile_report
 def execute(filters=None):
     columns = [
         {"label": "Work Order", "fieldname": "work_order", "fieldtype": "Link", "options": "Work Order", "width": 100},
@@ -38,75 +87,72 @@ def execute(filters=None):
 
     report_data = []
 
+    if not (filters and filters.get("from_date") and filters.get("to_date")):
+        return columns, report_data
+
+    # everything is read in a fixed number of queries, whatever the number of work orders
     work_orders = fetch_work_orders(filters)
+    if not work_orders:
+        return columns, report_data
+
+    materials = fetch_required_materials(filters)
+    completed_qty, items_qty = fetch_stock_entries(filters)
+
     for work_order in work_orders:
-        planned_start_date = work_order.get("planned_start_date")
-        planned_start_date_str = planned_start_date.strftime("%Y-%m-%d")
-        if filters.get("from_date") and filters.get("to_date") and planned_start_date:
-            if filters.get("from_date") <= planned_start_date_str <= filters.get("to_date"):
-                stock_entries = fetch_stock_entries({"work_order": work_order.name})
-                total_fg_completed_qty = sum(entry.get('fg_completed_qty', 0) for entry in stock_entries)
-                qty = work_order.get("qty")
-                pivot = total_fg_completed_qty / float(qty) if float(qty) > 0 else 0
-                if work_order.get("production_item"):
-                    required_materials = fetch_required_materials(work_order)
-                    
-                    report_data.append({
-                        "work_order": work_order.get('name'),
-                        "fg_completed_qty": total_fg_completed_qty,
-                        "production_item": "<b>" + str(work_order.production_item) + "</b>",
-                        "work_order_qty": "<b>" + str(qty) + "</b>"
-                    })
-                    
-                    stock_entry_items_qty = {}
-                    
-                    for stock_entry in stock_entries:
-                        stock_entry_items = frappe.get_all("Stock Entry Detail", filters={"parent": stock_entry.name}, fields=["item_code", "item_name", "qty"])
-                        
-                        for item in stock_entry_items:
-                            item_code = item.item_code
-                            transfer_qty = item.qty
-                            stock_entry_items_qty[item_code] = stock_entry_items_qty.get(item_code, 0) + transfer_qty
-                    
-                    required_items_set = {material.item_code for material in required_materials}
-                    stock_entry_items_set = set(stock_entry_items_qty.keys())
-
-                    # Process required materials
-                    for material in required_materials:
-                        item_code = material.item_code
-                        required_qty = material.required_qty
-                        transferred_qty = material.transferred_qty
-                        produced_qty = stock_entry_items_qty.get(item_code, 0)
-                        material_required = required_qty * pivot
-                        percentage = calculate_percentage(produced_qty, material_required)
-                        percentage_consumption = str(percentage) + "%"
-
-                        report_data.append({
-                            "item_code": material.item_code,
-                            "work_order_qty": " ",
-                            "required_qty": round(required_qty, 3),
-                            "stock_entry": "",
-                            "transferred_qty": round(transferred_qty, 3),
-                            "fg_completed_qty": " ",
-                            "produced_qty": round(produced_qty, 3),
-                            "material_required": round(material_required, 3),
-                            "percentage": percentage_consumption
-                        })
-                    
-                    # Process stock entry items that are not in required materials
-                    non_required_items = stock_entry_items_set - required_items_set
-                    for item_code in non_required_items:
-                        produced_qty = stock_entry_items_qty[item_code]
-                        report_data.append({
-                            "item_code": item_code,
-                            "work_order_qty": " ",
-                            "required_qty": " ",
-                            "stock_entry": "",
-                            "transferred_qty": " ",
-                            "fg_completed_qty": " ",
-                            "produced_qty": round(produced_qty, 3),
-                            "material_required": " ",
-                            "percentage": "Not part of WO items"
-                        })
+        total_fg_completed_qty = flt(completed_qty.get(work_order.name))
+        qty = work_order.get("qty")
+        pivot = total_fg_completed_qty / float(qty) if float(qty) > 0 else 0
+        if work_order.get("production_item"):
+            required_materials = materials.get(work_order.name, [])
+            
+            report_data.append({
+                "work_order": work_order.get('name'),
+                "fg_completed_qty": total_fg_completed_qty,
+                "production_item": "<b>" + str(work_order.production_item) + "</b>",
+                "work_order_qty": "<b>" + str(qty) + "</b>"
+            })
+            
+            stock_entry_items_qty = items_qty.get(work_order.name, {})
+
+            required_items_set = {material.item_code for material in required_materials}
+            stock_entry_items_set = set(stock_entry_items_qty.keys())
+
+            # Process required materials
+            for material in required_materials:
+                item_code = material.item_code
+                required_qty = material.required_qty
+                transferred_qty = material.transferred_qty
+                produced_qty = stock_entry_items_qty.get(item_code, 0)
+                material_required = required_qty * pivot
+                percentage = calculate_percentage(produced_qty, material_required)
+                percentage_consumption = str(percentage) + "%"
+
+                report_data.append({
+                    "item_code": material.item_code,
+                    "work_order_qty": " ",
+                    "required_qty": round(required_qty, 3),
+                    "stock_entry": "",
+                    "transferred_qty": round(transferred_qty, 3),
+                    "fg_completed_qty": " ",
+                    "produced_qty": round(produced_qty, 3),
+                    "material_required": round(material_required, 3),
+                    "percentage": percentage_consumption
+                })
+            
+            # Process stock entry items that are not in required materials
+            non_required_items = stock_entry_items_set - required_items_set
+            for item_code in non_required_items:
+                produced_qty = stock_entry_items_qty[item_code]
+                report_data.append({
+                    "item_code": item_code,
+                    "work_order_qty": " ",
+                    "required_qty": " ",
+                    "stock_entry": "",
+                    "transferred_qty": " ",
+                    "fg_completed_qty": " ",
+                    "produced_qty": round(produced_qty, 3),
+                    "material_required": " ",
+                    "percentage": "Not part of WO items"
+                })
 
     return columns, report_data
@@ -0,0 +1,12 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from aqiq_reports.benchmarks.query_budget import QueryBudgetTestMixin
+
+test_dependencies = ["Company"]
+
+
+class TestStatementDetails(QueryBudgetTestMixin, FrappeTestCase):
+    report_name = "Statement Details"
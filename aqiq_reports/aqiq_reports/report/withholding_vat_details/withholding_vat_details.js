@@ -22,6 +22,12 @@ frappe.query_reports["Withholding VAT Details"] = {
             "label": __("Supplier"),
             "fieldtype": "Link",
             "options": "Supplier"
+        },
+        {
+            "fieldname": "debug_performance",
+            "label": __("Show Performance Details"),
+            "fieldtype": "Check",
+            "hidden": !frappe.user.has_role("System Manager")
         }
     ]
 };
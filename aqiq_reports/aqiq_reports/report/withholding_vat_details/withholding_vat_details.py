@@ -4,6 +4,9 @@
 import frappe
 from frappe.utils import flt, formatdate
 
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_report
+
+@profile_report
 def execute(filters=None):
     if not filters:
         filters = {}
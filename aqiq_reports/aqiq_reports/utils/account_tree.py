@@ -0,0 +1,69 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+
+# site level hash of company -> {account name: account}
+CACHE_KEY = "aqiq_reports:account_tree"
+ALL_COMPANIES = "__all__"
+
+
+def get_account_tree(company=None):
+    """Accounts of `company` (or of every company) keyed by name.
+
+    Each account holds name, is_group, lft, rgt, account_type and
+    account_currency. Built once per company and kept in the site cache
+    until an Account changes.
+    """
+
+    def generator():
+        filters = {"company": company} if company else {}
+        return {
+            d.name: d
+            for d in frappe.get_all(
+                "Account",
+                filters=filters,
+                fields=["name", "is_group", "lft", "rgt", "account_type", "account_currency"],
+            )
+        }
+
+    return frappe.cache().hget(CACHE_KEY, company or ALL_COMPANIES, generator)
+
+
+def get_accounts_with_children(accounts, company=None):
+    tree = get_account_tree(company)
+
+    all_accounts = set()
+    for d in accounts:
+        account = tree.get(d)
+        if not account:
+            frappe.throw(_("Account: {0} does not exist").format(d))
+
+        all_accounts.update(
+            name
+            for name, child in tree.items()
+            if child.lft >= account.lft and child.rgt <= account.rgt
+        )
+
+    return list(all_accounts)
+
+
+def get_account_type_map(company):
+    return frappe._dict(
+        (name, account.account_type) for name, account in get_account_tree(company).items()
+    )
+
+
+def get_account_currency(account, company=None):
+    account = get_account_tree(company).get(account)
+    return account.account_currency if account else None
+
+
+def clear_account_tree_cache(doc=None, method=None, *args, **kwargs):
+    """doc_events hook for Account changes."""
+    if doc and doc.get("company"):
+        frappe.cache().hdel(CACHE_KEY, doc.company)
+        frappe.cache().hdel(CACHE_KEY, ALL_COMPANIES)
+    else:
+        frappe.cache().delete_value(CACHE_KEY)
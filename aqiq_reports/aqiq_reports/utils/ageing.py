@@ -0,0 +1,486 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+from bisect import bisect_left
+
+import frappe
+from frappe import _
+from frappe.utils import cint, date_diff, flt, getdate, nowdate
+
+from erpnext.accounts.utils import get_currency_precision
+
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_stage
+
+DEFAULT_RANGES = (30, 60, 90, 120)
+
+ACCOUNT_TYPES = {
+    "Customer": "Receivable",
+    "Supplier": "Payable",
+}
+
+PARTY_NAME_FIELDS = {
+    "Customer": "customer_name",
+    "Supplier": "supplier_name",
+}
+
+PARTY_GROUP_FIELDS = {
+    "Customer": "customer_group",
+    "Supplier": "supplier_group",
+}
+
+
+@profile_stage
+def get_party_ageing(
+    company,
+    party_type,
+    parties=None,
+    report_date=None,
+    ageing_based_on="Posting Date",
+    ranges=DEFAULT_RANGES,
+    party_group=None,
+):
+    """Outstanding and ageing buckets per party.
+
+    Returns {party: _dict(party, outstanding, range1 .. rangeN)} in the same
+    shape as ERPNext's AR/AP summary rows, computed from voucher level
+    outstanding in the Payment Ledger and scoped to the requested parties.
+    """
+    if party_type not in ACCOUNT_TYPES:
+        return {}
+
+    report_date = getdate(report_date or nowdate())
+    precision = get_currency_precision() or 2
+    ranges = list(ranges)
+
+    ageing = {}
+    for voucher in get_voucher_outstanding(
+        company, party_type, parties, report_date, party_group
+    ):
+        if abs(flt(voucher.outstanding)) < 1.0 / 10**precision:
+            continue
+
+        row = ageing.setdefault(voucher.party, get_ageing_row(voucher.party, ranges))
+        age = get_age(voucher, report_date, ageing_based_on)
+        bucket = "range{0}".format(bisect_left(ranges, age) + 1)
+
+        row.outstanding += flt(voucher.outstanding)
+        row[bucket] += flt(voucher.outstanding)
+
+    return ageing
+
+
+def parse_ageing_ranges(value=None):
+    """Bucket bounds in days from an "Ageing Ranges" filter like
+    "7, 15, 30, 60, 90", or a list. Returns them sorted and distinct,
+    DEFAULT_RANGES when none are given."""
+    if not value:
+        return DEFAULT_RANGES
+
+    if isinstance(value, str):
+        value = value.split(",")
+
+    ranges = tuple(sorted({cint(days) for days in value if cint(days) > 0}))
+    if not ranges:
+        frappe.throw(_("Ageing Ranges must be days separated by commas, like 30, 60, 90, 120"))
+
+    return ranges
+
+
+def get_range_labels(ranges=DEFAULT_RANGES):
+    """Label of each bucket: 0-30, 31-60, ... and the last bound with a +."""
+    labels = []
+    lower = 0
+    for days in ranges:
+        labels.append(_("{0}-{1}").format(lower, days))
+        lower = days + 1
+
+    labels.append(_("{0}+").format(ranges[-1]))
+    return labels
+
+
+def get_ageing_totals(ageing, ranges=DEFAULT_RANGES):
+    """Sum party rows from `get_party_ageing` into a single row."""
+    totals = get_ageing_row(None, ranges)
+    for row in ageing.values():
+        for key in totals:
+            if key != "party":
+                totals[key] += row.get(key) or 0.0
+
+    return totals
+
+
+def get_ageing_row(party, ranges=DEFAULT_RANGES):
+    row = frappe._dict(party=party, outstanding=0.0)
+    for i in range(len(ranges) + 1):
+        row["range{0}".format(i + 1)] = 0.0
+
+    return row
+
+
+def get_age(voucher, report_date, ageing_based_on):
+    entry_date = voucher.posting_date
+    if ageing_based_on == "Due Date" and voucher.due_date:
+        entry_date = voucher.due_date
+
+    return date_diff(report_date, entry_date)
+
+
+def get_voucher_outstanding(company, party_type, parties, report_date, party_group=None):
+    query, values = get_voucher_outstanding_query(
+        company, party_type, parties, report_date, party_group
+    )
+    return frappe.db.sql(query, values, as_dict=1)
+
+
+@profile_stage
+def get_party_outstanding(
+    company,
+    party_type,
+    parties=None,
+    report_date=None,
+    ageing_based_on="Posting Date",
+    ranges=DEFAULT_RANGES,
+    party_group=None,
+    snapshot_date=None,
+):
+    """Outstanding, ageing buckets, name and group per party in one query.
+
+    Same figures as `get_party_ageing`, but the voucher outstanding is
+    bucketed and summed per party by the database, so only one row per
+    party with a balance is fetched. Rows are sorted by party.
+
+    With a `snapshot_date` (see outstanding_snapshot.get_snapshot_date) the
+    voucher outstanding is read from that snapshot plus the ledger entries
+    posted after it, instead of from the whole ledger.
+    """
+    if party_type not in ACCOUNT_TYPES:
+        return []
+
+    report_date = getdate(report_date or nowdate())
+    precision = get_currency_precision() or 2
+    ranges = list(ranges)
+
+    query, values = get_voucher_outstanding_query(
+        company, party_type, parties, report_date, party_group, snapshot_date
+    )
+    values["threshold"] = 1.0 / 10**precision
+
+    if ageing_based_on == "Due Date":
+        entry_date = "coalesce(v.due_date, v.posting_date)"
+    else:
+        entry_date = "v.posting_date"
+
+    buckets = [
+        "sum(case when {0} then a.outstanding else 0 end) as range{1}".format(condition, i + 1)
+        for i, condition in enumerate(get_bucket_conditions(ranges, "a.age"))
+    ]
+
+    return frappe.db.sql(
+        """
+        SELECT
+            a.party,
+            ifnull(p.{name_field}, '') as party_name,
+            p.{group_field} as party_group,
+            sum(a.outstanding) as outstanding,
+            {buckets}
+        FROM (
+            SELECT v.party, v.outstanding, datediff(%(report_date)s, {entry_date}) as age
+            FROM ({voucher_query}) v
+            WHERE abs(v.outstanding) >= %(threshold)s
+        ) a
+        LEFT JOIN `tab{party_type}` p ON p.name = a.party
+        GROUP BY a.party, p.{name_field}, p.{group_field}
+        HAVING abs(outstanding) > %(threshold)s
+        ORDER BY a.party
+        """.format(
+            name_field=PARTY_NAME_FIELDS[party_type],
+            group_field=PARTY_GROUP_FIELDS[party_type],
+            party_type=party_type,
+            buckets=",\n            ".join(buckets),
+            entry_date=entry_date,
+            voucher_query=query,
+        ),
+        values,
+        as_dict=1,
+    )
+
+
+@profile_stage
+def get_party_outstanding_trend(
+    company,
+    party_type,
+    dates,
+    parties=None,
+    ageing_based_on="Posting Date",
+    ranges=DEFAULT_RANGES,
+    party_group=None,
+):
+    """Outstanding and ageing buckets per party as of each of `dates`, in
+    one pass over the ledger.
+
+    Every voucher is summed once with a running total per cut-off date, then
+    aged and bucketed at each date, so the figures of each date are those of
+    `get_party_outstanding` as of that date. Rows have name and group, and
+    `outstanding_{i}` and `range{j}_{i}` for the i-th date, sorted by party.
+    A party whose balance rounds to nothing at a date has zeros there.
+    """
+    if party_type not in ACCOUNT_TYPES or not dates:
+        return []
+
+    dates = sorted(getdate(d) for d in dates)
+    precision = get_currency_precision() or 2
+    ranges = list(ranges)
+
+    values = {
+        "company": company,
+        "party_type": party_type,
+        "account_type": ACCOUNT_TYPES[party_type],
+        "report_date": dates[-1],
+        "threshold": 1.0 / 10**precision,
+    }
+
+    if ageing_based_on == "Due Date":
+        entry_date = "coalesce(v.due_date, v.posting_date)"
+    else:
+        entry_date = "v.posting_date"
+
+    running_totals = []
+    columns = []
+    for i, date in enumerate(dates):
+        values["date_{0}".format(i)] = date
+        running_totals.append(
+            "sum(case when ple.posting_date <= %(date_{0})s then ple.amount else 0 end)"
+            " as outstanding_{0}".format(i)
+        )
+
+        # vouchers left with less than the currency precision are settled
+        is_open = "abs(v.outstanding_{0}) >= %(threshold)s".format(i)
+        columns.append(
+            "sum(case when {0} then v.outstanding_{1} else 0 end) as outstanding_{1}".format(is_open, i)
+        )
+
+        age = "datediff(%(date_{0})s, {1})".format(i, entry_date)
+        for j, condition in enumerate(get_bucket_conditions(ranges, age)):
+            columns.append(
+                "sum(case when {0} and {1} then v.outstanding_{2} else 0 end) as range{3}_{2}".format(
+                    is_open, condition, i, j + 1
+                )
+            )
+
+    data = frappe.db.sql(
+        """
+        SELECT
+            v.party,
+            ifnull(p.{name_field}, '') as party_name,
+            p.{group_field} as party_group,
+            {columns}
+        FROM (
+            SELECT
+                ple.party,
+                coalesce(
+                    max(case when ple.voucher_type = ple.against_voucher_type
+                        and ple.voucher_no = ple.against_voucher_no then ple.posting_date end),
+                    min(ple.posting_date)
+                ) as posting_date,
+                max(case when ple.voucher_type = ple.against_voucher_type
+                    and ple.voucher_no = ple.against_voucher_no then ple.due_date end) as due_date,
+                {running_totals}
+            FROM `tabPayment Ledger Entry` ple
+            WHERE ple.company = %(company)s
+                and ple.party_type = %(party_type)s
+                and ple.account_type = %(account_type)s
+                and ple.delinked = 0
+                and ple.posting_date <= %(report_date)s
+                {conditions}
+            GROUP BY ple.party, ple.against_voucher_type, ple.against_voucher_no
+        ) v
+        LEFT JOIN `tab{party_type}` p ON p.name = v.party
+        GROUP BY v.party, p.{name_field}, p.{group_field}
+        ORDER BY v.party
+        """.format(
+            name_field=PARTY_NAME_FIELDS[party_type],
+            group_field=PARTY_GROUP_FIELDS[party_type],
+            party_type=party_type,
+            columns=",\n            ".join(columns),
+            running_totals=",\n                ".join(running_totals),
+            conditions=get_party_conditions("ple", values, parties, party_group),
+        ),
+        values,
+        as_dict=1,
+    )
+
+    trend = []
+    for row in data:
+        for i in range(len(dates)):
+            if abs(flt(row["outstanding_{0}".format(i)])) <= values["threshold"]:
+                for key in ["outstanding_{0}".format(i)] + [
+                    "range{0}_{1}".format(j + 1, i) for j in range(len(ranges) + 1)
+                ]:
+                    row[key] = 0.0
+
+        if any(row["outstanding_{0}".format(i)] for i in range(len(dates))):
+            trend.append(row)
+
+    return trend
+
+
+def get_bucket_conditions(ranges, age):
+    """SQL condition of each bucket on the `age` expression in days: up to
+    ranges[0], then up to each next range, then everything older; the
+    buckets of get_party_ageing."""
+    bounds = [None] + [cint(days) for days in ranges] + [None]
+    conditions = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        bucket = []
+        if lower is not None:
+            bucket.append("{0} > {1}".format(age, lower))
+        if upper is not None:
+            bucket.append("{0} <= {1}".format(age, upper))
+
+        conditions.append(" and ".join(bucket) or "1 = 1")
+
+    return conditions
+
+
+def get_voucher_outstanding_query(
+    company, party_type, parties, report_date, party_group=None, snapshot_date=None
+):
+    """(query, values) of the outstanding per voucher, with the posting and
+    due date of the voucher itself."""
+    values = {
+        "company": company,
+        "party_type": party_type,
+        "account_type": ACCOUNT_TYPES[party_type],
+        "report_date": report_date,
+    }
+
+    if snapshot_date:
+        return get_snapshot_voucher_outstanding_query(
+            values, parties, party_group, snapshot_date
+        )
+
+    query = """
+        SELECT
+            ple.party,
+            ple.against_voucher_type,
+            ple.against_voucher_no,
+            sum(ple.amount) as outstanding,
+            coalesce(
+                max(case when ple.voucher_type = ple.against_voucher_type
+                    and ple.voucher_no = ple.against_voucher_no then ple.posting_date end),
+                min(ple.posting_date)
+            ) as posting_date,
+            max(case when ple.voucher_type = ple.against_voucher_type
+                and ple.voucher_no = ple.against_voucher_no then ple.due_date end) as due_date
+        FROM `tabPayment Ledger Entry` ple
+        WHERE ple.company = %(company)s
+            and ple.party_type = %(party_type)s
+            and ple.account_type = %(account_type)s
+            and ple.delinked = 0
+            and ple.posting_date <= %(report_date)s
+            {conditions}
+        GROUP BY ple.party, ple.against_voucher_type, ple.against_voucher_no
+        """.format(conditions=get_party_conditions("ple", values, parties, party_group))
+
+    return query, values
+
+
+def get_snapshot_voucher_outstanding_query(values, parties, party_group, snapshot_date):
+    """The outstanding per voucher as of the report date from the snapshot
+    taken on `snapshot_date` and the ledger entries posted after it.
+
+    The snapshot only holds the vouchers open on its date, so the dates of a
+    voucher that was settled by then and has entries again after it are
+    looked up from its own ledger entry.
+    """
+    values["snapshot_date"] = snapshot_date
+
+    query = """
+        SELECT
+            u.party,
+            u.against_voucher_type,
+            u.against_voucher_no,
+            sum(u.outstanding) as outstanding,
+            case when max(u.own_row) = 1 then max(u.own_posting_date)
+                else coalesce(
+                    (select min(o.posting_date) from `tabPayment Ledger Entry` o
+                    where o.voucher_type = u.against_voucher_type and o.voucher_no = u.against_voucher_no
+                        and o.against_voucher_type = o.voucher_type and o.against_voucher_no = o.voucher_no
+                        and o.delinked = 0),
+                    min(u.posting_date))
+            end as posting_date,
+            case when max(u.own_row) = 1 then max(u.due_date)
+                else (select max(o.due_date) from `tabPayment Ledger Entry` o
+                    where o.voucher_type = u.against_voucher_type and o.voucher_no = u.against_voucher_no
+                        and o.against_voucher_type = o.voucher_type and o.against_voucher_no = o.voucher_no
+                        and o.delinked = 0)
+            end as due_date
+        FROM (
+            SELECT
+                s.party,
+                s.voucher_type as against_voucher_type,
+                s.voucher_no as against_voucher_no,
+                s.outstanding,
+                1 as own_row,
+                s.posting_date as own_posting_date,
+                s.posting_date,
+                s.due_date
+            FROM `tabParty Outstanding Snapshot` s
+            WHERE s.company = %(company)s
+                and s.party_type = %(party_type)s
+                and s.snapshot_date = %(snapshot_date)s
+                {snapshot_conditions}
+            UNION ALL
+            SELECT
+                ple.party,
+                ple.against_voucher_type,
+                ple.against_voucher_no,
+                ple.amount,
+                ple.voucher_type = ple.against_voucher_type and ple.voucher_no = ple.against_voucher_no,
+                case when ple.voucher_type = ple.against_voucher_type
+                    and ple.voucher_no = ple.against_voucher_no then ple.posting_date end,
+                ple.posting_date,
+                case when ple.voucher_type = ple.against_voucher_type
+                    and ple.voucher_no = ple.against_voucher_no then ple.due_date end
+            FROM `tabPayment Ledger Entry` ple
+            WHERE ple.company = %(company)s
+                and ple.party_type = %(party_type)s
+                and ple.account_type = %(account_type)s
+                and ple.delinked = 0
+                and ple.posting_date > %(snapshot_date)s
+                and ple.posting_date <= %(report_date)s
+                {conditions}
+        ) u
+        GROUP BY u.party, u.against_voucher_type, u.against_voucher_no
+        """.format(
+        snapshot_conditions=get_party_conditions("s", values, parties, party_group),
+        conditions=get_party_conditions("ple", values, parties, party_group),
+    )
+
+    return query, values
+
+
+def get_party_conditions(alias, values, parties=None, party_group=None):
+    """Conditions on the party column of `alias` for the party and party
+    group filters; adds their values to `values`."""
+    conditions = []
+    if parties:
+        values["parties"] = list(parties)
+        conditions.append("and {0}.party in %(parties)s".format(alias))
+
+    if party_group:
+        party_type = values["party_type"]
+        values["party_groups"] = get_party_groups(party_type, party_group)
+        conditions.append(
+            """and {alias}.party in (select name from `tab{party_type}`
+            where {group_field} in %(party_groups)s)""".format(
+                alias=alias, party_type=party_type, group_field=PARTY_GROUP_FIELDS[party_type]
+            )
+        )
+
+    return " ".join(conditions)
+
+
+def get_party_groups(party_type, party_group):
+    doctype = "Customer Group" if party_type == "Customer" else "Supplier Group"
+    return [party_group] + frappe.db.get_descendants(doctype, party_group)
@@ -0,0 +1,305 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import hashlib
+
+import frappe
+from frappe.utils import cint, flt, get_first_day, getdate, now
+
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (
+    get_accounting_dimensions,
+)
+
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_stage
+
+# filters the monthly checkpoints are not broken down by; when any of these is
+# set the opening balance is aggregated straight from the ledger instead
+UNSUPPORTED_FILTERS = (
+    "cost_center",
+    "project",
+    "finance_book",
+    "voucher_no",
+    "show_cancelled_entries",
+)
+
+BALANCE_FIELDS = (
+    "debit",
+    "credit",
+    "debit_in_account_currency",
+    "credit_in_account_currency",
+)
+
+
+@profile_stage
+def get_opening_balances(filters, conditions):
+    """Opening debit/credit per (party_type, party, account) before `from_date`.
+
+    Served from the monthly Party Balance Checkpoint rows up to the month of
+    `from_date` plus a delta query over the GL Entries of that month, so the
+    cost depends on the statement period rather than the age of the account.
+    `conditions` are the GL Entry conditions of the statement query.
+
+    Checkpoints are only trusted while no earlier GL Entry of the parties
+    changed behind them (see checkpoints_match_ledger); otherwise the opening is read from
+    the ledger and the parties' checkpoints are rebuilt in the background.
+    """
+    from_date = getdate(filters.from_date)
+
+    if can_use_checkpoints(filters) and checkpoints_match_ledger(filters, get_first_day(from_date)):
+        month_start = get_first_day(from_date)
+        opening = get_checkpoint_balances(filters, month_start)
+        delta = get_gl_balances(filters, conditions, month_start, from_date)
+    else:
+        opening = {}
+        delta = get_gl_balances(filters, conditions, None, from_date)
+
+    for key, row in delta.items():
+        if key not in opening:
+            opening[key] = row
+            continue
+
+        for field in BALANCE_FIELDS:
+            opening[key][field] += row[field]
+
+    return list(opening.values())
+
+
+def can_use_checkpoints(filters):
+    if not (filters.get("party_type") and filters.get("party")):
+        return False
+
+    if any(filters.get(f) for f in UNSUPPORTED_FILTERS):
+        return False
+
+    if filters.get("include_dimensions"):
+        for dimension in get_accounting_dimensions(as_list=False):
+            if filters.get(dimension.fieldname):
+                return False
+
+    return True
+
+
+def checkpoints_match_ledger(filters, month_start):
+    """Whether the checkpoints before `month_start` still match the ledger
+    for the filtered parties.
+
+    The checkpoints follow GL Entry on_submit only, and every update stamps
+    their modified. An entry before `month_start` modified after the latest
+    checkpoint of its party was changed without the hook (Repost Accounting
+    Ledger, Repost Item Valuation, direct queries), so the party's
+    checkpoints are rebuilt in the background. The probe is a range over the
+    aqiq_company_party_modified index covering only the entries changed
+    since; entries deleted without hooks leave no trace and need a rebuild
+    with the rebuild-party-balance-checkpoints command.
+    """
+    checkpoint_modified = dict(
+        frappe.db.sql(
+            """
+            SELECT party, max(modified)
+            FROM `tabParty Balance Checkpoint`
+            WHERE company = %(company)s
+                and party_type = %(party_type)s
+                and party in %(party)s
+                and period < %(month_start)s
+            GROUP BY party
+            """,
+            dict(filters, month_start=month_start),
+        )
+    )
+
+    values = dict(company=filters.company, party_type=filters.party_type, month_start=month_start)
+    party_conditions = []
+    for i, party in enumerate(filters.party):
+        values["party_{0}".format(i)] = party
+        values["modified_{0}".format(i)] = checkpoint_modified.get(party) or "1900-01-01"
+        party_conditions.append(
+            "(party = %(party_{0})s and modified > %(modified_{0})s)".format(i)
+        )
+
+    drifted = frappe.db.sql_list(
+        """
+        SELECT DISTINCT party
+        FROM `tabGL Entry`
+        WHERE company = %(company)s
+            and party_type = %(party_type)s
+            and ({party_conditions})
+            and posting_date < %(month_start)s
+        """.format(party_conditions=" or ".join(party_conditions)),
+        values,
+    )
+
+    for party in drifted:
+        frappe.enqueue(
+            rebuild_checkpoints,
+            queue="long",
+            job_id="rebuild-checkpoints::{0}::{1}::{2}".format(
+                filters.company, filters.party_type, party
+            ),
+            deduplicate=True,
+            company=filters.company,
+            party_type=filters.party_type,
+            parties=[party],
+        )
+
+    return not drifted
+
+
+def get_checkpoint_balances(filters, month_start):
+    conditions = ""
+    if filters.get("account"):
+        conditions = "and account in %(account)s"
+
+    data = frappe.db.sql(
+        """
+        SELECT
+            party_type, party, account, account_currency,
+            sum(debit) as debit, sum(credit) as credit,
+            sum(debit_in_account_currency) as debit_in_account_currency,
+            sum(credit_in_account_currency) as credit_in_account_currency
+        FROM `tabParty Balance Checkpoint`
+        WHERE company = %(company)s
+            and party_type = %(party_type)s
+            and party in %(party)s
+            and period < %(month_start)s
+            {conditions}
+        GROUP BY party_type, party, account, account_currency
+        """.format(conditions=conditions),
+        dict(filters, month_start=month_start),
+        as_dict=1,
+    )
+
+    return {(d.party_type, d.party, d.account): d for d in data}
+
+
+def get_gl_balances(filters, conditions, from_date, to_date):
+    date_condition = "posting_date < %(opening_to_date)s"
+    if from_date:
+        date_condition += " and posting_date >= %(opening_from_date)s"
+
+    data = frappe.db.sql(
+        """
+        SELECT
+            party_type, party, account, account_currency,
+            sum(debit) as debit, sum(credit) as credit,
+            sum(debit_in_account_currency) as debit_in_account_currency,
+            sum(credit_in_account_currency) as credit_in_account_currency
+        FROM `tabGL Entry`
+        WHERE company = %(company)s
+            and {date_condition}
+            {conditions}
+        GROUP BY party_type, party, account, account_currency
+        """.format(date_condition=date_condition, conditions=conditions),
+        dict(filters, opening_from_date=from_date, opening_to_date=to_date),
+        as_dict=1,
+    )
+
+    return {(d.party_type, d.party, d.account): d for d in data}
+
+
+def update_balance_checkpoint(doc, method=None):
+    """doc_events hook for GL Entry on_submit.
+
+    Reverse entries made on cancellation are submitted with is_cancelled = 1
+    and debit/credit swapped, so they take the original entry back out.
+    """
+    if not (doc.party_type and doc.party):
+        return
+
+    # the entry cancelled by a reverse entry no longer counts either
+    entry_count = -1 if doc.is_cancelled else 1
+    if doc.is_cancelled:
+        debit, credit = -flt(doc.credit), -flt(doc.debit)
+        debit_in_account_currency = -flt(doc.credit_in_account_currency)
+        credit_in_account_currency = -flt(doc.debit_in_account_currency)
+    else:
+        debit, credit = flt(doc.debit), flt(doc.credit)
+        debit_in_account_currency = flt(doc.debit_in_account_currency)
+        credit_in_account_currency = flt(doc.credit_in_account_currency)
+
+    period = get_first_day(doc.posting_date)
+    frappe.db.sql(
+        """
+        INSERT INTO `tabParty Balance Checkpoint`
+            (name, creation, modified, modified_by, owner, docstatus,
+            company, party_type, party, account, account_currency, period,
+            debit, credit, debit_in_account_currency, credit_in_account_currency, entry_count)
+        VALUES
+            (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, 0,
+            %(company)s, %(party_type)s, %(party)s, %(account)s, %(account_currency)s, %(period)s,
+            %(debit)s, %(credit)s, %(debit_in_account_currency)s, %(credit_in_account_currency)s,
+            %(entry_count)s)
+        ON DUPLICATE KEY UPDATE
+            modified = greatest(modified, values(modified)),
+            entry_count = entry_count + values(entry_count),
+            debit = debit + values(debit),
+            credit = credit + values(credit),
+            debit_in_account_currency = debit_in_account_currency + values(debit_in_account_currency),
+            credit_in_account_currency = credit_in_account_currency + values(credit_in_account_currency)
+        """,
+        {
+            "name": get_checkpoint_name(doc.company, doc.party_type, doc.party, doc.account, period),
+            "now": now(),
+            "user": frappe.session.user,
+            "company": doc.company,
+            "party_type": doc.party_type,
+            "party": doc.party,
+            "account": doc.account,
+            "account_currency": doc.account_currency,
+            "period": period,
+            "debit": debit,
+            "credit": credit,
+            "debit_in_account_currency": debit_in_account_currency,
+            "credit_in_account_currency": credit_in_account_currency,
+            "entry_count": entry_count,
+        },
+    )
+
+
+def get_checkpoint_name(company, party_type, party, account, period):
+    # must match the md5(concat_ws(...)) used by rebuild_checkpoints
+    key = "::".join([company, party_type, party, account, str(getdate(period))])
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def rebuild_checkpoints(company=None, party_type=None, parties=None):
+    """Recompute the checkpoints from the ledger: all of them, those of one
+    company, or those of some parties of a company."""
+    conditions = ""
+    if company:
+        conditions += " and company = %(company)s"
+    if party_type and parties:
+        conditions += " and party_type = %(party_type)s and party in %(parties)s"
+
+    values = {"company": company, "party_type": party_type, "parties": parties}
+    frappe.db.sql(
+        """delete from `tabParty Balance Checkpoint` where 1=1 {0}""".format(conditions),
+        values,
+    )
+
+    frappe.db.sql(
+        """
+        INSERT INTO `tabParty Balance Checkpoint`
+            (name, creation, modified, modified_by, owner, docstatus,
+            company, party_type, party, account, account_currency, period,
+            debit, credit, debit_in_account_currency, credit_in_account_currency, entry_count)
+        SELECT
+            md5(concat_ws('::', company, party_type, party, account, period)),
+            %(now)s, %(now)s, %(user)s, %(user)s, 0,
+            company, party_type, party, account, max(account_currency), period,
+            sum(debit), sum(credit),
+            sum(debit_in_account_currency), sum(credit_in_account_currency), count(*)
+        FROM (
+            SELECT
+                company, party_type, party, account, account_currency,
+                date_sub(posting_date, interval dayofmonth(posting_date) - 1 day) as period,
+                debit, credit, debit_in_account_currency, credit_in_account_currency
+            FROM `tabGL Entry`
+            WHERE is_cancelled = 0
+                and ifnull(party_type, '') != ''
+                and ifnull(party, '') != ''
+                {conditions}
+        ) gle
+        GROUP BY company, party_type, party, account, period
+        """.format(conditions=conditions),
+        dict(values, now=now(), user=frappe.session.user),
+    )
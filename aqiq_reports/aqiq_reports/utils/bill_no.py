@@ -0,0 +1,90 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import pickle
+
+import frappe
+
+from aqiq_reports.aqiq_reports.utils.voucher_details import CHUNK_SIZE
+
+# site level hash of Purchase Invoice name -> bill_no ("" when the invoice has none),
+# written and deleted through frappe.cache(), which prefixes the key with
+# make_key and pickles the values
+CACHE_KEY = "aqiq_reports:purchase_invoice_bill_no"
+
+
+def get_bill_no_map(rows):
+    """Supplier bill_no for the Purchase Invoices referenced by `rows`.
+
+    Only the against_voucher values present in the result set are resolved.
+    Hits are served from the site cache, misses with one IN query per chunk.
+    """
+    invoices = {
+        d.get("against_voucher")
+        for d in rows
+        if d.get("against_voucher_type") == "Purchase Invoice" and d.get("against_voucher")
+    }
+    if not invoices:
+        return {}
+
+    bill_nos = get_cached_bill_nos(invoices)
+    missing = [name for name in invoices if name not in bill_nos]
+    if missing:
+        fetched = fetch_bill_nos(missing)
+        set_cached_bill_nos(fetched)
+        bill_nos.update(fetched)
+
+    return {name: bill_no for name, bill_no in bill_nos.items() if bill_no}
+
+
+def fetch_bill_nos(invoices):
+    bill_nos = {name: "" for name in invoices}
+    for i in range(0, len(invoices), CHUNK_SIZE):
+        for d in frappe.db.sql(
+            """ select name, bill_no from `tabPurchase Invoice`
+            where docstatus = 1 and name in %(invoices)s """,
+            {"invoices": invoices[i : i + CHUNK_SIZE]},
+            as_dict=1,
+        ):
+            bill_nos[d.name] = d.bill_no or ""
+
+    return bill_nos
+
+
+def get_cached_bill_nos(invoices):
+    invoices = list(invoices)
+    cache = frappe.cache()
+    try:
+        values = cache.hmget(cache.make_key(CACHE_KEY), invoices)
+    except Exception:
+        # redis unavailable, fall back to the database
+        frappe.log_error(title="Purchase Invoice bill_no cache")
+        return {}
+
+    return {
+        name: pickle.loads(value) for name, value in zip(invoices, values) if value is not None
+    }
+
+
+def set_cached_bill_nos(bill_nos):
+    if not bill_nos:
+        return
+
+    cache = frappe.cache()
+    try:
+        for name, bill_no in bill_nos.items():
+            cache.hset(CACHE_KEY, name, bill_no)
+    except Exception:
+        frappe.log_error(title="Purchase Invoice bill_no cache")
+
+
+def update_bill_no_cache(doc, method=None):
+    """doc_events hook for Purchase Invoice on_submit / on_cancel."""
+    if doc.docstatus == 1:
+        set_cached_bill_nos({doc.name: doc.bill_no or ""})
+    else:
+        frappe.cache().hdel(CACHE_KEY, doc.name)
+
+
+def clear_bill_no_cache():
+    frappe.cache().delete_value(CACHE_KEY)
@@ -0,0 +1,199 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import frappe
+
+_MISSING = object()
+
+LEDGER_FIELDS = (
+    "gl_entry",
+    "posting_date",
+    "account",
+    "party_type",
+    "party",
+    "voucher_type",
+    "voucher_no",
+    "cost_center",
+    "project",
+    "against_voucher_type",
+    "against_voucher",
+    "account_currency",
+    "remarks",
+    "against",
+    "is_opening",
+    "creation",
+    "debit",
+    "credit",
+    "debit_in_account_currency",
+    "credit_in_account_currency",
+    "entry_count",
+    "running_balance",
+    "balance",
+    "bill_no",
+    "ref_number",
+)
+
+TOTALS_FIELDS = (
+    "voucher_type",
+    "debit",
+    "credit",
+    "debit_in_account_currency",
+    "credit_in_account_currency",
+)
+
+
+class SlotRow:
+    """Base for compact report rows.
+
+    Fields listed in `__slots__` are stored without a per-row dict; any other
+    key (accounting dimensions, print details) goes into a small overflow
+    dict. Supports the `_dict` access used by the statement pipeline and by
+    erpnext's currency conversion: attributes, items, get and pop. Unset
+    attributes read as None, like `_dict`.
+    """
+
+    __slots__ = ("_extra",)
+    _fields = frozenset()
+    _field_order = ()
+
+    def __init__(self, **kwargs):
+        self._extra = None
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def __getattr__(self, key):
+        # only called for unset slots and unknown names
+        if key[:2] == "__" or key == "_extra":
+            raise AttributeError(key)
+
+        extra = self._extra
+        return extra.get(key) if extra else None
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                return default
+
+        extra = self._extra
+        return extra.get(key, default) if extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            object.__setattr__(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        if key in self._fields:
+            try:
+                object.__delattr__(self, key)
+            except AttributeError:
+                pass
+        elif self._extra:
+            self._extra.pop(key, None)
+        return value
+
+    def copy(self):
+        row = type(self).__new__(type(self))
+        row._extra = dict(self._extra) if self._extra else None
+        for key in self._field_order:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                object.__setattr__(row, key, value)
+        return row
+
+    def as_dict(self):
+        data = frappe._dict()
+        for key in self._field_order:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                data[key] = value
+
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+
+class LedgerRow(SlotRow):
+    """A GL Entry row of the statement pipeline."""
+
+    __slots__ = LEDGER_FIELDS
+    _fields = frozenset(LEDGER_FIELDS)
+    _field_order = LEDGER_FIELDS
+
+    @classmethod
+    def from_values(cls, columns, values):
+        row = cls.__new__(cls)
+        row._extra = None
+        for key, value in zip(columns, values):
+            row[key] = value
+        return row
+
+
+class LedgerTotals(SlotRow):
+    """Running debit/credit totals shown as an Opening, Total or Closing row."""
+
+    __slots__ = TOTALS_FIELDS
+    _fields = frozenset(TOTALS_FIELDS)
+    _field_order = TOTALS_FIELDS
+
+    def __init__(self, label):
+        self._extra = None
+        self.voucher_type = "'{0}'".format(label)
+        self.debit = 0.0
+        self.credit = 0.0
+        self.debit_in_account_currency = 0.0
+        self.credit_in_account_currency = 0.0
+
+    def add(self, row):
+        self.debit += row.debit
+        self.credit += row.credit
+        self.debit_in_account_currency += row.debit_in_account_currency
+        self.credit_in_account_currency += row.credit_in_account_currency
+
+
+class GroupTotals:
+    """Opening, total and closing of a group, or of the whole statement."""
+
+    __slots__ = ("opening", "total", "closing")
+
+    def __init__(self, opening_label, total_label, closing_label):
+        self.opening = LedgerTotals(opening_label)
+        self.total = LedgerTotals(total_label)
+        self.closing = LedgerTotals(closing_label)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+
+def get_ledger_rows(query, values=None):
+    """Run `query` and return its rows as LedgerRow instead of `_dict`."""
+    data = frappe.db.sql(query, values)
+    if not data:
+        return []
+
+    columns = [d[0] for d in frappe.db.get_description()]
+    return [LedgerRow.from_values(columns, d) for d in data]
+
+
+def as_report_rows(rows):
+    """Plain dicts for the report response, converted in place so each
+    compact row can be freed as soon as its dict exists."""
+    for i, d in enumerate(rows):
+        if isinstance(d, SlotRow):
+            rows[i] = d.as_dict()
+    return rows
@@ -0,0 +1,107 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import add_days, getdate, now, today
+
+from aqiq_reports.aqiq_reports.utils.ageing import ACCOUNT_TYPES, get_voucher_outstanding_query
+
+# daily snapshots older than this are removed, month-end ones are kept
+SNAPSHOT_RETENTION_DAYS = 35
+
+
+def take_outstanding_snapshots():
+    """scheduler_events hook: snapshot the outstanding of every company as of
+    the end of yesterday, then drop the snapshots past their retention."""
+    snapshot_date = getdate(add_days(today(), -1))
+    for company in frappe.get_all("Company", pluck="name"):
+        for party_type in ACCOUNT_TYPES:
+            build_snapshot(company, party_type, snapshot_date)
+            frappe.db.commit()
+
+    prune_snapshots(snapshot_date)
+    frappe.db.commit()
+
+
+def build_snapshot(company, party_type, snapshot_date):
+    """Replace the Party Outstanding Snapshot of `snapshot_date` with the
+    open vouchers of the party type as of that date, from the ledger."""
+    snapshot_date = getdate(snapshot_date)
+    frappe.db.sql(
+        """
+        delete from `tabParty Outstanding Snapshot`
+        where company = %s and party_type = %s and snapshot_date = %s
+        """,
+        (company, party_type, snapshot_date),
+    )
+
+    query, values = get_voucher_outstanding_query(company, party_type, None, snapshot_date)
+    values.update(snapshot_date=snapshot_date, now=now(), user=frappe.session.user)
+
+    # settled vouchers are left out, the residue of the others is kept as is
+    # so the snapshot plus the later entries add up to the ledger exactly
+    frappe.db.sql(
+        """
+        INSERT INTO `tabParty Outstanding Snapshot`
+            (name, creation, modified, modified_by, owner, docstatus,
+            company, party_type, party, snapshot_date,
+            voucher_type, voucher_no, posting_date, due_date, outstanding)
+        SELECT
+            md5(concat_ws('::', %(company)s, %(party_type)s, %(snapshot_date)s,
+                v.party, v.against_voucher_type, v.against_voucher_no)),
+            %(now)s, %(now)s, %(user)s, %(user)s, 0,
+            %(company)s, %(party_type)s, v.party, %(snapshot_date)s,
+            v.against_voucher_type, v.against_voucher_no, v.posting_date, v.due_date, v.outstanding
+        FROM ({query}) v
+        WHERE v.outstanding != 0
+        """.format(query=query),
+        values,
+    )
+
+
+def prune_snapshots(snapshot_date):
+    frappe.db.sql(
+        """
+        delete from `tabParty Outstanding Snapshot`
+        where snapshot_date < %s and snapshot_date != last_day(snapshot_date)
+        """,
+        add_days(snapshot_date, -SNAPSHOT_RETENTION_DAYS),
+    )
+
+
+def get_snapshot_date(company, party_type, report_date):
+    """Date of the latest snapshot on or before `report_date` that still
+    matches the ledger, or None.
+
+    A snapshot is out of date once a ledger entry on or before its date was
+    written or changed (backdated, cancelled, unreconciled) after it was
+    taken; the report then reads the ledger instead. The check is a range
+    over the aqiq_company_party_type_modified index (see report_indexes)
+    covering only the entries changed since the snapshot.
+    """
+    snapshot = frappe.db.sql(
+        """
+        SELECT snapshot_date, creation
+        FROM `tabParty Outstanding Snapshot`
+        WHERE company = %s and party_type = %s and snapshot_date <= %s
+        ORDER BY snapshot_date DESC
+        LIMIT 1
+        """,
+        (company, party_type, getdate(report_date)),
+        as_dict=1,
+    )
+    if not snapshot:
+        return None
+
+    snapshot = snapshot[0]
+    changed = frappe.db.sql(
+        """
+        SELECT 1
+        FROM `tabPayment Ledger Entry`
+        WHERE company = %s and party_type = %s and modified > %s and posting_date <= %s
+        LIMIT 1
+        """,
+        (company, party_type, snapshot.creation, snapshot.snapshot_date),
+    )
+
+    return None if changed else snapshot.snapshot_date
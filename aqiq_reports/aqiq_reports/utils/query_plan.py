@@ -0,0 +1,90 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import add_months, cint, nowdate
+
+from aqiq_reports.aqiq_reports.utils.result_cache import uncached_results
+
+# full scans of tables smaller than this are not worth flagging
+MIN_SCAN_ROWS = 1000
+
+
+@contextmanager
+def capture_queries():
+    """Collect every query run through frappe.db.sql, with its values bound."""
+    queries = []
+    sql = frappe.db.sql
+
+    def capture(query, values=(), *args, **kwargs):
+        queries.append(frappe.db.mogrify(query, values))
+        return sql(query, values, *args, **kwargs)
+
+    frappe.db.sql = capture
+    try:
+        yield queries
+    finally:
+        frappe.db.sql = sql
+
+
+def get_sample_filters(company, from_date=None, to_date=None, party_type="Customer", party=None):
+    """Representative filters for each report of the app."""
+    to_date = to_date or nowdate()
+    from_date = from_date or add_months(to_date, -1)
+    dates = {"from_date": from_date, "to_date": to_date}
+    statement = dict(
+        dates,
+        company=company,
+        party_type=party_type,
+        party=[party] if party else [],
+        group_by="Group by Voucher (Consolidated)",
+    )
+
+    return {
+        "Customer Statement Details": statement,
+        "Statement Details": statement,
+        "Net Outstanding": dict(
+            company=company, party_type=party_type, party=party, to_date=to_date
+        ),
+        "Production Status": dates,
+        "Production Variance": dates,
+        "Withholding VAT Details": dates,
+    }
+
+
+def get_report_execute(report_name):
+    module = frappe.scrub(report_name)
+    return frappe.get_attr("aqiq_reports.aqiq_reports.report.{0}.{0}.execute".format(module))
+
+
+def explain_report(report_name, filters):
+    """Run a report and EXPLAIN every SELECT it issued.
+
+    Returns a list of {query, plan, full_scans}, where full_scans are the
+    plan rows reading a whole table of MIN_SCAN_ROWS rows or more.
+    """
+    execute = get_report_execute(report_name)
+
+    # a cached result would hide the queries
+    with uncached_results(), capture_queries() as queries:
+        execute(frappe._dict(filters))
+
+    results = []
+    for query in queries:
+        if not query.lstrip().lower().startswith("select"):
+            continue
+
+        plan = frappe.db.sql("EXPLAIN " + query, as_dict=1)
+        results.append(
+            frappe._dict(
+                query=query,
+                plan=plan,
+                full_scans=[
+                    d for d in plan if d.get("type") == "ALL" and cint(d.get("rows")) >= MIN_SCAN_ROWS
+                ],
+            )
+        )
+
+    return results
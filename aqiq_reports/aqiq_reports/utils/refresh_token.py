@@ -0,0 +1,147 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import base64
+import hashlib
+import hmac
+import json
+from datetime import timedelta
+
+import frappe
+from frappe.utils import cint, cstr, flt, get_datetime
+from frappe.utils.password import get_encryption_key
+
+AMOUNT_FIELDS = (
+    "debit",
+    "credit",
+    "debit_in_account_currency",
+    "credit_in_account_currency",
+)
+
+# filters that only affect presentation, not which ledger rows are shown
+IGNORED_FILTERS = ("chart_based_on", "refresh_token", "debug_performance")
+
+# a refresh reads the entries back to this long before the watermarks, so an
+# entry that commits after the token was issued with an earlier creation (a
+# long submit running alongside the statement) is not missed
+WATERMARK_OVERLAP_SEC = 300
+
+
+def make_refresh_token(filters_hash, creation, modified, seen, total, closing):
+    """Signed token a client sends back to refresh a statement incrementally.
+
+    Holds the ledger watermarks the statement was built at, the entries in
+    the overlap window before them ({name: is_cancelled}, see
+    get_party_watermark) and its period total and closing amounts.
+    """
+    payload = json.dumps(
+        {
+            "filters": filters_hash,
+            "creation": cstr(creation),
+            "modified": cstr(modified),
+            "seen": {name: cint(is_cancelled) for name, is_cancelled in seen.items()},
+            "total": {f: flt(total.get(f)) for f in AMOUNT_FIELDS},
+            "closing": {f: flt(closing.get(f)) for f in AMOUNT_FIELDS},
+        },
+        sort_keys=True,
+    )
+    return "{0}.{1}".format(
+        base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii"), sign(payload)
+    )
+
+
+def read_refresh_token(token, filters_hash):
+    """The token state, or None if it is malformed, tampered with or was
+    issued for other filters."""
+    try:
+        encoded, signature = cstr(token).rsplit(".", 1)
+        payload = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8")
+    except ValueError:
+        return None
+
+    if not hmac.compare_digest(sign(payload), signature):
+        return None
+
+    state = frappe._dict(json.loads(payload))
+    if state.filters != filters_hash or "seen" not in state:
+        return None
+
+    state.total = frappe._dict(state.total)
+    state.closing = frappe._dict(state.closing)
+    return state
+
+
+def sign(payload):
+    return hmac.new(
+        get_encryption_key().encode("utf-8"), payload.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+def get_filters_hash(filters):
+    """Hash of the statement filters as sent by the client."""
+    normalized = {}
+    for key, value in filters.items():
+        if key in IGNORED_FILTERS or value in (None, "", []):
+            continue
+
+        if key == "party":
+            value = frappe.parse_json(value)
+        normalized[key] = sorted(value) if isinstance(value, (list, tuple)) else cstr(value)
+
+    return hashlib.sha256(
+        json.dumps(normalized, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def get_party_watermark(company, party_type, parties):
+    """(creation, modified, seen): latest creation and modified of the
+    parties' GL Entries and the entries in the overlap window before them,
+    {name: is_cancelled}.
+
+    Cancelling an entry updates its modified, so the pair covers both new
+    and cancelled rows. A refresh reads the window again and tells the
+    entries the client already has by name.
+    """
+    values = {"company": company, "party_type": party_type, "parties": list(parties)}
+    # each maximum is a single seek at the end of its index, see report_indexes
+    creation, modified = frappe.db.sql(
+        """
+        select
+            (select max(creation) from `tabGL Entry`
+            where company = %(company)s and party_type = %(party_type)s
+                and party in %(parties)s),
+            (select max(modified) from `tabGL Entry`
+            where company = %(company)s and party_type = %(party_type)s
+                and party in %(parties)s)
+        """,
+        values,
+    )[0]
+    if not creation:
+        return None, None, {}
+
+    values.update(
+        since_creation=get_overlap_start(creation), since_modified=get_overlap_start(modified)
+    )
+    # two index ranges rather than one `or`, which would scan the parties' ledger
+    seen = frappe.db.sql(
+        """
+        select name, is_cancelled from `tabGL Entry`
+        where company = %(company)s and party_type = %(party_type)s and party in %(parties)s
+            and creation >= %(since_creation)s
+        union
+        select name, is_cancelled from `tabGL Entry`
+        where company = %(company)s and party_type = %(party_type)s and party in %(parties)s
+            and modified >= %(since_modified)s
+        """,
+        values,
+    )
+    return creation, modified, dict(seen)
+
+
+def get_overlap_start(watermark):
+    """Start of the overlap window before `watermark`; without a watermark
+    (no entries yet) the window is the whole ledger."""
+    if not watermark:
+        return get_datetime("1900-01-01")
+
+    return get_datetime(watermark) - timedelta(seconds=WATERMARK_OVERLAP_SEC)
@@ -0,0 +1,59 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import frappe
+
+# (doctype, fields, index name) for the access paths of the app's reports
+REPORT_INDEXES = (
+    # statement, ageing watermark and checkpoint queries
+    (
+        "GL Entry",
+        ("company", "party_type", "party", "is_cancelled", "posting_date"),
+        "aqiq_company_party_posting_date",
+    ),
+    # entries changed since a party's balance checkpoints, see
+    # checkpoints_match_ledger
+    (
+        "GL Entry",
+        ("company", "party_type", "party", "modified", "posting_date"),
+        "aqiq_company_party_modified",
+    ),
+    # entries created since a statement's refresh token, see get_party_watermark
+    (
+        "GL Entry",
+        ("company", "party_type", "party", "creation"),
+        "aqiq_company_party_creation",
+    ),
+    # Production Status
+    ("Job Card", ("posting_date", "work_order"), "aqiq_posting_date_work_order"),
+    # Withholding VAT Details and supplier statements
+    (
+        "Purchase Invoice",
+        ("docstatus", "posting_date", "supplier"),
+        "aqiq_docstatus_posting_date_supplier",
+    ),
+    # Net Outstanding snapshot lookup
+    (
+        "Party Outstanding Snapshot",
+        ("company", "party_type", "snapshot_date"),
+        "aqiq_company_party_type_snapshot_date",
+    ),
+    # entries changed since a snapshot was taken, read from the index alone
+    (
+        "Payment Ledger Entry",
+        ("company", "party_type", "modified", "posting_date"),
+        "aqiq_company_party_type_modified",
+    ),
+    # cached statement watermark, see get_ledger_watermark
+    (
+        "Payment Ledger Entry",
+        ("company", "party_type", "party", "modified"),
+        "aqiq_company_party_modified",
+    ),
+)
+
+
+def add_report_indexes():
+    """Create any missing report index. Safe to run repeatedly."""
+    for doctype, fields, index_name in REPORT_INDEXES:
+        frappe.db.add_index(doctype, list(fields), index_name)
@@ -0,0 +1,223 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import functools
+import os
+import random
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import frappe
+from frappe import _
+from frappe.utils import escape_html, flt
+
+from aqiq_reports.aqiq_reports.utils.result_cache import uncached_results
+
+# report filter asking for the stage timings along with the result
+DEBUG_FILTER = "debug_performance"
+# site config: share of report runs, from 0 to 1, logged without the filter
+SAMPLE_RATE_KEY = "report_performance_sample_rate"
+MAX_FILTERS_LENGTH = 2000
+
+# report module -> report name, per worker
+_report_names = {}
+
+
+class ReportProfiler:
+    """Wall time, query count, query time and rows fetched per stage of a
+    report run.
+
+    Stages nest: a query counts towards every stage open while it runs, so
+    the outermost stage holds the totals of the run.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.open_stages = []
+        self._sql = None
+
+    def start(self):
+        self._sql = frappe.db.sql
+        frappe.db.sql = self.sql
+
+    def stop(self):
+        if self._sql:
+            frappe.db.sql = self._sql
+            self._sql = None
+
+    def sql(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self._sql(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        rows = len(result) if isinstance(result, (list, tuple)) else 0
+        for name in self.open_stages:
+            stats = self.stages[name]
+            stats.queries += 1
+            stats.query_seconds += seconds
+            stats.rows += rows
+
+        return result
+
+    @contextmanager
+    def stage(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = frappe._dict(
+                stage=name, calls=0, seconds=0.0, queries=0, query_seconds=0.0, rows=0
+            )
+        stats.calls += 1
+
+        # a recursive call is already covered by its outer call
+        if name in self.open_stages:
+            yield
+            return
+
+        self.open_stages.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.seconds += time.perf_counter() - start
+            self.open_stages.remove(name)
+
+    def get_stages(self):
+        return [
+            dict(
+                stats,
+                seconds=round(stats.seconds, 4),
+                query_seconds=round(stats.query_seconds, 4),
+            )
+            for stats in self.stages.values()
+        ]
+
+
+def profile_stage(fn):
+    """Record the calls of `fn` as a stage of the report run being profiled,
+    if any."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = frappe.flags.report_profiler
+        if not profiler:
+            return fn(*args, **kwargs)
+
+        with profiler.stage(fn.__name__):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def profile_report(execute):
+    """Profile a report's execute() when its debug filter is set, or for the
+    sampled share of runs, and log the result.
+
+    With the debug filter the run skips the result cache and the stage
+    timings are added to the report message.
+    """
+
+    @functools.wraps(execute)
+    def wrapper(filters=None):
+        debug = is_debug(filters)
+        if frappe.flags.report_profiler or not (debug or is_sampled()):
+            return execute(filters)
+
+        profiler = frappe.flags.report_profiler = ReportProfiler()
+        profiler.start()
+        try:
+            if debug:
+                with uncached_results(), profiler.stage("execute"):
+                    result = execute(filters)
+            else:
+                with profiler.stage("execute"):
+                    result = execute(filters)
+        finally:
+            profiler.stop()
+            frappe.flags.report_profiler = None
+
+        save_log(get_report_name(execute.__module__), filters, profiler, result, debug)
+        if debug:
+            result = add_performance_message(result, profiler)
+
+        return result
+
+    return wrapper
+
+
+def is_debug(filters):
+    return bool(filters and filters.get(DEBUG_FILTER)) and "System Manager" in frappe.get_roles()
+
+
+def is_sampled():
+    rate = flt(frappe.conf.get(SAMPLE_RATE_KEY))
+    return rate > 0 and random.random() < rate
+
+
+def get_report_name(module):
+    """Name of the report whose script is `module`, from the report json
+    next to it."""
+    if module not in _report_names:
+        path = sys.modules[module].__file__
+        report = frappe.get_file_json(os.path.splitext(path)[0] + ".json")
+        _report_names[module] = report.get("name")
+
+    return _report_names[module]
+
+
+def save_log(report_name, filters, profiler, result, debug=False):
+    """Queue a Report Performance Log; the scheduler writes the queue to the
+    database in bulk, so logging adds no insert to the report run."""
+    from frappe.deferred_insert import deferred_insert
+
+    total = profiler.stages["execute"]
+    filters = {k: v for k, v in (filters or {}).items() if k != DEBUG_FILTER}
+    data = result[1] if result and len(result) > 1 else []
+
+    try:
+        deferred_insert(
+            "Report Performance Log",
+            [
+                {
+                    "report": report_name,
+                    "user": frappe.session.user,
+                    "source": "Debug Filter" if debug else "Sampling",
+                    "total_seconds": round(total.seconds, 4),
+                    "query_count": total.queries,
+                    "query_seconds": round(total.query_seconds, 4),
+                    "rows_fetched": total.rows,
+                    "result_rows": len(data or []),
+                    "filters": frappe.as_json(filters)[:MAX_FILTERS_LENGTH],
+                    "stages": frappe.as_json(profiler.get_stages()),
+                }
+            ],
+        )
+    except Exception:
+        # the report result matters more than its log
+        frappe.log_error(title=_("Report Performance Log"))
+
+
+def add_performance_message(result, profiler):
+    """The report result with a table of its stages appended to the message."""
+    result = list(result)
+    while len(result) < 3:
+        result.append(None)
+
+    rows = "".join(
+        "<tr><td>{0}</td><td>{1}</td><td>{2:.3f}</td><td>{3}</td><td>{4:.3f}</td><td>{5}</td></tr>".format(
+            escape_html(d["stage"]), d["calls"], d["seconds"], d["queries"], d["query_seconds"], d["rows"]
+        )
+        for d in profiler.get_stages()
+    )
+    table = """
+        <table class="table table-bordered table-sm" style="font-size:11px">
+            <tr><th>{0}</th><th>{1}</th><th>{2}</th><th>{3}</th><th>{4}</th><th>{5}</th></tr>
+            {6}
+        </table>
+        """.format(
+        _("Stage"), _("Calls"), _("Seconds"), _("Queries"), _("Query Seconds"), _("Rows Fetched"), rows
+    )
+
+    result[2] = (result[2] or "") + table
+    return tuple(result)
@@ -0,0 +1,309 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cstr, nowdate
+
+CACHE_PREFIX = "aqiq_reports:report_result:"
+# sorted set of cached result keys scored by last access, used for eviction
+LRU_KEY = "aqiq_reports:report_result_lru"
+TAG_PREFIX = "aqiq_reports:report_result_tag:"
+# tag of every cached statement, dropped when a statement header changes;
+# suffixed with the company for the statements of one company
+HEADER_TAG = "statement_header"
+
+MAX_ENTRIES = 200
+EXPIRES_IN_SEC = 6 * 60 * 60
+# results bigger than this are not worth pickling into redis
+MAX_ROWS = 20000
+
+# filters that change how a report runs, not what it returns
+IGNORED_FILTERS = ("refresh_token", "debug_performance")
+
+
+class RedisResultCache:
+    """Report results in the site redis cache with size-bounded LRU eviction."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, expires_in_sec=EXPIRES_IN_SEC):
+        self.max_entries = max_entries
+        self.expires_in_sec = expires_in_sec
+
+    def get(self, key):
+        cache = frappe.cache()
+        value = cache.get_value(CACHE_PREFIX + key)
+        if value is not None:
+            cache.zadd(cache.make_key(LRU_KEY), {key: time.time()})
+        return value
+
+    def set(self, key, value, tags=()):
+        cache = frappe.cache()
+        cache.set_value(CACHE_PREFIX + key, value, expires_in_sec=self.expires_in_sec)
+        cache.zadd(cache.make_key(LRU_KEY), {key: time.time()})
+        for tag in tags:
+            cache.sadd(TAG_PREFIX + tag, key)
+            # a tag outlives its entries by at most one entry lifetime
+            cache.expire(cache.make_key(TAG_PREFIX + tag), self.expires_in_sec)
+
+        self.evict()
+
+    def evict(self):
+        cache = frappe.cache()
+        lru_key = cache.make_key(LRU_KEY)
+        overflow = cache.zcard(lru_key) - self.max_entries
+        if overflow > 0:
+            keys = [frappe.safe_decode(k) for k in cache.zrange(lru_key, 0, overflow - 1)]
+            self.delete(keys)
+
+    def delete(self, keys):
+        if not keys:
+            return
+
+        cache = frappe.cache()
+        cache.delete_value([CACHE_PREFIX + key for key in keys])
+        cache.zrem(cache.make_key(LRU_KEY), *keys)
+
+    def invalidate(self, tag):
+        cache = frappe.cache()
+        keys = [frappe.safe_decode(k) for k in cache.smembers(TAG_PREFIX + tag)]
+        self.delete(keys)
+        cache.delete_value(TAG_PREFIX + tag)
+
+
+class LocalResultCache:
+    """In-process stand-in for RedisResultCache, used in tests."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.tags = {}
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def set(self, key, value, tags=()):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, tag):
+        for key in self.tags.pop(tag, ()):
+            self.entries.pop(key, None)
+
+
+def get_result_cache():
+    if frappe.flags.report_result_cache is None:
+        frappe.flags.report_result_cache = (
+            LocalResultCache() if frappe.flags.in_test else RedisResultCache()
+        )
+
+    return frappe.flags.report_result_cache
+
+
+@contextmanager
+def uncached_results():
+    """Run reports against an empty result cache, so they do the full work."""
+    cache, frappe.flags.report_result_cache = frappe.flags.report_result_cache, LocalResultCache()
+    try:
+        yield
+    finally:
+        frappe.flags.report_result_cache = cache
+
+
+def get_cached_report_result(namespace, filters, generator):
+    """Return `generator(filters)`, cached on the normalized filters and the
+    ledger watermark of the filtered parties.
+
+    Only party statements are cached. The watermark follows everything a
+    statement shows for its parties: GL and Payment Ledger Entries, post
+    dated cheques and the party and its primary address. Posting a GL Entry
+    for a party also drops its cached results right away, and changing a
+    statement header (see clear_statement_header_cache) drops the statements
+    showing it.
+    """
+    filters = frappe._dict(filters)
+    parties = get_parties(filters)
+    if not (filters.get("company") and filters.get("party_type") and parties):
+        return generator(filters)
+
+    cache = get_result_cache()
+    watermark = get_ledger_watermark(filters.company, filters.party_type, parties)
+    key = get_cache_key(namespace, filters, watermark, parties)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    result = generator(filters)
+
+    data = result[1] if len(result) > 1 else []
+    if len(data) <= MAX_ROWS:
+        tags = [get_party_tag(filters.company, filters.party_type, party) for party in parties]
+        cache.set(key, result, tags + [HEADER_TAG, get_header_tag(filters.company)])
+
+    return result
+
+
+def get_cached_company_result(namespace, filters, generator):
+    """Return `generator(filters)`, cached on the normalized filters and the
+    Payment Ledger watermark of the party type, for reports over all parties
+    of a party type in a company.
+
+    Reconciling, unreconciling or cancelling changes Payment Ledger Entries
+    without always posting a GL Entry, so the key follows the Payment Ledger
+    itself; posting a GL Entry of the party type still drops the results
+    right away.
+    """
+    filters = frappe._dict(filters)
+    if not (filters.get("company") and filters.get("party_type")):
+        return generator(filters)
+
+    cache = get_result_cache()
+    watermark = get_payment_ledger_watermark(filters.company, filters.party_type)
+    key = get_cache_key(namespace, filters, watermark)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    result = generator(filters)
+
+    data = result[1] if len(result) > 1 else []
+    if len(data) <= MAX_ROWS:
+        cache.set(key, result, [get_company_tag(filters.company, filters.party_type)])
+
+    return result
+
+
+def get_cache_key(namespace, filters, watermark, parties=None):
+    normalized = {
+        key: sorted(value) if isinstance(value, (list, tuple)) else cstr(value)
+        for key, value in filters.items()
+        if key not in IGNORED_FILTERS and value not in (None, "", [])
+    }
+    if parties:
+        normalized["party"] = sorted(parties)
+
+    key = json.dumps(
+        {
+            "namespace": namespace,
+            "filters": normalized,
+            "watermark": watermark,
+            "date": nowdate(),
+            "lang": frappe.local.lang,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def get_parties(filters):
+    party = filters.get("party")
+    if not party:
+        return []
+
+    party = frappe.parse_json(party)
+    return [party] if isinstance(party, str) else list(party)
+
+
+def get_ledger_watermark(company, party_type, parties):
+    values = {"company": company, "party_type": party_type, "parties": parties}
+    # each served by a company, party_type, party, modified index (see report_indexes)
+    watermark = frappe.db.sql(
+        """ select gle.modified, gle.entries, ple.modified
+        from (
+            select max(modified) as modified, count(*) as entries from `tabGL Entry`
+            where company = %(company)s and party_type = %(party_type)s
+                and party in %(parties)s
+        ) gle, (
+            select max(modified) as modified from `tabPayment Ledger Entry`
+            where company = %(company)s and party_type = %(party_type)s
+                and party in %(parties)s
+        ) ple """,
+        values,
+    )
+    watermark = [cstr(d) for d in watermark[0]] if watermark else []
+
+    return watermark + get_party_details_watermark(party_type, parties)
+
+
+def get_party_details_watermark(party_type, parties):
+    """Latest change to the parties, their primary addresses and their post
+    dated cheques, the details a statement shows besides its ledger."""
+    if party_type not in ("Customer", "Supplier"):
+        return []
+
+    scrubbed = frappe.scrub(party_type)
+    watermark = frappe.db.sql(
+        """ select max(p.modified), max(a.modified)
+        from `tab{party_type}` p
+        left join `tabAddress` a on a.name = p.{scrubbed}_primary_address
+        where p.name in %(parties)s """.format(party_type=party_type, scrubbed=scrubbed),
+        {"parties": parties},
+    )
+    watermark = [cstr(d) for d in watermark[0]] if watermark else []
+
+    if frappe.db.table_exists("Posted Dated Cheques"):
+        cheques = frappe.db.sql(
+            """ select max(modified) from `tabPosted Dated Cheques`
+            where party_type = %(party_type)s and party in %(parties)s """,
+            {"party_type": party_type, "parties": parties},
+        )
+        watermark.append(cstr(cheques[0][0]) if cheques else "")
+
+    return watermark
+
+
+def get_payment_ledger_watermark(company, party_type):
+    """Latest modified of the party type's Payment Ledger Entries.
+
+    A single lookup at the end of the aqiq_company_party_type_modified index
+    (see report_indexes) rather than a count over the whole ledger. Entries
+    are delinked rather than deleted, which updates their modified; a
+    cancelled voucher also posts reverse GL Entries, which drop the results
+    through invalidate_party_results.
+    """
+    watermark = frappe.db.sql(
+        """ select max(modified) from `tabPayment Ledger Entry`
+        where company = %(company)s and party_type = %(party_type)s """,
+        {"company": company, "party_type": party_type},
+    )
+    return cstr(watermark[0][0]) if watermark else ""
+
+
+def get_party_tag(company, party_type, party):
+    return "::".join([company, party_type, party])
+
+
+def get_company_tag(company, party_type):
+    return "::".join([company, party_type])
+
+
+def get_header_tag(company):
+    return "::".join([HEADER_TAG, company])
+
+
+def invalidate_header_results(company=None):
+    """Drop the cached statements of `company`, or of every company, for
+    clear_statement_header_cache."""
+    get_result_cache().invalidate(get_header_tag(company) if company else HEADER_TAG)
+
+
+def invalidate_party_results(doc, method=None):
+    """doc_events hook for GL Entry on_submit."""
+    if doc.party_type and doc.party:
+        cache = get_result_cache()
+        cache.invalidate(get_party_tag(doc.company, doc.party_type, doc.party))
+        cache.invalidate(get_company_tag(doc.company, doc.party_type))
@@ -0,0 +1,200 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import calendar
+import copy
+
+import frappe
+from frappe.utils import add_months, cint, flt, get_first_day, get_last_day, getdate
+
+from erpnext.accounts.utils import get_fiscal_year
+
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_stage
+
+PARTY_FIELDS = {
+    "Customer": ("Sales Invoice", "customer"),
+    "Supplier": ("Purchase Invoice", "supplier"),
+}
+
+
+def get_statement_chart(filters, parties=None):
+    """Monthly Sales / Return / Payment chart for a statement.
+
+    All three series come from a single query using conditional aggregation
+    grouped by year and month over a sargable posting_date range. The chart
+    covers the calendar (or fiscal) year of `to_date` and extends back to
+    `from_date` when the statement spans several years.
+    """
+    chart_start, chart_end = get_chart_period(filters)
+    values = get_monthly_totals(filters, parties, chart_start, chart_end)
+
+    return make_chart(chart_start, chart_end, values)
+
+
+@profile_stage
+def get_statement_charts(filters, parties):
+    """Per party charts for `parties`, from the same single query."""
+    chart_start, chart_end = get_chart_period(filters)
+    values = get_monthly_totals(filters, parties, chart_start, chart_end, by_party=True)
+
+    party_values = {}
+    for (party, year, month), row in values.items():
+        party_values.setdefault(party, {})[(year, month)] = row
+
+    return {
+        party: make_chart(chart_start, chart_end, party_values.get(party, {}))
+        for party in parties
+    }
+
+
+def merge_charts(charts):
+    """Sum per party charts from `get_statement_charts` into one chart."""
+    chart = None
+    for party_chart in charts:
+        if chart is None:
+            chart = copy.deepcopy(party_chart)
+            continue
+
+        for dataset, party_dataset in zip(
+            chart["data"]["datasets"], party_chart["data"]["datasets"]
+        ):
+            dataset["values"] = [a + b for a, b in zip(dataset["values"], party_dataset["values"])]
+
+    return chart
+
+
+def make_chart(chart_start, chart_end, values):
+    multi_year = chart_start.year != chart_end.year
+
+    labels, sales, returns, payments = [], [], [], []
+    for year, month in get_months(chart_start, chart_end):
+        row = values.get((year, month)) or {}
+        if multi_year:
+            labels.append("{0} {1}".format(calendar.month_abbr[month], year))
+        else:
+            labels.append(calendar.month_name[month])
+
+        sales.append(flt(row.get("sales")))
+        returns.append(abs(flt(row.get("sales_return"))))
+        payments.append(flt(row.get("payment")))
+
+    return {
+        "data": {
+            "labels": labels,
+            "datasets": [
+                {"name": "Sales", "values": sales},
+                {"name": "Return", "values": returns},
+                {"name": "Payment", "values": payments},
+            ],
+        },
+        "type": "bar",
+        "colors": ["#456789", "#EE8888", "#7E77BF"],
+    }
+
+
+def get_chart_period(filters):
+    to_date = getdate(filters.get("to_date"))
+
+    if filters.get("chart_based_on") == "Fiscal Year":
+        period_start, period_end = get_fiscal_year(to_date, company=filters.get("company"))[1:3]
+    else:
+        period_start, period_end = to_date.replace(month=1, day=1), to_date.replace(month=12, day=31)
+
+    if filters.get("from_date"):
+        period_start = min(period_start, get_first_day(filters.get("from_date")))
+
+    return getdate(period_start), getdate(get_last_day(period_end))
+
+
+def get_months(start, end):
+    months = []
+    current = get_first_day(start)
+    while current <= end:
+        months.append((current.year, current.month))
+        current = add_months(current, 1)
+
+    return months
+
+
+def get_monthly_totals(filters, parties, chart_start, chart_end, by_party=False):
+    from_date = max(chart_start, getdate(filters.get("from_date") or chart_start))
+    to_date = min(chart_end, getdate(filters.get("to_date") or chart_end))
+    if from_date > to_date:
+        return {}
+
+    party_type = filters.get("party_type")
+    doctype, party_field = PARTY_FIELDS.get(party_type, PARTY_FIELDS["Customer"])
+
+    values = {
+        "from_date": from_date,
+        "to_date": to_date,
+        "party_type": party_type,
+        "party": list(parties or []),
+    }
+
+    invoice_conditions = payment_conditions = ""
+    if party_type in PARTY_FIELDS and values["party"]:
+        invoice_conditions = "and {0} in %(party)s".format(party_field)
+        payment_conditions = "and party_type = %(party_type)s and party in %(party)s"
+
+    invoice_party = payment_party = "''"
+    invoice_group = payment_group = ""
+    if by_party:
+        invoice_party, payment_party = party_field, "party"
+        invoice_group, payment_group = party_field + ", ", "party, "
+
+    data = frappe.db.sql(
+        """
+        SELECT
+            party, year, month,
+            sum(sales) as sales,
+            sum(sales_return) as sales_return,
+            sum(payment) as payment
+        FROM (
+            SELECT
+                {invoice_party} as party,
+                YEAR(posting_date) as year,
+                MONTH(posting_date) as month,
+                sum(case when is_return = 0 then grand_total else 0 end) as sales,
+                sum(case when is_return = 1 then grand_total else 0 end) as sales_return,
+                0 as payment
+            FROM `tab{doctype}`
+            WHERE docstatus = 1
+                and posting_date >= %(from_date)s and posting_date <= %(to_date)s
+                {invoice_conditions}
+            GROUP BY {invoice_group}YEAR(posting_date), MONTH(posting_date)
+
+            UNION ALL
+
+            SELECT
+                {payment_party} as party,
+                YEAR(posting_date) as year,
+                MONTH(posting_date) as month,
+                0 as sales,
+                0 as sales_return,
+                sum(paid_amount) as payment
+            FROM `tabPayment Entry`
+            WHERE docstatus = 1
+                and posting_date >= %(from_date)s and posting_date <= %(to_date)s
+                {payment_conditions}
+            GROUP BY {payment_group}YEAR(posting_date), MONTH(posting_date)
+        ) monthly
+        GROUP BY party, year, month
+        ORDER BY party, year, month
+        """.format(
+            doctype=doctype,
+            invoice_party=invoice_party,
+            payment_party=payment_party,
+            invoice_group=invoice_group,
+            payment_group=payment_group,
+            invoice_conditions=invoice_conditions,
+            payment_conditions=payment_conditions,
+        ),
+        values,
+        as_dict=1,
+    )
+
+    if by_party:
+        return {(d.party, cint(d.year), cint(d.month)): d for d in data}
+
+    return {(cint(d.year), cint(d.month)): d for d in data}
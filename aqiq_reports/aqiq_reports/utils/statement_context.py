@@ -0,0 +1,117 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+from frappe.utils import cint
+
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_stage
+
+
+@profile_stage
+def get_statement_context(filters, parties, concurrent=None):
+    """Per-party statement metadata in two queries.
+
+    Returns a dict with `party_details` (name, currency, primary address and
+    returns total for the period) and `cheques` (pending post dated cheques),
+    both keyed by party. `parties` must already be parsed.
+
+    With `concurrent` (defaults to the `statement_context_concurrent` site
+    config) the two queries run at the same time on separate connections.
+    """
+    parties = list(parties or [])
+    if concurrent is None:
+        concurrent = cint(frappe.conf.get("statement_context_concurrent"))
+
+    if concurrent and parties:
+        party_details, cheques = run_concurrently(
+            (get_party_summaries, filters, parties),
+            (get_pd_cheques_by_party, filters, parties),
+        )
+    else:
+        party_details = get_party_summaries(filters, parties)
+        cheques = get_pd_cheques_by_party(filters, parties)
+
+    return frappe._dict(party_details=party_details, cheques=cheques)
+
+
+def get_party_summaries(filters, parties):
+    """Name, currency, primary address and returns total of `parties`."""
+    party_type = filters.get("party_type")
+    if party_type not in ("Customer", "Supplier") or not parties:
+        return {}
+
+    scrubbed = frappe.scrub(party_type)
+    invoice_doctype = "Sales Invoice" if party_type == "Customer" else "Purchase Invoice"
+    return {
+        d.party: d
+        for d in frappe.db.sql(
+            """
+            SELECT
+                p.name as party, p.name as party_name, p.default_currency,
+                a.name as address, a.email_id, a.address_line1, a.city, a.country, a.pincode,
+                ifnull(r.total_return, 0) as total_return
+            FROM `tab{party_type}` p
+            LEFT JOIN `tabAddress` a ON a.name = p.{scrubbed}_primary_address
+            LEFT JOIN (
+                SELECT {scrubbed} as party, sum(grand_total) as total_return
+                FROM `tab{invoice_doctype}`
+                WHERE docstatus = 1 and is_return = 1
+                    and {scrubbed} in %(parties)s
+                    and posting_date >= %(from_date)s and posting_date <= %(to_date)s
+                GROUP BY {scrubbed}
+            ) r ON r.party = p.name
+            WHERE p.name in %(parties)s
+            """.format(
+                party_type=party_type, scrubbed=scrubbed, invoice_doctype=invoice_doctype
+            ),
+            {"parties": parties, "from_date": filters.from_date, "to_date": filters.to_date},
+            as_dict=1,
+        )
+    }
+
+
+def get_pd_cheques_by_party(filters, parties):
+    """Pending post dated cheques per party, in one query."""
+    cheques = {}
+    if not (filters.get("party_type") and parties):
+        return cheques
+
+    try:
+        for d in frappe.db.sql(
+            """
+            SELECT party, name as pd_cheque_name, DATE_FORMAT(posting_date, "%%d/%%m/%%Y") as pd_posting_date,
+            reference_no as pd_reference_no,
+            DATE_FORMAT(reference_date, "%%d/%%m/%%Y") as pd_reference_date,
+            base_amount as p_paid_amount
+            FROM `tabPosted Dated Cheques`
+            WHERE docstatus=1 AND status='Pending' AND party_type = %(party_type)s AND party in %(parties)s
+            ORDER BY reference_date
+            """,
+            {"party_type": filters.get("party_type"), "parties": list(parties)},
+            as_dict=1,
+        ):
+            cheques.setdefault(d.pop("party"), []).append(d)
+    except Exception as e:
+        frappe.log_error(f"Error fetching posted dated cheques: {str(e)}", "Get PD Cheque Detail")
+
+    return cheques
+
+
+def run_concurrently(*calls):
+    """Run each (fn, *args) in its own thread and database connection and
+    return the results in order."""
+    site, sites_path = frappe.local.site, frappe.local.sites_path
+
+    def run(call):
+        fn, args = call[0], call[1:]
+        frappe.init(site=site, sites_path=sites_path)
+        try:
+            frappe.connect()
+            return fn(*args)
+        finally:
+            frappe.destroy()
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        return list(executor.map(run, calls))
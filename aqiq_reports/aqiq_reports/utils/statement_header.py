@@ -0,0 +1,172 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+from collections import OrderedDict
+
+import frappe
+from frappe import _
+from frappe.utils import cstr, getdate, nowdate
+
+from aqiq_reports.aqiq_reports.utils.result_cache import invalidate_header_results
+
+CACHE_PREFIX = "aqiq_reports:statement_header:"
+EXPIRES_IN_SEC = 24 * 60 * 60
+DEFAULT_LETTER_HEAD = "__default__"
+
+# (letter head, modified) -> compiled jinja template, least recently used
+# first, per worker
+_templates = OrderedDict()
+MAX_TEMPLATES = 32
+
+HEADER_HTML = """
+        <div id="header-html" class="margin-top-15" style="margin-top:-20px !important; width:92.2%; margin-left:15px !important">
+            <div class="row">
+                <div class="col-xs-10" style="width:100%; float:left; border:1px solid black">
+                    {header_updated}
+                    <table class="table table-sm" style="width:28%; font-size:10px">
+                        <tr>
+                            <td colspan="2"><center><span><b style="font-size:11px">{party_type} Statement</b></span></center></td>
+                        </tr>
+                        <tr>
+                            <td colspan="2"><center><span><b style="font-size:11px">Date {today_date}</b></span></center></td>
+                        </tr>
+                    </table>
+                </div>
+            </div>
+        </div>
+        """
+
+
+def get_statement_header(company, party_type, letter_head=None):
+    """Statement header html for `company`, rendered once a day.
+
+    Cached per (company, letter head, party type, date) until the Letter
+    Head, Company or Address changes. A failed render shows no header and is
+    not cached, so the next statement tries again.
+    """
+    date = nowdate()
+    key = "{0}{1}::{2}::{3}::{4}".format(
+        CACHE_PREFIX, company, letter_head or DEFAULT_LETTER_HEAD, party_type or "", date
+    )
+
+    header = frappe.cache().get_value(key)
+    if header is None:
+        header = render_statement_header(company, party_type, letter_head, date)
+        if header is None:
+            return ""
+
+        frappe.cache().set_value(key, header, expires_in_sec=EXPIRES_IN_SEC)
+
+    return header
+
+
+def render_statement_header(company, party_type, letter_head=None, date=None):
+    """Header html, or None when it could not be rendered."""
+    try:
+        fields = ["name", "modified", "content"]
+        if letter_head:
+            letter_head = frappe.db.get_value("Letter Head", letter_head, fields, as_dict=1)
+        else:
+            letter_head = frappe.db.get_value("Letter Head", {"is_default": 1}, fields, as_dict=1)
+
+        return HEADER_HTML.format(
+            header_updated=get_template(letter_head).render(get_header_data(company)),
+            party_type=party_type or "",
+            today_date=getdate(date).strftime("%d-%m-%Y"),
+        )
+
+    except Exception as e:
+        frappe.log_error(f"Error in get_header: {str(e)}")
+        return None
+
+
+def get_template(letter_head):
+    """Compiled template of `letter_head` (name, modified, content); an edit
+    changes its modified, so stale templates are never used and age out."""
+    key = (letter_head.name, cstr(letter_head.modified)) if letter_head else None
+    if key in _templates:
+        _templates.move_to_end(key)
+        return _templates[key]
+
+    content = (letter_head and letter_head.content) or ""
+    if ".__" in content:
+        frappe.throw(_("Illegal template"))
+
+    _templates[key] = frappe.get_jenv().from_string(content)
+    while len(_templates) > MAX_TEMPLATES:
+        _templates.popitem(last=False)
+
+    return _templates[key]
+
+
+def get_header_data(company):
+    company_details = (
+        frappe.db.get_value(
+            "Company",
+            company,
+            ["company_name", "phone_no", "email", "tax_id", "company_logo", "website"],
+            as_dict=1,
+        )
+        or {}
+    )
+
+    company_address = {}
+    company_address_name = frappe.db.get_value(
+        "Dynamic Link",
+        {"link_doctype": "Company", "link_name": company, "parenttype": "Address"},
+        "parent",
+    )
+    if company_address_name:
+        company_address = (
+            frappe.db.get_value(
+                "Address",
+                company_address_name,
+                ["address_line1", "address_title", "city", "country", "state", "email_id", "phone"],
+                as_dict=1,
+            )
+            or {}
+        )
+
+    return {
+        "company": company_details.get("company_name", ""),
+        "company_address": company_address.get("address_line1", ""),
+        "city": company_address.get("city", ""),
+        "country": company_address.get("country", ""),
+        "state": company_address.get("state", ""),
+        "phone_no": company_address.get("phone") or company_details.get("phone_no", ""),
+        "email": company_details.get("email", ""),
+        "pin_no": company_details.get("tax_id", ""),
+        "company_logo": company_details.get("company_logo", ""),
+        "website": company_details.get("website", ""),
+    }
+
+
+def clear_statement_header_cache(doc=None, method=None, *args, **kwargs):
+    """doc_events hook for Letter Head, Company and Address changes.
+
+    A letter head may be any company's default, so it clears every header;
+    a Company or Address only the headers of the companies it belongs to.
+    """
+    if doc is None or doc.doctype == "Letter Head":
+        frappe.cache().delete_keys(CACHE_PREFIX)
+        invalidate_header_results()
+        return
+
+    for company in get_header_companies(doc):
+        frappe.cache().delete_keys("{0}{1}::".format(CACHE_PREFIX, company))
+        invalidate_header_results(company)
+
+
+def get_header_companies(doc):
+    """Companies whose header shows `doc`: the Company itself, or the
+    companies an Address is or was linked to (see get_header_data)."""
+    if doc.doctype == "Company":
+        return {doc.name}
+
+    companies = set()
+    for address in (doc, doc.get_doc_before_save()):
+        for link in (address and address.get("links")) or []:
+            if link.link_doctype == "Company":
+                companies.add(link.link_name)
+
+    return companies
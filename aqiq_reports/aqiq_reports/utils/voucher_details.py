@@ -0,0 +1,58 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import frappe
+
+from aqiq_reports.aqiq_reports.utils.report_profiler import profile_stage
+
+# fields shown on statement rows, per voucher type
+VOUCHER_FIELDS = {
+    "Sales Invoice": ["lisec_inv_no"],
+    "Payment Entry": ["reference_no", "reference_date", "mode_of_payment"],
+}
+
+# keep IN lists well below max_allowed_packet on very large statements
+CHUNK_SIZE = 1000
+
+
+@profile_stage
+def get_voucher_details(rows):
+    """Prefetch the voucher fields used on statement rows.
+
+    Returns {voucher_type: {voucher_no: row}} resolved with one IN query per
+    voucher type (per chunk), instead of a lookup per statement row.
+    """
+    voucher_nos = {}
+    for d in rows:
+        voucher_type = d.get("voucher_type")
+        if voucher_type in VOUCHER_FIELDS and d.get("voucher_no"):
+            voucher_nos.setdefault(voucher_type, set()).add(d.get("voucher_no"))
+
+    details = {voucher_type: {} for voucher_type in VOUCHER_FIELDS}
+    for voucher_type, names in voucher_nos.items():
+        fields = [
+            f for f in VOUCHER_FIELDS[voucher_type] if frappe.db.has_column(voucher_type, f)
+        ]
+        if not fields:
+            continue
+
+        details[voucher_type] = get_values_in_chunks(voucher_type, names, fields)
+
+    return details
+
+
+def get_values_in_chunks(doctype, names, fields):
+    values = {}
+    names = list(names)
+    select_fields = ", ".join("`{0}`".format(f) for f in fields)
+
+    for i in range(0, len(names), CHUNK_SIZE):
+        for d in frappe.db.sql(
+            """ select name, {fields} from `tab{doctype}`
+            where name in %(names)s """.format(fields=select_fields, doctype=doctype),
+            {"names": names[i : i + CHUNK_SIZE]},
+            as_dict=1,
+        ):
+            values[d.name] = d
+
+    return values
@@ -0,0 +1,180 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+"""Memory and time of the statement row types on a company level
+"Group by Party" run, without a database.
+
+    bench --site <site> execute aqiq_reports.benchmarks.ledger_rows.run --kwargs "{'rows': 500000}"
+"""
+
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import frappe
+
+from aqiq_reports.aqiq_reports.utils.ledger_row import (
+    GroupTotals,
+    LedgerRow,
+    as_report_rows,
+)
+
+COLUMNS = (
+    "gl_entry",
+    "posting_date",
+    "account",
+    "party_type",
+    "party",
+    "voucher_type",
+    "voucher_no",
+    "cost_center",
+    "project",
+    "against_voucher_type",
+    "against_voucher",
+    "account_currency",
+    "remarks",
+    "against",
+    "is_opening",
+    "creation",
+    "debit",
+    "credit",
+    "debit_in_account_currency",
+    "credit_in_account_currency",
+)
+
+
+def run(rows=500000, parties=5000, seed=0):
+    """Print and return the peak memory (MB) and time (s) of both row types.
+
+    Times are taken under tracemalloc, so they are slower than a plain run
+    but comparable with each other."""
+    values = list(make_values(rows, parties, seed))
+
+    results = {
+        "dict": measure(values, make_dict_row, get_dict_totals, lambda data: data),
+        "slots": measure(values, LedgerRow.from_values, get_slot_totals, as_report_rows),
+    }
+    for name, result in results.items():
+        print(
+            "{0:6} pipeline peak {1:8.1f} MB  peak {2:8.1f} MB  time {3:6.2f} s".format(
+                name, result.pipeline_peak_mb, result.peak_mb, result.seconds
+            )
+        )
+
+    return results
+
+
+def make_values(rows, parties, seed):
+    rng = random.Random(seed)
+    start = date(2023, 1, 1)
+    for i in range(rows):
+        amount = round(rng.uniform(1, 10000), 2)
+        debit = amount if i % 3 else 0.0
+        credit = 0.0 if i % 3 else amount
+        yield (
+            "GLE-{0}".format(i),
+            start + timedelta(days=i % 365),
+            "Debtors - C",
+            "Customer",
+            "CUST-{0:05d}".format(rng.randrange(parties)),
+            "Sales Invoice",
+            "SINV-{0}".format(i // 2),
+            "Main - C",
+            None,
+            "Sales Invoice",
+            "SINV-{0}".format(i // 2),
+            "KES",
+            "",
+            "Sales - C",
+            "No",
+            start,
+            debit,
+            credit,
+            debit,
+            credit,
+        )
+
+
+def make_dict_row(columns, values):
+    return frappe._dict(zip(columns, values))
+
+
+def get_dict_totals():
+    def _get_debit_credit_dict(label):
+        return frappe._dict(
+            voucher_type="'{0}'".format(label),
+            debit=0.0,
+            credit=0.0,
+            debit_in_account_currency=0.0,
+            credit_in_account_currency=0.0,
+        )
+
+    return frappe._dict(
+        opening=_get_debit_credit_dict("Opening"),
+        total=_get_debit_credit_dict("Total"),
+        closing=_get_debit_credit_dict("Closing (Opening + Total)"),
+    )
+
+
+def get_slot_totals():
+    return GroupTotals("Opening", "Total", "Closing (Opening + Total)")
+
+
+def add_amounts(target, row):
+    target.debit += row.debit
+    target.credit += row.credit
+    target.debit_in_account_currency += row.debit_in_account_currency
+    target.credit_in_account_currency += row.credit_in_account_currency
+
+
+def measure(values, make_row, get_totals, to_report_rows):
+    """Peak memory and time of building the report rows the way
+    get_data_with_opening_closing does for "Group by Party", before and
+    after they are shaped for the report response."""
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    data = get_grouped_rows(values, make_row, get_totals)
+    pipeline_peak = tracemalloc.get_traced_memory()[1]
+
+    data = to_report_rows(data)
+
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return frappe._dict(
+        pipeline_peak_mb=pipeline_peak / (1024 * 1024),
+        peak_mb=peak / (1024 * 1024),
+        seconds=seconds,
+        rows=len(data),
+    )
+
+
+def get_grouped_rows(values, make_row, get_totals):
+    gl_entries = [make_row(COLUMNS, d) for d in values]
+
+    totals = get_totals()
+    groups = {}
+    for gle in gl_entries:
+        group = groups.get(gle.party)
+        if group is None:
+            group = groups[gle.party] = frappe._dict(totals=get_totals(), entries=[])
+
+        add_amounts(group.totals.total, gle)
+        add_amounts(group.totals.closing, gle)
+        add_amounts(totals.total, gle)
+        add_amounts(totals.closing, gle)
+        group.entries.append(gle)
+
+    data = [totals.opening]
+    for group in groups.values():
+        data.append({})
+        data.append(group.totals.opening)
+        data += group.entries
+        data.append(group.totals.total)
+        data.append(group.totals.closing)
+    data += [{}, totals.total, totals.closing]
+
+    return data
@@ -0,0 +1,92 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+"""Query budget of every report: the number of queries a report runs must
+stay within its budget and must not grow with the amount of data behind it.
+
+Enforced by the test_query_budget test of each report (QueryBudgetTestMixin),
+run with
+
+    bench --site <site> run-tests --app aqiq_reports
+
+Each report runs on the synthetic data (see synthetic_data) at two scales;
+running more queries at the larger one is how per-row and per-document
+lookups show up. Needs `allow_tests` in the site config.
+"""
+
+import frappe
+
+from aqiq_reports.aqiq_reports.utils.query_plan import capture_queries, get_report_execute
+from aqiq_reports.aqiq_reports.utils.result_cache import uncached_results
+from aqiq_reports.benchmarks import synthetic_data
+from aqiq_reports.benchmarks.report_benchmarks import get_benchmark_filters
+
+SCALES = ("1k", "2k")
+
+# from ERPNext's Company test records
+TEST_COMPANY = "_Test Company"
+
+# queries of a warm run of each report on the benchmark filters; raise a
+# budget only along with the change that needs the extra queries
+QUERY_BUDGETS = {
+    "Customer Statement Details": 30,
+    "Statement Details": 30,
+    "Net Outstanding": 5,
+    "Production Status": 3,
+    "Production Variance": 6,
+    "Withholding VAT Details": 3,
+}
+
+# company -> {report: {scale: queries}}, per test run
+_counts = {}
+
+
+class QueryBudgetTestMixin:
+    """test_query_budget for the test case of the report `report_name`."""
+
+    report_name = None
+
+    def test_query_budget(self):
+        by_scale = get_query_counts(TEST_COMPANY)[self.report_name]
+
+        self.assertFalse(grows(by_scale), "query count grows with the data: {0}".format(by_scale))
+        self.assertLessEqual(max(by_scale.values()), QUERY_BUDGETS[self.report_name])
+
+
+def get_query_counts(company, scales=SCALES, seed=0):
+    """Queries of each report per scale, {report: {scale: count}}. The data
+    is generated and measured once per company, then removed, also when a
+    run fails, since it is committed to the site's ledger."""
+    if company not in _counts:
+        counts = {}
+        try:
+            for scale in scales:
+                synthetic_data.generate(company, scale, seed)
+                for report_name, filters in get_benchmark_filters(company).items():
+                    counts.setdefault(report_name, {})[scale] = count_queries(report_name, filters)
+                    frappe.db.rollback()
+        finally:
+            frappe.db.rollback()
+            synthetic_data.clear(company)
+
+        _counts[company] = counts
+
+    return _counts[company]
+
+
+def grows(by_scale):
+    values = list(by_scale.values())
+    return any(later > earlier for earlier, later in zip(values, values[1:]))
+
+
+def count_queries(report_name, filters):
+    """Queries of a run of the report after a warm-up run, so lookups cached
+    per site or per worker (headers, metadata) are not counted."""
+    execute = get_report_execute(report_name)
+    with uncached_results():
+        execute(frappe._dict(filters))
+
+    with uncached_results(), capture_queries() as queries:
+        execute(frappe._dict(filters))
+
+    return len(queries)
@@ -0,0 +1,155 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+"""Time, query count and peak memory of every report of the app on
+synthetic data, compared against a JSON baseline.
+
+    bench --site <site> run-report-benchmarks --company "_Test Company" --scale 100k \
+        --output baseline-100k.json
+    bench --site <site> run-report-benchmarks --company "_Test Company" --scale 100k \
+        --baseline baseline-100k.json
+
+The data is written into the site's ledger (see synthetic_data), so only
+run this on a benchmark site with `allow_tests` set.
+"""
+
+import json
+import statistics
+import time
+import tracemalloc
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt
+
+from aqiq_reports.aqiq_reports.utils.query_plan import (
+    capture_queries,
+    get_report_execute,
+    get_sample_filters,
+)
+from aqiq_reports.aqiq_reports.utils.result_cache import uncached_results
+from aqiq_reports.benchmarks import synthetic_data
+
+# a time or peak memory regresses when it exceeds the baseline by more than this
+DEFAULT_TOLERANCE = 0.2
+
+# time differences below this are noise, whatever the ratio
+MIN_SECONDS = 0.05
+
+
+def run(company, scale="10k", seed=0, repeat=3, output=None, baseline=None, tolerance=DEFAULT_TOLERANCE, generate=True):
+    """Benchmark all reports at `scale` and return the results.
+
+    Regenerates the synthetic data unless `generate` is off. Writes the
+    results as JSON to `output` and compares them with the `baseline` file,
+    adding the regressions found to the results."""
+    counts = synthetic_data.get_counts(scale)
+    if cint(generate):
+        synthetic_data.generate(company, scale, cint(seed))
+
+    results = {
+        "scale": scale,
+        "seed": cint(seed),
+        "gl_rows": counts.gl_rows,
+        "environment": get_environment(),
+        "reports": {},
+    }
+    for report_name, filters in get_benchmark_filters(company).items():
+        results["reports"][report_name] = measure(report_name, filters, cint(repeat) or 1)
+        frappe.db.rollback()
+
+    if baseline:
+        with open(baseline) as f:
+            results["regressions"] = compare(results, json.load(f), flt(tolerance))
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    return results
+
+
+def get_benchmark_filters(company):
+    from_date, to_date = synthetic_data.get_statement_period()
+    filters = get_sample_filters(
+        company, from_date, to_date, "Customer", synthetic_data.get_party("Customer")
+    )
+
+    # outstanding of every party, not only the statement's
+    filters["Net Outstanding"].pop("party")
+    return filters
+
+
+def measure(report_name, filters, repeat=3):
+    """Median time of `repeat` runs, the queries of a run and its peak
+    memory. Each run starts from an empty result cache; other caches (the
+    statement header, voucher details) are warm after the first run."""
+    execute = get_report_execute(report_name)
+
+    timings = []
+    for i in range(repeat):
+        with uncached_results():
+            start = time.perf_counter()
+            result = execute(frappe._dict(filters))
+            timings.append(time.perf_counter() - start)
+
+    with uncached_results(), capture_queries() as queries:
+        execute(frappe._dict(filters))
+
+    # separate run, tracemalloc slows down the code it traces
+    with uncached_results():
+        tracemalloc.start()
+        try:
+            execute(frappe._dict(filters))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "seconds": round(statistics.median(timings), 4),
+        "min_seconds": round(min(timings), 4),
+        "queries": len(queries),
+        "peak_mb": round(peak / (1024 * 1024), 2),
+        "rows": len(result[1] or []),
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regressions of `results` against `baseline`: more queries than the
+    baseline, or time or peak memory above it by more than `tolerance`."""
+    if baseline.get("scale") != results["scale"]:
+        frappe.throw(
+            _("Baseline is for scale {0}, not {1}").format(baseline.get("scale"), results["scale"])
+        )
+
+    regressions = []
+    for report_name, result in results["reports"].items():
+        before = baseline.get("reports", {}).get(report_name)
+        if not before:
+            continue
+
+        if result["queries"] > before["queries"]:
+            regressions.append(
+                {"report": report_name, "metric": "queries", "baseline": before["queries"], "value": result["queries"]}
+            )
+
+        for metric in ("seconds", "peak_mb"):
+            limit = before[metric] * (1 + tolerance)
+            if metric == "seconds":
+                limit = max(limit, before[metric] + MIN_SECONDS)
+
+            if result[metric] > limit:
+                regressions.append(
+                    {"report": report_name, "metric": metric, "baseline": before[metric], "value": result[metric]}
+                )
+
+    return regressions
+
+
+def get_environment():
+    """Versions the numbers depend on, to tell apart baselines that are not
+    comparable."""
+    return {
+        "frappe": frappe.__version__,
+        "database": frappe.db.sql("select version()")[0][0],
+    }
@@ -0,0 +1,564 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+"""Deterministic synthetic data for the report benchmarks.
+
+Writes customers, suppliers, sales invoices (with returns), payment
+entries, purchase invoices with withholding VAT, their GL and Payment
+Ledger Entries, and work orders with job cards and manufacture stock
+entries, using bulk inserts. The same scale and seed always give the same
+rows. Every generated name starts with PREFIX so `clear` can remove them;
+masters the reports never read (items, operations, warehouses) are only
+referenced by name.
+"""
+
+import random
+from datetime import date, datetime, timedelta
+
+import frappe
+from frappe import _
+
+PREFIX = "BENCH-"
+
+# GL Entries per scale; every voucher posts two of them
+SCALES = {"1k": 1000, "2k": 2000, "10k": 10000, "100k": 100000, "1m": 1000000}
+
+START_DATE = date(2023, 1, 1)
+DAYS = 365
+CHUNK_SIZE = 10000
+
+# share of the vouchers per type, the rest are purchase invoices
+SALES_INVOICE_SHARE = 0.5
+PAYMENT_ENTRY_SHARE = 0.3
+RETURN_SHARE = 0.05
+SUPPLIER_PAYMENT_SHARE = 0.2
+WITHHOLDING_VAT_SHARE = 0.5
+WITHHOLDING_VAT_RATE = 2.0
+
+OPERATIONS = ("Cutting", "Edging", "Tempering", "Laminating", "Packing")
+MODES_OF_PAYMENT = ("Cash", "Cheque", "Bank Draft", "Wire Transfer")
+ITEMS = 50
+
+GENERATED_DOCTYPES = (
+    "GL Entry",
+    "Payment Ledger Entry",
+    "Sales Invoice",
+    "Payment Entry",
+    "Purchase Invoice",
+    "Purchase Invoice Item",
+    "Payment Schedule",
+    "Work Order",
+    "Work Order Item",
+    "Job Card",
+    "Stock Entry",
+    "Stock Entry Detail",
+    "Customer",
+    "Supplier",
+)
+
+
+def get_counts(scale):
+    if scale not in SCALES:
+        frappe.throw(_("Scale must be one of {0}").format(", ".join(SCALES)))
+
+    gl_rows = SCALES[scale]
+    return frappe._dict(
+        gl_rows=gl_rows,
+        vouchers=gl_rows // 2,
+        customers=max(gl_rows // 200, 10),
+        suppliers=max(gl_rows // 1000, 5),
+        work_orders=max(gl_rows // 100, 10),
+    )
+
+
+def get_statement_period():
+    """(from_date, to_date) of the benchmark runs: the second half of the
+    generated year, so the statements have an opening balance."""
+    return START_DATE + timedelta(days=DAYS // 2), START_DATE + timedelta(days=DAYS - 1)
+
+
+def get_party(party_type, index=0):
+    return "{0}{1}-{2:06d}".format(PREFIX, "CUST" if party_type == "Customer" else "SUPP", index)
+
+
+def generate(company, scale="10k", seed=0):
+    """Replace the synthetic data of `company` with a fresh set of `scale`.
+
+    Returns the counts of the generated data."""
+    check_allowed()
+    counts = get_counts(scale)
+    accounts = get_accounts(company)
+    rng = random.Random(seed)
+
+    clear(company)
+
+    writer = BulkWriter()
+    customers = [get_party("Customer", i) for i in range(counts.customers)]
+    suppliers = [get_party("Supplier", i) for i in range(counts.suppliers)]
+    make_parties(writer, customers, suppliers, accounts)
+    make_vouchers(writer, rng, counts, customers, suppliers, accounts)
+    make_manufacturing(writer, rng, counts, customers, accounts)
+    writer.flush()
+
+    from aqiq_reports.aqiq_reports.utils.balance_checkpoint import rebuild_checkpoints
+
+    rebuild_checkpoints(company)
+    frappe.db.commit()
+
+    return counts
+
+
+def clear(company):
+    """Remove all synthetic data and rebuild the balance checkpoints."""
+    check_allowed()
+    for doctype in GENERATED_DOCTYPES:
+        frappe.db.sql(
+            """delete from `tab{0}` where name like %s""".format(doctype), PREFIX + "%"
+        )
+
+    from aqiq_reports.aqiq_reports.utils.balance_checkpoint import rebuild_checkpoints
+
+    rebuild_checkpoints(company)
+    frappe.db.commit()
+
+
+def check_allowed():
+    # the data is written straight into the site's ledger
+    if not frappe.conf.get("allow_tests"):
+        frappe.throw(_("Benchmark data can only be written on a site with allow_tests enabled"))
+
+
+def get_accounts(company):
+    accounts = frappe.db.get_value(
+        "Company",
+        company,
+        [
+            "default_receivable_account as receivable",
+            "default_payable_account as payable",
+            "default_income_account as income",
+            "default_expense_account as expense",
+            "default_cash_account as cash",
+            "cost_center",
+            "default_currency as currency",
+        ],
+        as_dict=1,
+    )
+    if not accounts:
+        frappe.throw(_("Company {0} not found").format(company))
+
+    missing = [key for key, value in accounts.items() if not value]
+    if missing:
+        frappe.throw(
+            _("Set the default {0} of Company {1}").format(", ".join(missing), company)
+        )
+
+    accounts.company = company
+    return accounts
+
+
+class BulkWriter:
+    """Buffers rows per doctype and writes them in bulk inserts of
+    CHUNK_SIZE, committing after each one."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.rows = {}
+        self.fields = {}
+
+    def add(self, doctype, row):
+        timestamp = row.pop("timestamp", None) or datetime.combine(START_DATE, datetime.min.time())
+        row.setdefault("creation", timestamp)
+        row.setdefault("modified", timestamp)
+        row.setdefault("owner", "Administrator")
+        row.setdefault("modified_by", "Administrator")
+        row.setdefault("docstatus", 1)
+
+        rows = self.rows.setdefault(doctype, [])
+        rows.append(row)
+        if len(rows) >= self.chunk_size:
+            self.flush(doctype)
+
+    def flush(self, doctype=None):
+        for dt in [doctype] if doctype else list(self.rows):
+            rows = self.rows.pop(dt, None)
+            if not rows:
+                continue
+
+            fields = self.get_fields(dt, rows[0])
+            frappe.db.bulk_insert(dt, fields, [[row.get(f) for f in fields] for row in rows])
+            frappe.db.commit()
+
+    def get_fields(self, doctype, row):
+        # custom fields (lisec_inv_no, custom_customer, withholding VAT) only
+        # exist on some sites
+        if doctype not in self.fields:
+            self.fields[doctype] = [f for f in row if frappe.db.has_column(doctype, f)]
+        return self.fields[doctype]
+
+
+def make_parties(writer, customers, suppliers, accounts):
+    for party in customers:
+        writer.add(
+            "Customer",
+            {
+                "name": party,
+                "customer_name": party,
+                "customer_type": "Company",
+                "customer_group": "All Customer Groups",
+                "territory": "All Territories",
+                "default_currency": accounts.currency,
+                "docstatus": 0,
+            },
+        )
+
+    for party in suppliers:
+        writer.add(
+            "Supplier",
+            {
+                "name": party,
+                "supplier_name": party,
+                "supplier_type": "Company",
+                "supplier_group": "All Supplier Groups",
+                "tax_id": "P{0:09d}".format(int(party.rsplit("-", 1)[1])),
+                "default_currency": accounts.currency,
+                "docstatus": 0,
+            },
+        )
+
+
+def make_vouchers(writer, rng, counts, customers, suppliers, accounts):
+    """Sales invoices, payments and purchase invoices spread evenly over the
+    year, each with its two GL Entries and its Payment Ledger Entry."""
+    # party -> names of its invoices so far, for returns and payments
+    invoices = {}
+    gl_count = [0]
+
+    def post(voucher, posting_date, timestamp, party_type, party, party_account, other_account, amount, against=None):
+        """GL Entries of a voucher moving `amount` into the party account
+        (negative moves it out), and its Payment Ledger Entry."""
+        against_voucher_type, against_voucher = against or (voucher["doctype"], voucher["name"])
+        for account, value, is_party in ((party_account, amount, 1), (other_account, -amount, 0)):
+            gl_count[0] += 1
+            writer.add(
+                "GL Entry",
+                {
+                    "name": "{0}GLE-{1:08d}".format(PREFIX, gl_count[0]),
+                    "company": accounts.company,
+                    "posting_date": posting_date,
+                    "account": account,
+                    "party_type": party_type if is_party else None,
+                    "party": party if is_party else None,
+                    "voucher_type": voucher["doctype"],
+                    "voucher_no": voucher["name"],
+                    "against_voucher_type": against_voucher_type if is_party else None,
+                    "against_voucher": against_voucher if is_party else None,
+                    "against": other_account if is_party else party,
+                    "debit": max(value, 0),
+                    "credit": max(-value, 0),
+                    "debit_in_account_currency": max(value, 0),
+                    "credit_in_account_currency": max(-value, 0),
+                    "account_currency": accounts.currency,
+                    "cost_center": accounts.cost_center,
+                    "remarks": "Benchmark",
+                    "is_opening": "No",
+                    "is_cancelled": 0,
+                    "timestamp": timestamp,
+                },
+            )
+
+        # Payment Ledger amounts grow the outstanding, for payables as well
+        outstanding = amount if party_type == "Customer" else -amount
+        writer.add(
+            "Payment Ledger Entry",
+            {
+                "name": "{0}PLE-{1:08d}".format(PREFIX, gl_count[0]),
+                "company": accounts.company,
+                "posting_date": posting_date,
+                "account_type": "Receivable" if party_type == "Customer" else "Payable",
+                "account": party_account,
+                "party_type": party_type,
+                "party": party,
+                "voucher_type": voucher["doctype"],
+                "voucher_no": voucher["name"],
+                "against_voucher_type": against_voucher_type,
+                "against_voucher_no": against_voucher,
+                "amount": outstanding,
+                "amount_in_account_currency": outstanding,
+                "account_currency": accounts.currency,
+                "due_date": voucher.get("due_date") or posting_date,
+                "delinked": 0,
+                "timestamp": timestamp,
+            },
+        )
+
+    for i in range(counts.vouchers):
+        day = i * DAYS // counts.vouchers
+        posting_date = START_DATE + timedelta(days=day)
+        timestamp = datetime.combine(posting_date, datetime.min.time()) + timedelta(
+            seconds=i % 86400
+        )
+        name = "{0}{{0}}-{1:07d}".format(PREFIX, i)
+        amount = round(rng.uniform(100, 50000), 2)
+        kind = rng.random()
+
+        if kind < SALES_INVOICE_SHARE:
+            customer = rng.choice(customers)
+            earlier = invoices.get(customer)
+            if earlier and rng.random() < RETURN_SHARE:
+                amount = -round(amount / 10, 2)
+                against = ("Sales Invoice", rng.choice(earlier))
+            else:
+                against = None
+
+            voucher = make_sales_invoice(
+                name.format("SINV"), customer, posting_date, amount, accounts, against, i
+            )
+            writer.add("Sales Invoice", dict(voucher, timestamp=timestamp))
+            post(voucher, posting_date, timestamp, "Customer", customer, accounts.receivable, accounts.income, amount, against)
+            if not against:
+                invoices.setdefault(customer, []).append(voucher["name"])
+
+        elif kind < SALES_INVOICE_SHARE + PAYMENT_ENTRY_SHARE:
+            if rng.random() < SUPPLIER_PAYMENT_SHARE:
+                party_type, party = "Supplier", rng.choice(suppliers)
+                party_account, invoice_doctype, sign = accounts.payable, "Purchase Invoice", 1
+            else:
+                party_type, party = "Customer", rng.choice(customers)
+                party_account, invoice_doctype, sign = accounts.receivable, "Sales Invoice", -1
+
+            earlier = invoices.get(party)
+            against = (invoice_doctype, earlier[-1]) if earlier else None
+            voucher = make_payment_entry(
+                name.format("PE"), party_type, party, posting_date, amount, party_account, accounts, rng
+            )
+            writer.add("Payment Entry", dict(voucher, timestamp=timestamp))
+            post(voucher, posting_date, timestamp, party_type, party, party_account, accounts.cash, sign * amount, against)
+
+        else:
+            supplier = rng.choice(suppliers)
+            withholding = rng.random() < WITHHOLDING_VAT_SHARE
+            voucher = make_purchase_invoice(
+                writer, name.format("PINV"), supplier, posting_date, timestamp, amount, accounts, withholding, i
+            )
+            post(voucher, posting_date, timestamp, "Supplier", supplier, accounts.payable, accounts.expense, -amount)
+            invoices.setdefault(supplier, []).append(voucher["name"])
+
+
+def make_sales_invoice(name, customer, posting_date, amount, accounts, return_against, index):
+    return {
+        "doctype": "Sales Invoice",
+        "name": name,
+        "company": accounts.company,
+        "customer": customer,
+        "customer_name": customer,
+        "posting_date": posting_date,
+        "due_date": posting_date + timedelta(days=30),
+        "currency": accounts.currency,
+        "conversion_rate": 1,
+        "net_total": amount,
+        "base_net_total": amount,
+        "grand_total": amount,
+        "base_grand_total": amount,
+        "outstanding_amount": amount,
+        "debit_to": accounts.receivable,
+        "is_return": 1 if return_against else 0,
+        "return_against": return_against[1] if return_against else None,
+        "status": "Return" if return_against else "Unpaid",
+        "lisec_inv_no": "L{0:07d}".format(index),
+    }
+
+
+def make_payment_entry(name, party_type, party, posting_date, amount, party_account, accounts, rng):
+    receive = party_type == "Customer"
+    return {
+        "doctype": "Payment Entry",
+        "name": name,
+        "company": accounts.company,
+        "payment_type": "Receive" if receive else "Pay",
+        "party_type": party_type,
+        "party": party,
+        "party_name": party,
+        "posting_date": posting_date,
+        "paid_from": party_account if receive else accounts.cash,
+        "paid_to": accounts.cash if receive else party_account,
+        "paid_amount": amount,
+        "received_amount": amount,
+        "base_paid_amount": amount,
+        "base_received_amount": amount,
+        "mode_of_payment": rng.choice(MODES_OF_PAYMENT),
+        "reference_no": name.rsplit("-", 1)[1],
+        "reference_date": posting_date,
+    }
+
+
+def make_purchase_invoice(writer, name, supplier, posting_date, timestamp, amount, accounts, withholding, index):
+    due_date = posting_date + timedelta(days=30)
+    withholding_amount = round(amount * WITHHOLDING_VAT_RATE / 100, 2) if withholding else 0
+    voucher = {
+        "doctype": "Purchase Invoice",
+        "name": name,
+        "company": accounts.company,
+        "supplier": supplier,
+        "supplier_name": supplier,
+        "tax_id": "P{0:09d}".format(int(supplier.rsplit("-", 1)[1])),
+        "bill_no": "B{0:07d}".format(index),
+        "bill_date": posting_date,
+        "posting_date": posting_date,
+        "due_date": due_date,
+        "currency": accounts.currency,
+        "conversion_rate": 1,
+        "net_total": amount,
+        "base_net_total": amount,
+        "grand_total": amount,
+        "base_grand_total": amount,
+        "outstanding_amount": amount,
+        "credit_to": accounts.payable,
+        "status": "Unpaid",
+        "custom_total_withholding_vat_amount": withholding_amount,
+    }
+    writer.add("Purchase Invoice", dict(voucher, timestamp=timestamp))
+    writer.add(
+        "Purchase Invoice Item",
+        {
+            "name": name + "-1",
+            "parent": name,
+            "parenttype": "Purchase Invoice",
+            "parentfield": "items",
+            "idx": 1,
+            "item_code": "{0}ITEM-{1:03d}".format(PREFIX, index % ITEMS),
+            "item_name": "{0}ITEM-{1:03d}".format(PREFIX, index % ITEMS),
+            "qty": 1,
+            "rate": amount,
+            "amount": amount,
+            "base_amount": amount,
+            "expense_account": accounts.expense,
+            "custom_withholding_vat_percentage": WITHHOLDING_VAT_RATE if withholding else 0,
+            "timestamp": timestamp,
+        },
+    )
+    writer.add(
+        "Payment Schedule",
+        {
+            "name": name + "-PS",
+            "parent": name,
+            "parenttype": "Purchase Invoice",
+            "parentfield": "payment_schedule",
+            "idx": 1,
+            "due_date": due_date,
+            "invoice_portion": 100,
+            "payment_amount": amount,
+            "outstanding": amount,
+            "timestamp": timestamp,
+        },
+    )
+    return voucher
+
+
+def make_manufacturing(writer, rng, counts, customers, accounts):
+    """Work orders with their required items, a job card per operation and
+    a manufacture stock entry."""
+    for i in range(counts.work_orders):
+        day = i * DAYS // counts.work_orders
+        posting_date = START_DATE + timedelta(days=day)
+        timestamp = datetime.combine(posting_date, datetime.min.time()) + timedelta(seconds=i)
+        work_order = "{0}WO-{1:06d}".format(PREFIX, i)
+        production_item = "{0}FG-{1:03d}".format(PREFIX, i % ITEMS)
+        qty = rng.randint(1, 200)
+        produced_qty = rng.randint(0, qty)
+
+        writer.add(
+            "Work Order",
+            {
+                "name": work_order,
+                "company": accounts.company,
+                "production_item": production_item,
+                "item_name": production_item,
+                "qty": qty,
+                "produced_qty": produced_qty,
+                "planned_start_date": timestamp,
+                "status": "Completed" if produced_qty == qty else "In Process",
+                "custom_customer": rng.choice(customers),
+                "timestamp": timestamp,
+            },
+        )
+
+        items = rng.sample(range(ITEMS), 3)
+        for idx, item in enumerate(items, 1):
+            item_code = "{0}ITEM-{1:03d}".format(PREFIX, item)
+            required_qty = round(qty * rng.uniform(0.5, 3), 3)
+            writer.add(
+                "Work Order Item",
+                {
+                    "name": "{0}-{1}".format(work_order, idx),
+                    "parent": work_order,
+                    "parenttype": "Work Order",
+                    "parentfield": "required_items",
+                    "idx": idx,
+                    "item_code": item_code,
+                    "item_name": item_code,
+                    "required_qty": required_qty,
+                    "transferred_qty": required_qty,
+                    "consumed_qty": round(required_qty * produced_qty / qty, 3),
+                    "timestamp": timestamp,
+                },
+            )
+
+        for idx, operation in enumerate(rng.sample(OPERATIONS, 2), 1):
+            time_required = rng.randint(10, 600)
+            writer.add(
+                "Job Card",
+                {
+                    "name": "{0}JC-{1:06d}-{2}".format(PREFIX, i, idx),
+                    "company": accounts.company,
+                    "work_order": work_order,
+                    "production_item": production_item,
+                    "operation": operation,
+                    "workstation": operation,
+                    "posting_date": posting_date,
+                    "for_quantity": qty,
+                    "total_completed_qty": produced_qty,
+                    "process_loss_qty": 0,
+                    "time_required": time_required,
+                    "total_time_in_mins": round(time_required * rng.uniform(0.7, 1.5), 2),
+                    "status": "Completed" if produced_qty == qty else "Work In Progress",
+                    "timestamp": timestamp,
+                },
+            )
+
+        if not produced_qty:
+            continue
+
+        stock_entry = "{0}STE-{1:06d}".format(PREFIX, i)
+        writer.add(
+            "Stock Entry",
+            {
+                "name": stock_entry,
+                "company": accounts.company,
+                "stock_entry_type": "Manufacture",
+                "purpose": "Manufacture",
+                "work_order": work_order,
+                "fg_completed_qty": produced_qty,
+                "posting_date": posting_date,
+                "timestamp": timestamp,
+            },
+        )
+        # the consumed items, plus now and then one not on the work order
+        consumed = items + ([rng.randrange(ITEMS)] if rng.random() < 0.1 else [])
+        for idx, item in enumerate(consumed, 1):
+            item_code = "{0}ITEM-{1:03d}".format(PREFIX, item)
+            consumed_qty = round(produced_qty * rng.uniform(0.5, 3), 3)
+            writer.add(
+                "Stock Entry Detail",
+                {
+                    "name": "{0}-{1}".format(stock_entry, idx),
+                    "parent": stock_entry,
+                    "parenttype": "Stock Entry",
+                    "parentfield": "items",
+                    "idx": idx,
+                    "item_code": item_code,
+                    "item_name": item_code,
+                    "qty": consumed_qty,
+                    "transfer_qty": consumed_qty,
+                    "timestamp": timestamp,
+                },
+            )
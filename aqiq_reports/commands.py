@@ -0,0 +1,148 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import sys
+
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-party-balance-checkpoints")
+@click.option("--company", help="Only rebuild the checkpoints of this company")
+@pass_context
+def rebuild_party_balance_checkpoints(context, company=None):
+    "Recompute the Party Balance Checkpoint table from GL Entry"
+    from aqiq_reports.aqiq_reports.utils.balance_checkpoint import rebuild_checkpoints
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        rebuild_checkpoints(company)
+        frappe.db.commit()
+    finally:
+        frappe.destroy()
+
+
+@click.command("build-outstanding-snapshots")
+@click.option("--company", required=True, help="Company to snapshot")
+@click.option("--date", "dates", multiple=True, required=True, help="Snapshot date, can be repeated")
+@pass_context
+def build_outstanding_snapshots(context, company, dates):
+    "Snapshot the outstanding per open voucher as of past dates, e.g. month ends"
+    from aqiq_reports.aqiq_reports.utils.ageing import ACCOUNT_TYPES
+    from aqiq_reports.aqiq_reports.utils.outstanding_snapshot import build_snapshot
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        for snapshot_date in dates:
+            for party_type in ACCOUNT_TYPES:
+                build_snapshot(company, party_type, snapshot_date)
+            frappe.db.commit()
+    finally:
+        frappe.destroy()
+
+
+@click.command("explain-report-queries")
+@click.option("--company", required=True, help="Company to run the reports for")
+@click.option("--from-date", help="Defaults to a month before --to-date")
+@click.option("--to-date", help="Defaults to today")
+@click.option("--party-type", default="Customer", help="Party type of the statement reports")
+@click.option("--party", help="Party of the statement and outstanding reports")
+@click.option("--report", "reports", multiple=True, help="Only check this report, can be repeated")
+@click.option("--verbose", is_flag=True, help="Print every plan, not only the full scans")
+@pass_context
+def explain_report_queries(
+    context, company, from_date=None, to_date=None, party_type="Customer", party=None, reports=(), verbose=False
+):
+    "Run each report, EXPLAIN the queries it generates and flag full table scans"
+    from aqiq_reports.aqiq_reports.utils.query_plan import explain_report, get_sample_filters
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        sample_filters = get_sample_filters(company, from_date, to_date, party_type, party)
+        full_scans = 0
+        for report_name, filters in sample_filters.items():
+            if reports and report_name not in reports:
+                continue
+
+            click.secho(report_name, bold=True)
+            for result in explain_report(report_name, filters):
+                if not (result.full_scans or verbose):
+                    continue
+
+                click.echo(result.query.strip())
+                for row in result.plan:
+                    flagged = row in result.full_scans
+                    click.secho(
+                        "  {0} {1}: type={2} key={3} rows={4}".format(
+                            "FULL SCAN" if flagged else "ok",
+                            row.get("table"),
+                            row.get("type"),
+                            row.get("key"),
+                            row.get("rows"),
+                        ),
+                        fg="red" if flagged else None,
+                    )
+                full_scans += len(result.full_scans)
+            frappe.db.rollback()
+
+        click.echo("{0} full table scan(s) found".format(full_scans))
+        if full_scans:
+            sys.exit(1)
+    finally:
+        frappe.destroy()
+
+
+@click.command("run-report-benchmarks")
+@click.option("--company", required=True, help="Company to write the synthetic data for")
+@click.option("--scale", type=click.Choice(["10k", "100k", "1m"]), default="10k", help="GL Entries to generate")
+@click.option("--seed", type=int, default=0, help="Seed of the synthetic data")
+@click.option("--repeat", type=int, default=3, help="Timed runs per report")
+@click.option("--output", help="Write the results as JSON to this file")
+@click.option("--baseline", help="Compare the results with this JSON file")
+@click.option("--tolerance", type=float, default=0.2, help="Allowed time and memory growth over the baseline")
+@click.option("--skip-generate", is_flag=True, help="Reuse the synthetic data of an earlier run")
+@pass_context
+def run_report_benchmarks(
+    context, company, scale="10k", seed=0, repeat=3, output=None, baseline=None, tolerance=0.2, skip_generate=False
+):
+    "Benchmark every report on synthetic data and flag regressions against a baseline"
+    from aqiq_reports.benchmarks.report_benchmarks import run
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        results = run(
+            company, scale, seed, repeat, output, baseline, tolerance, generate=not skip_generate
+        )
+        for report_name, result in results["reports"].items():
+            click.echo(
+                "{0:30} {1:8.3f} s {2:6d} queries {3:8.1f} MB {4:8d} rows".format(
+                    report_name, result["seconds"], result["queries"], result["peak_mb"], result["rows"]
+                )
+            )
+
+        regressions = results.get("regressions") or []
+        for d in regressions:
+            click.secho(
+                "REGRESSION {report}: {metric} {baseline} -> {value}".format(**d), fg="red"
+            )
+        if regressions:
+            sys.exit(1)
+    finally:
+        frappe.destroy()
+
+
+commands = [
+    rebuild_party_balance_checkpoints,
+    build_outstanding_snapshots,
+    explain_report_queries,
+    run_report_benchmarks,
+]
@@ -130,6 +130,37 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+    "Purchase Invoice": {
+        "on_submit": "aqiq_reports.aqiq_reports.utils.bill_no.update_bill_no_cache",
+        "on_cancel": "aqiq_reports.aqiq_reports.utils.bill_no.update_bill_no_cache",
+    },
+    "Account": {
+        "after_insert": "aqiq_reports.aqiq_reports.utils.account_tree.clear_account_tree_cache",
+        "on_update": "aqiq_reports.aqiq_reports.utils.account_tree.clear_account_tree_cache",
+        "after_rename": "aqiq_reports.aqiq_reports.utils.account_tree.clear_account_tree_cache",
+        "on_trash": "aqiq_reports.aqiq_reports.utils.account_tree.clear_account_tree_cache",
+    },
+    "Letter Head": {
+        "on_update": "aqiq_reports.aqiq_reports.utils.statement_header.clear_statement_header_cache",
+        "on_trash": "aqiq_reports.aqiq_reports.utils.statement_header.clear_statement_header_cache",
+    },
+    "Company": {
+        "on_update": "aqiq_reports.aqiq_reports.utils.statement_header.clear_statement_header_cache",
+        "on_trash": "aqiq_reports.aqiq_reports.utils.statement_header.clear_statement_header_cache",
+    },
+    "Address": {
+        "on_update": "aqiq_reports.aqiq_reports.utils.statement_header.clear_statement_header_cache",
+        "on_trash": "aqiq_reports.aqiq_reports.utils.statement_header.clear_statement_header_cache",
+    },
+    "GL Entry": {
+        "on_submit": [
+            "aqiq_reports.aqiq_reports.utils.balance_checkpoint.update_balance_checkpoint",
+            "aqiq_reports.aqiq_reports.utils.result_cache.invalidate_party_results",
+        ],
+    },
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -151,6 +182,14 @@ app_license = "mit"
 # 	],
 # }
 
+# Batch Statements
+# ----------------
+# Functions each statement of a queued statement batch is handed to
+
+statement_batch_handlers = [
+    "aqiq_reports.aqiq_reports.report.customer_statement_details.batch_statement.save_statement_file",
+]
+
 # Testing
 # -------
 
@@ -223,9 +262,15 @@ app_license = "mit"
 # Automatically update python controller files with type annotations for this app.
 # export_python_type_annotations = True
 
-# default_log_clearing_doctypes = {
-# 	"Logging DocType Name": 30  # days to retain logs
-# }
+scheduler_events = {
+    "daily_long": [
+        "aqiq_reports.aqiq_reports.utils.outstanding_snapshot.take_outstanding_snapshots",
+    ],
+}
+
+default_log_clearing_doctypes = {
+    "Report Performance Log": 30  # days to retain logs
+}
 
 fixtures = [
     
@@ -0,0 +1,5 @@
+from aqiq_reports.aqiq_reports.utils.report_indexes import add_report_indexes
+
+
+def execute():
+    add_report_indexes()
@@ -0,0 +1,5 @@
+from aqiq_reports.aqiq_reports.utils.balance_checkpoint import rebuild_checkpoints
+
+
+def execute():
+    rebuild_checkpoints()
@@ -0,0 +1,58 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt, nowdate
+
+from erpnext.accounts.report.accounts_receivable_summary.accounts_receivable_summary import (
+    execute as get_receivable_summary,
+)
+
+from aqiq_reports.aqiq_reports.utils.ageing import DEFAULT_RANGES, get_party_ageing
+from aqiq_reports.tests.utils import FIXTURE_DEPENDENCIES, TEST_COMPANY, make_ledger
+
+test_dependencies = FIXTURE_DEPENDENCIES
+
+
+class TestAgeing(FrappeTestCase):
+    def setUp(self):
+        self.ledger = make_ledger("_Test AQIQ Ageing Customer")
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def test_buckets_match_receivable_summary(self):
+        party = self.ledger.party
+        ageing = get_party_ageing(
+            TEST_COMPANY,
+            "Customer",
+            [party],
+            report_date=nowdate(),
+            ageing_based_on="Posting Date",
+        )
+
+        # the filters the statement passed to the summary before it had its own ageing
+        summary_filters = {
+            "company": TEST_COMPANY,
+            "report_date": nowdate(),
+            "ageing_based_on": "Posting Date",
+            "range": ", ".join(str(days) for days in DEFAULT_RANGES),
+            "party_type": "Customer",
+            "party": [party],
+            "customer": party,
+        }
+        for i, days in enumerate(DEFAULT_RANGES):
+            summary_filters["range{0}".format(i + 1)] = days
+
+        summary = get_receivable_summary(frappe._dict(summary_filters))[1]
+        summary = [d for d in summary if d.get("party") == party]
+        self.assertEqual(len(summary), 1)
+
+        buckets = len(DEFAULT_RANGES) + 1
+        fields = ["outstanding"] + ["range{0}".format(i + 1) for i in range(buckets)]
+        self.assertEqual(
+            {field: flt(ageing[party].get(field), 2) for field in fields},
+            {field: flt(summary[0].get(field), 2) for field in fields},
+        )
+        self.assertAlmostEqual(ageing[party].outstanding, 1000 - 400 + 250 - 150)
@@ -0,0 +1,91 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, flt, get_first_day, now
+
+from aqiq_reports.aqiq_reports.report.customer_statement_details import (
+    customer_statement_details as statement,
+)
+from aqiq_reports.aqiq_reports.utils.balance_checkpoint import (
+    checkpoints_match_ledger,
+    get_gl_balances,
+    get_opening_balances,
+    rebuild_checkpoints,
+)
+from aqiq_reports.tests.utils import (
+    FIXTURE_DEPENDENCIES,
+    TEST_COMPANY,
+    get_ledger_balance,
+    get_statement_filters,
+    make_ledger,
+)
+
+test_dependencies = FIXTURE_DEPENDENCIES
+
+
+class TestBalanceCheckpoint(FrappeTestCase):
+    def setUp(self):
+        self.ledger = make_ledger("_Test AQIQ Checkpoint Customer")
+        self.filters, account_details = statement.prepare_filters(
+            get_statement_filters(self.ledger)
+        )
+        self.conditions = statement.get_conditions(self.filters)
+        self.month_start = get_first_day(self.filters.from_date)
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def get_opening(self):
+        return sum(
+            flt(d.debit) - flt(d.credit)
+            for d in get_opening_balances(self.filters, self.conditions)
+        )
+
+    def get_full_history_opening(self):
+        return sum(
+            flt(d.debit) - flt(d.credit)
+            for d in get_gl_balances(
+                self.filters, self.conditions, None, self.filters.from_date
+            ).values()
+        )
+
+    def test_opening_matches_full_history(self):
+        # kept up to date by the GL Entry on_submit hook alone
+        self.assertTrue(checkpoints_match_ledger(self.filters, self.month_start))
+        self.assertAlmostEqual(self.get_opening(), self.get_full_history_opening())
+        self.assertAlmostEqual(
+            self.get_opening(),
+            get_ledger_balance(
+                "Customer", self.ledger.party, add_days(self.ledger.from_date, -1)
+            ),
+        )
+
+    def test_change_without_hook_queues_rebuild(self):
+        frappe.db.sql(
+            """
+            update `tabGL Entry` set debit = debit + 1, modified = %s
+            where voucher_no = %s and party = %s
+            """,
+            (now(), self.ledger.invoices[0].name, self.ledger.party),
+        )
+
+        with patch("aqiq_reports.aqiq_reports.utils.balance_checkpoint.frappe.enqueue") as enqueue:
+            self.assertFalse(checkpoints_match_ledger(self.filters, self.month_start))
+            # the ledger is read instead of the stale checkpoints
+            self.assertAlmostEqual(self.get_opening(), self.get_full_history_opening())
+
+        job = enqueue.call_args.kwargs
+        self.assertEqual(
+            job["job_id"],
+            "rebuild-checkpoints::{0}::Customer::{1}".format(TEST_COMPANY, self.ledger.party),
+        )
+        self.assertTrue(job["deduplicate"])
+        self.assertEqual(job["parties"], [self.ledger.party])
+
+        rebuild_checkpoints(TEST_COMPANY, "Customer", [self.ledger.party])
+        self.assertTrue(checkpoints_match_ledger(self.filters, self.month_start))
+        self.assertAlmostEqual(self.get_opening(), self.get_full_history_opening())
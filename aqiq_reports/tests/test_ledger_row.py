@@ -0,0 +1,64 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from aqiq_reports.aqiq_reports.utils.ledger_row import (
+    GroupTotals,
+    LedgerRow,
+    LedgerTotals,
+    as_report_rows,
+)
+
+
+class TestLedgerRow(FrappeTestCase):
+    def test_reads_like_a_dict(self):
+        row = LedgerRow(voucher_no="ACC-SINV-1", debit=100.0, cost_center_dimension="Main")
+
+        self.assertEqual(row.voucher_no, "ACC-SINV-1")
+        self.assertEqual(row["debit"], 100.0)
+        self.assertEqual(row.get("cost_center_dimension"), "Main")
+        self.assertIsNone(row.credit)
+        self.assertIsNone(row.branch)
+        self.assertEqual(row.get("credit", 0.0), 0.0)
+        self.assertNotIn("credit", row)
+        with self.assertRaises(KeyError):
+            row["credit"]
+
+    def test_pop_and_copy(self):
+        row = LedgerRow(voucher_no="ACC-SINV-1", debit=100.0, branch="Nairobi")
+        copy = row.copy()
+
+        self.assertEqual(row.pop("debit"), 100.0)
+        self.assertEqual(row.pop("branch"), "Nairobi")
+        self.assertIsNone(row.debit)
+        self.assertNotIn("branch", row)
+        self.assertEqual(
+            copy.as_dict(), {"voucher_no": "ACC-SINV-1", "debit": 100.0, "branch": "Nairobi"}
+        )
+
+    def test_report_rows_keep_field_order(self):
+        rows = as_report_rows([LedgerRow(debit=1.0, posting_date="2024-01-01"), {"a": 1}])
+
+        self.assertEqual(list(rows[0]), ["posting_date", "debit"])
+        self.assertEqual(rows[0].debit, 1.0)
+        self.assertEqual(rows[1], {"a": 1})
+
+    def test_totals_add_rows(self):
+        totals = GroupTotals("Opening", "Total", "Closing")
+        for debit, credit in ((100.0, 0.0), (0.0, 40.0)):
+            totals["total"].add(
+                LedgerRow(
+                    debit=debit,
+                    credit=credit,
+                    debit_in_account_currency=debit,
+                    credit_in_account_currency=credit,
+                )
+            )
+
+        total = totals["total"]
+        self.assertIsInstance(total, LedgerTotals)
+        self.assertEqual(total.voucher_type, "'Total'")
+        self.assertEqual((total.debit, total.credit), (100.0, 40.0))
+        self.assertEqual(total.credit_in_account_currency, 40.0)
+        self.assertEqual(totals["closing"].debit, 0.0)
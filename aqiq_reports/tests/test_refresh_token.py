@@ -0,0 +1,78 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import base64
+import json
+
+from frappe.tests.utils import FrappeTestCase
+
+from aqiq_reports.aqiq_reports.utils.refresh_token import (
+    get_filters_hash,
+    make_refresh_token,
+    read_refresh_token,
+    sign,
+)
+
+FILTERS = {"company": "_Test Company", "party_type": "Customer", "party": ["B", "A"]}
+TOTAL = {"debit": 100.0, "credit": 40.0}
+CLOSING = {"debit": 150.0, "credit": 40.0}
+
+
+class TestRefreshToken(FrappeTestCase):
+    def make_token(self, filters=FILTERS):
+        return make_refresh_token(
+            get_filters_hash(filters),
+            "2024-01-01 10:00:00.000001",
+            "2024-01-01 10:00:00.000002",
+            {"GLE-1": 0, "GLE-2": 1},
+            TOTAL,
+            CLOSING,
+        )
+
+    def test_round_trip(self):
+        state = read_refresh_token(self.make_token(), get_filters_hash(FILTERS))
+
+        self.assertEqual(state.creation, "2024-01-01 10:00:00.000001")
+        self.assertEqual(state.modified, "2024-01-01 10:00:00.000002")
+        self.assertEqual(state.seen, {"GLE-1": 0, "GLE-2": 1})
+        self.assertEqual(state.total.debit, 100.0)
+        self.assertEqual(state.closing.credit, 40.0)
+
+    def test_filters_hash_ignores_presentation_and_order(self):
+        self.assertEqual(
+            get_filters_hash(dict(FILTERS, party=["A", "B"], chart_based_on="Balance")),
+            get_filters_hash(FILTERS),
+        )
+        self.assertNotEqual(
+            get_filters_hash(dict(FILTERS, party=["A"])), get_filters_hash(FILTERS)
+        )
+
+    def test_rejects_other_filters(self):
+        token = self.make_token()
+        self.assertIsNone(read_refresh_token(token, get_filters_hash(dict(FILTERS, party=["A"]))))
+
+    def test_rejects_tampered_tokens(self):
+        encoded, signature = self.make_token().rsplit(".", 1)
+        payload = json.loads(base64.urlsafe_b64decode(encoded))
+        payload["closing"]["debit"] = 0.0
+        tampered = base64.urlsafe_b64encode(json.dumps(payload, sort_keys=True).encode()).decode()
+
+        filters_hash = get_filters_hash(FILTERS)
+        self.assertIsNone(read_refresh_token(tampered + "." + signature, filters_hash))
+        self.assertIsNone(read_refresh_token("not a token", filters_hash))
+
+    def test_rejects_tokens_without_overlap_entries(self):
+        # issued before the overlap window was added to the token
+        payload = json.dumps(
+            {
+                "filters": get_filters_hash(FILTERS),
+                "creation": "2024-01-01 10:00:00",
+                "modified": "2024-01-01 10:00:00",
+                "total": TOTAL,
+                "closing": CLOSING,
+            },
+            sort_keys=True,
+        )
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode()
+        token = "{0}.{1}".format(encoded, sign(payload))
+        self.assertIsNone(read_refresh_token(token, get_filters_hash(FILTERS)))
@@ -0,0 +1,90 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days
+
+from aqiq_reports.aqiq_reports.utils.result_cache import (
+    LocalResultCache,
+    get_cached_company_result,
+    get_cached_report_result,
+)
+from aqiq_reports.aqiq_reports.utils.statement_header import clear_statement_header_cache
+from aqiq_reports.tests.utils import (
+    FIXTURE_DEPENDENCIES,
+    get_statement_filters,
+    make_invoice,
+    make_ledger,
+    make_payment,
+)
+
+test_dependencies = ["Company"] + FIXTURE_DEPENDENCIES
+
+
+class TestResultCache(FrappeTestCase):
+    def setUp(self):
+        frappe.flags.report_result_cache = LocalResultCache()
+        self.ledger = make_ledger("_Test AQIQ Cache Customer")
+        self.runs = []
+
+    def tearDown(self):
+        frappe.flags.report_result_cache = None
+        frappe.db.rollback()
+
+    def generate(self, filters):
+        self.runs.append(filters)
+        return [], [{"run": len(self.runs)}]
+
+    def test_statement_follows_party_ledger(self):
+        filters = get_statement_filters(self.ledger)
+        first = get_cached_report_result("test", filters, self.generate)
+        self.assertIs(get_cached_report_result("test", filters, self.generate), first)
+        self.assertEqual(len(self.runs), 1)
+
+        make_invoice(self.ledger.party, add_days(self.ledger.to_date, -1), 75)
+        self.assertIsNot(get_cached_report_result("test", filters, self.generate), first)
+        self.assertEqual(len(self.runs), 2)
+
+    def test_statement_follows_party_details_and_header(self):
+        filters = get_statement_filters(self.ledger)
+        first = get_cached_report_result("test", filters, self.generate)
+        self.assertIs(
+            get_cached_report_result("test", dict(filters, refresh_token="x"), self.generate),
+            first,
+        )
+
+        frappe.get_doc("Customer", self.ledger.party).save()
+        second = get_cached_report_result("test", filters, self.generate)
+        self.assertIsNot(second, first)
+
+        # another company's header leaves the statement cached
+        clear_statement_header_cache(frappe.get_doc("Company", "_Test Company 1"))
+        self.assertIs(get_cached_report_result("test", filters, self.generate), second)
+
+        clear_statement_header_cache(frappe.get_doc("Company", filters.company))
+        self.assertIsNot(get_cached_report_result("test", filters, self.generate), second)
+        self.assertEqual(len(self.runs), 3)
+
+    def test_company_result_follows_payment_ledger(self):
+        filters = frappe._dict(company=self.ledger.invoices[0].company, party_type="Customer")
+        first = get_cached_company_result("test", filters, self.generate)
+        self.assertIs(get_cached_company_result("test", filters, self.generate), first)
+
+        make_payment(self.ledger.invoices[1], self.ledger.to_date, 10)
+        self.assertIsNot(get_cached_company_result("test", filters, self.generate), first)
+        self.assertEqual(len(self.runs), 2)
+
+    def test_local_cache_evicts_least_recently_used(self):
+        cache = LocalResultCache(max_entries=2)
+        cache.set("a", 1, ["tag"])
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+
+        cache.invalidate("tag")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), 3)
@@ -0,0 +1,150 @@
+# Copyright (c) 2024, RONOH and contributors
+# For license information, please see license.txt
+
+"""Small ledgers for the result tests, made of real submitted Sales
+Invoices and Payment Entries on ERPNext's test records. Nothing is
+committed: FrappeTestCase rolls the documents back after each class."""
+
+import frappe
+from frappe.utils import add_days, add_months, flt, get_first_day, get_last_day, nowdate
+
+from erpnext.accounts.doctype.payment_entry.payment_entry import get_payment_entry
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+
+TEST_COMPANY = "_Test Company"
+TEST_CASH_ACCOUNT = "_Test Cash - _TC"
+TEST_RECEIVABLE_ACCOUNT = "Debtors - _TC"
+TEST_COST_CENTERS = ("_Test Cost Center - _TC", "_Test Cost Center 2 - _TC")
+
+# test records the fixtures link to, for the test_dependencies of the tests
+FIXTURE_DEPENDENCIES = ["Customer", "Item", "Cost Center"]
+
+
+def make_customer(customer_name):
+    if not frappe.db.exists("Customer", customer_name):
+        frappe.get_doc(
+            {
+                "doctype": "Customer",
+                "customer_name": customer_name,
+                "customer_group": "_Test Customer Group",
+                "territory": "_Test Territory",
+            }
+        ).insert()
+
+    return customer_name
+
+
+def make_invoice(customer, posting_date, amount):
+    return create_sales_invoice(
+        company=TEST_COMPANY, customer=customer, posting_date=posting_date, qty=1, rate=amount
+    )
+
+
+def make_payment(invoice, posting_date, amount):
+    payment = get_payment_entry(
+        "Sales Invoice", invoice.name, party_amount=amount, bank_account=TEST_CASH_ACCOUNT
+    )
+    payment.posting_date = posting_date
+    payment.reference_no = invoice.name
+    payment.reference_date = posting_date
+    payment.insert()
+    payment.submit()
+    return payment
+
+
+def make_split_receipt(party, posting_date, allocations):
+    """A Journal Entry receiving (invoice, amount) pairs on separate lines of
+    the receivable account, one cost center each, so the statement has to
+    consolidate its GL Entries."""
+    accounts = [
+        {
+            "account": TEST_RECEIVABLE_ACCOUNT,
+            "party_type": "Customer",
+            "party": party,
+            "credit_in_account_currency": amount,
+            "reference_type": "Sales Invoice",
+            "reference_name": invoice.name,
+            "cost_center": TEST_COST_CENTERS[i % len(TEST_COST_CENTERS)],
+        }
+        for i, (invoice, amount) in enumerate(allocations)
+    ]
+    accounts.append(
+        {
+            "account": TEST_CASH_ACCOUNT,
+            "debit_in_account_currency": sum(amount for invoice, amount in allocations),
+            "cost_center": TEST_COST_CENTERS[0],
+        }
+    )
+
+    receipt = frappe.get_doc(
+        {
+            "doctype": "Journal Entry",
+            "voucher_type": "Journal Entry",
+            "company": TEST_COMPANY,
+            "posting_date": posting_date,
+            "accounts": accounts,
+        }
+    )
+    receipt.insert()
+    receipt.submit()
+    return receipt
+
+
+def make_ledger(customer_name):
+    """A customer with an invoice before the statement period; a payment, a
+    second invoice and a receipt split over both invoices inside it. Returns
+    _dict(party, from_date, to_date, invoices, payment, receipt)."""
+    party = make_customer(customer_name)
+    first_month = get_first_day(add_months(nowdate(), -3))
+    from_date = add_months(first_month, 1)
+    to_date = get_last_day(add_months(first_month, 2))
+
+    invoice = make_invoice(party, add_days(first_month, 9), 1000)
+    payment = make_payment(invoice, add_days(from_date, 14), 400)
+    second_invoice = make_invoice(party, add_days(to_date, -20), 250)
+    receipt = make_split_receipt(
+        party, add_days(to_date, -10), [(invoice, 100), (second_invoice, 50)]
+    )
+
+    return frappe._dict(
+        party=party,
+        from_date=from_date,
+        to_date=to_date,
+        invoices=[invoice, second_invoice],
+        payment=payment,
+        receipt=receipt,
+    )
+
+
+def get_ledger_balance(party_type, party, to_date, from_date=None):
+    """debit - credit of the party's submitted GL Entries, straight from the
+    ledger."""
+    conditions = "and posting_date >= %(from_date)s" if from_date else ""
+    return flt(
+        frappe.db.sql(
+            """
+            select sum(debit - credit) from `tabGL Entry`
+            where company = %(company)s and party_type = %(party_type)s and party = %(party)s
+                and is_cancelled = 0 and posting_date <= %(to_date)s {conditions}
+            """.format(conditions=conditions),
+            {
+                "company": TEST_COMPANY,
+                "party_type": party_type,
+                "party": party,
+                "from_date": from_date,
+                "to_date": to_date,
+            },
+        )[0][0]
+    )
+
+
+def get_statement_filters(ledger, **kwargs):
+    return frappe._dict(
+        company=TEST_COMPANY,
+        from_date=ledger.from_date,
+        to_date=ledger.to_date,
+        party_type="Customer",
+        party=[ledger.party],
+        group_by="Group by Voucher (Consolidated)",
+        **kwargs
+    )